@@ -0,0 +1,122 @@
+#coding=utf-8
+##@package anem_api
+# @brief in-memory assembly for other Python tools
+# @since 10/17/2026
+#
+# assembleSource runs the stages of assembler.py (Clean, optional Schedule,
+# Index, Relax, Assemble, optional hazard analysis) on source text. It
+# returns the encoded words, the symbol table and the messages as objects.
+# Nothing is printed and nothing is written unless AsmProgram.Write is
+# called. Errors raise AsmError instead of exiting.
+#
+#     from anem_api import assembleSource
+#     program = assembleSource("LIU $1, 0x12\nLIL $1, 0x34\nHAB\nNOP\n")
+#     program.Image()     # {0: 0x4112, 1: 0x5134, 2: 0xf000, 3: 0x0002}
+
+from array import array
+
+from assembler import Assembler, OutputFormats
+from anem_msg import *
+
+##Outputs AsmProgram.Write can produce: name -> (extension, writer)
+ApiOutputs = { "clean" : (".clean", Assembler.WriteClean),
+               "ind" : (".ind", Assembler.WriteIndex),
+               "bin" : (".bin", Assembler.WriteBin),
+               "sym" : (".sym", Assembler.WriteSymbols),
+               "contents" : (".contents.txt", Assembler.WriteContents)
+               }
+ApiOutputs.update((name, (ext, writer)) for name, (ext, writer, desc) in OutputFormats.items())
+
+##Outputs written by assembler.py
+ApiDefaultOutputs = ("clean", "ind", "bin", "sym", "contents")
+
+##Assembly result
+class AsmProgram:
+
+    ##@param asm Assembler after the last stage that ran
+    #@param schedule SchedReport or None
+    #@param relax RelaxReport or None
+    #@param hazards HazardReport or None
+    def __init__(self, asm, schedule=None, relax=None, hazards=None):
+
+        self.asm = asm
+        ##addresses and encoded words, parallel array('H')
+        self.addr = asm.binAddr
+        self.words = asm.binWords
+        ##label and constant values
+        self.labels = asm.labels
+        ##Instr list, after relaxation
+        self.code = asm.code
+        ##CleanLine list, after scheduling
+        self.clean = asm.CleanOut
+        ##AsmDiagnostic list
+        self.diagnostics = asm.Diagnostics
+        self.errors = asm.AsmErrorCount
+        self.warnings = asm.AsmWarnCount
+        self.schedule = schedule
+        self.relax = relax
+        self.hazards = hazards
+
+    ##@return dictionary address -> word, later words at the same address win
+    def Image(self):
+        return dict(zip(self.addr, self.words))
+
+    ##Write output files
+    #@param fileName output base name
+    #@param outputs names from ApiOutputs, or "haz" for the hazard report
+    def Write(self, fileName, outputs=ApiDefaultOutputs):
+
+        for name in outputs:
+            if name == "haz":
+                if self.hazards == None:
+                    self.hazards = self.asm.Hazards()
+                with open(fileName+".haz","w") as outFile:
+                    outFile.write(self.hazards.Report()+'\n')
+                continue
+            ext, writer = ApiOutputs[name]
+            writer(self.asm, fileName+ext)
+
+##Assemble source text in memory
+#@param source source text, or an iterable of lines
+#@param schedule reorder instructions and drop NOPs to avoid stalls (anem_sched)
+#@param hazards run the static hazard analysis (anem_hazard)
+#@param verbosity info (2) and debug (3) messages are collected from this level,
+#errors and warnings always are
+#@param check raise AsmError when there are errors; if False the partial
+#program is returned and errors are only in its diagnostics
+#@return AsmProgram
+def assembleSource(source, schedule=False, hazards=False, verbosity=1, check=True):
+
+    asm = Assembler()
+    asm.Verbosity = verbosity
+    asm.Diagnostics = []
+    asm.CleanOut = []
+    asm.labels = {}
+    asm.code = []
+    asm.binAddr = array('H')
+    asm.binWords = array('H')
+    if isinstance(source, str):
+        source = source.splitlines()
+
+    reports = [None, None, None]
+    try:
+        asm.Clean(source)
+        if schedule:
+            reports[0] = asm.Schedule()
+        asm.Index()
+        reports[1] = asm.Relax()
+        #trampolines could not be placed, the jumps would not encode
+        if not reports[1].errors:
+            asm.Assemble()
+            if hazards:
+                reports[2] = asm.Hazards()
+    except AsmError as e:
+        e.program = AsmProgram(asm, *reports)
+        raise
+
+    program = AsmProgram(asm, *reports)
+    if check and asm.AsmErrorCount:
+        errors = [d for d in asm.Diagnostics if d.IsError()]
+        raise AsmError("%d error(s), first: %s" % (len(errors), errors[0]), asm.Diagnostics, program)
+
+    return program
@@ -0,0 +1,180 @@
+#coding=utf-8
+##@package anem_cache
+# @brief on-disk cache for incremental assembly
+# @since 10/17/2026
+#
+# A program whose source, options and assembler version did not change since
+# the last run is skipped entirely. Otherwise the source is split in chunks of
+# about ChunkLines lines and the Clean/Index results of unchanged chunks are reused.
+
+import glob
+import hashlib
+import json
+import os
+import pickle
+import zlib
+
+from anem_records import *
+
+##Average source lines per cached chunk
+ChunkLines = 128
+
+##Maximum source lines per cached chunk
+ChunkMaxLines = 1024
+
+##Split source in chunks
+#
+#Boundaries depend on line contents only, so inserting or deleting lines
+#only changes the chunks around the edit.
+#@return list of (line number before the chunk, chunk lines)
+def makeChunks(lines):
+
+    chunks = []
+    base = 0
+    for n, line in enumerate(lines):
+        if n + 1 - base >= ChunkMaxLines or zlib.crc32(line.encode()) % ChunkLines == 0:
+            chunks.append((base, lines[base:n+1]))
+            base = n + 1
+
+    if base < len(lines):
+        chunks.append((base, lines[base:]))
+
+    return chunks
+
+##Assembler version: hash of the assembler sources, any change invalidates the cache
+def makeAsmVersion():
+
+    h = hashlib.sha256()
+    path = os.path.dirname(os.path.abspath(__file__))
+    for fname in sorted(glob.glob(os.path.join(path, "*.py"))):
+        with open(fname, "rb") as f:
+            h.update(f.read())
+
+    return h.hexdigest()
+
+AsmVersion = makeAsmVersion()
+
+##Hash file contents
+#@return hex digest or None if file does not exist
+def hashFile(filename):
+
+    try:
+        with open(filename, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+class AsmCache:
+
+    ##@param path cache directory
+    #@param fileName program base name
+    #@param options list of option strings that change the outputs
+    def __init__(self, path, fileName, options=()):
+
+        os.makedirs(path, exist_ok=True)
+
+        self.fileName = fileName
+        name = hashlib.sha256(os.path.abspath(fileName).encode()).hexdigest()[:32]
+        self.manifestFile = os.path.join(path, name + ".json")
+        self.chunkFile = os.path.join(path, name + ".chunks")
+        self.options = list(options)
+        self.key = None
+        self.chunks = {}
+        self.newChunks = {}
+
+    ##Compute program key and check if outputs are up to date
+    #@param lines source lines
+    #@return True when the program can be skipped
+    def UpToDate(self, lines):
+
+        h = hashlib.sha256(AsmVersion.encode())
+        h.update(json.dumps(self.options).encode())
+        h.update("".join(lines).encode())
+        self.key = h.hexdigest()
+
+        try:
+            with open(self.manifestFile) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if manifest.get("key") != self.key:
+            return False
+
+        for ext, digest in manifest["outputs"].items():
+            if hashFile(self.fileName + ext) != digest:
+                return False
+
+        return True
+
+    ##Load chunks from the last run of this program
+    def Load(self):
+
+        try:
+            with open(self.chunkFile, "rb") as f:
+                chunks = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            return
+
+        if chunks.get("version") == AsmVersion:
+            self.chunks = chunks["chunks"]
+
+    ##Clean and index a program reusing unchanged chunks
+    #@param asm Assembler instance
+    #@param lines source lines
+    def CleanIndex(self, asm, lines):
+
+        asm.CleanOut = []
+        asm.labels = {}
+        asm.code = []
+        self.newChunks = {}
+        index = 0
+
+        for base, chunk in makeChunks(lines):
+            key = hashlib.sha1("".join(chunk).encode()).hexdigest()
+            errors = asm.AsmErrorCount + asm.AsmWarnCount
+
+            #clean results are stored with line numbers relative to the chunk
+            entry = self.chunks.get(key)
+            if entry != None:
+                clean = [CleanLine(base + n, line) for n,line in entry[0]]
+                asm.CleanOut.extend(clean)
+            else:
+                start = len(asm.CleanOut)
+                asm.CleanLines(chunk, base)
+                clean = asm.CleanOut[start:]
+                entry = ([(c.nline - base, c.line) for c in clean], None, None)
+
+            #index results are only valid for the same starting address
+            if entry[1] == index:
+                code, labels, end = entry[2]
+                asm.code.extend([Instr(i, base + n, line) for i,n,line in code])
+                asm.labels.update(labels)
+            else:
+                start = len(asm.code)
+                labels = asm.labels
+                asm.labels = {}
+                end = asm.IndexLines(clean, index)
+                code = [(c.index, c.nline - base, c.line) for c in asm.code[start:]]
+                labels.update(asm.labels)
+                entry = (entry[0], index, (code, list(asm.labels.items()), end))
+                asm.labels = labels
+
+            #chunks that produced messages are redone so they are reported again
+            if asm.AsmErrorCount + asm.AsmWarnCount == errors:
+                self.newChunks[key] = entry
+
+            index = end
+
+    ##Save chunks and manifest after a successful run
+    #@param outputs list of output file extensions written
+    def Save(self, outputs):
+
+        with open(self.chunkFile, "wb") as f:
+            pickle.dump({"version" : AsmVersion, "chunks" : self.newChunks}, f)
+
+        manifest = { "key" : self.key,
+                     "outputs" : dict((ext, hashFile(self.fileName + ext)) for ext in outputs)
+                     }
+        with open(self.manifestFile, "w") as f:
+            json.dump(manifest, f)
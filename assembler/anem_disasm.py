@@ -0,0 +1,324 @@
+#coding=utf-8
+##@package anem_disasm
+# @brief bulk disassembler for program images
+# @since 10/17/2026
+#
+# Images are loaded into a NumPy uint16 array. Fields and mnemonics are
+# decoded for all words at once with shifts, masks and lookup tables built
+# from anem_opcodes, and text is only rendered for the ranges asked for.
+# The mnemonic and jump offset of each of the 65536 words are decoded once
+# at import, so an image costs one table lookup per word for each.
+#
+# Offsets of J, JAL, BZ and BHLEQ are written as the raw 12-bit field,
+# which the assembler encodes as is, and the target address follows as a
+# comment. The source form (-a) starts each run of addresses with .ADDRESS,
+# so assembling it gives the same .contents.txt. Words that no instruction
+# encodes to are written as comments and do not round-trip.
+#
+# A .bin file holds no addresses, its words are numbered from 0. Programs
+# placed with .ADDRESS get wrong addresses and jump targets from it; their
+# .contents.txt or .mem keeps the addresses.
+
+import argparse
+import sys
+
+import numpy as np
+
+from anem_opcodes import *
+
+##Mnemonic of words that no instruction encodes to
+DisInvalid = "?"
+
+##Mnemonics, by id
+DisMnemonics = [DisInvalid, "HAB"] + sorted(set(list(ANEMFuncR.keys()) + list(ANEMFuncS.keys()) +
+                                                 list(ANEMOpcodeL.keys()) + list(ANEMOpcodeJ.keys()) +
+                                                 list(ANEMOpcodeW.keys()) + list(ANEMFuncM1.keys()) +
+                                                 list(ANEMFuncM3.keys()) + list(ANEMFuncSTK.keys()) +
+                                                 list(ANEMSubM4.keys()) + ["ADDI", "SYSCALL"]))
+DisId = dict((name, n) for n, name in enumerate(DisMnemonics))
+
+##Operand format of each mnemonic:
+# rr $a, $b; li $a, imm8; w $a, c($b); j offset; bz offset,pred; ra $a;
+# rc $c; u8 imm8; s8 signed imm8; addi $a, signed imm8; none
+DisFormats = dict([(name, "rr") for name in list(ANEMFuncR.keys()) + list(ANEMFuncS.keys())] +
+                  [(name, "li") for name in ANEMOpcodeL.keys()] +
+                  [("SW", "w"), ("LW", "w"), ("JR", "ra"), ("J", "j"), ("JAL", "j"), ("BHLEQ", "j"), ("BZ", "bz")] +
+                  [(name, "u8") for name in ("LHL", "LHH", "LLL", "LLH")] +
+                  [(name, "s8") for name in ("AIS", "AIH", "AIL")] +
+                  [(name, "rc") for name in ANEMFuncM3.keys()] +
+                  [(name, "ra") for name in ANEMFuncSTK.keys()] +
+                  [("ADDI", "addi"), ("SYSCALL", "u8"), ("RETI", "none"), ("EI", "none"), ("DI", "none"),
+                   ("MFEPC", "rc"), ("MFECA", "rc"), ("MTEPC", "rc"), ("HAB", "none"), (DisInvalid, "none")])
+
+##Bits that must be 0 in each mnemonic, other encodings are not produced by the assembler
+DisZeroBits = { "JR" : 0x00FF, "RETI" : 0x000F, "EI" : 0x000F, "DI" : 0x000F }
+DisZeroBits.update((name, 0x00F0) for name in list(ANEMFuncSTK.keys()) + list(ANEMFuncM3.keys()))
+
+##BZ predicate names
+DisPredicates = dict((value, name) for name, value in ANEMPredBZ.items())
+
+##Lookup table of 16 entries
+#@param pairs (nibble, mnemonic)
+#@return uint8 array of mnemonic ids, DisInvalid elsewhere
+def makeTable(pairs):
+
+    table = np.zeros(16, dtype=np.uint8)
+    for nibble, name in pairs:
+        table[nibble] = DisId[name]
+    return table
+
+##Mnemonic by opcode, 0 for the opcodes decoded by function
+DisOpTable = makeTable([(value, name) for name, value in ANEMOpcodeL.items()] +
+                       [(value, name) for name, value in ANEMOpcodeW.items()] +
+                       [(value, name) for name, value in ANEMOpcodeJ.items() if name != 'BZ'] +
+                       [((ANEMOpcodeJ['BZ'] << 2) | pred, 'BZ') for pred in ANEMPredBZ.values()] +
+                       [(ANEMOpcodeADDI, "ADDI")])
+DisRTable = makeTable([(value, name) for name, value in ANEMFuncR.items()])
+DisSTable = makeTable([(value, name) for name, value in ANEMFuncS.items()])
+DisSTKTable = makeTable([(value, name) for name, value in ANEMFuncSTK.items()])
+DisM1Table = makeTable([(value, name) for name, value in list(ANEMFuncM1.items()) + list(ANEMFuncM3.items())] +
+                       [(ANEMFuncSYSCALL, "SYSCALL")])
+DisM4Table = makeTable([(value, name) for name, value in ANEMSubM4.items()])
+DisZeroTable = np.array([DisZeroBits.get(name, 0) for name in DisMnemonics], dtype=np.uint16)
+
+##Offset base of relative jumps
+DisJumpBase = { "J" : 1, "JAL" : 1, "BHLEQ" : 2, "BZ" : 2 }
+
+##Decode mnemonics
+#@param w uint16 words
+#@return uint8 mnemonic ids
+def decodeIds(w):
+
+    op = w >> 12
+    a = (w >> 8) & 0xF
+    b = (w >> 4) & 0xF
+    c = w & 0xF
+
+    ids = DisOpTable[op]
+    ids = np.where(op == ANEMOpcodeR, DisRTable[c], ids)
+    ids = np.where(op == ANEMOpcodeS, DisSTable[c], ids)
+    ids = np.where(op == ANEMOpcodeSTK, DisSTKTable[c], ids)
+    m1 = np.where(a == ANEMFuncM4, DisM4Table[b], DisM1Table[a])
+    ids = np.where(op == ANEMOpcodeM1, m1, ids)
+    ids = np.where(w == ANEMOpcodeJ['J'] << 12, DisId["HAB"], ids)
+
+    return np.where(w & DisZeroTable[ids], DisId[DisInvalid], ids).astype(np.uint8)
+
+##Jump offsets
+#@param w uint16 words
+#@param ids mnemonic ids of w
+#@return int32 target - address of J/JAL/BZ/BHLEQ, 0 for other instructions
+def decodeDeltas(w, ids):
+
+    offset = (w & 0xFFF).astype(np.int32)
+    base = np.zeros(len(DisMnemonics), dtype=np.int32)
+    for name, value in DisJumpBase.items():
+        base[DisId[name]] = value
+    jbase = base[ids]
+
+    return np.where(jbase != 0, jbase + offset - ((offset & 0x800) << 1), 0)
+
+##Mnemonic id and jump offset of every word, images are decoded with one lookup each
+DisIdTable = decodeIds(np.arange(0x10000, dtype=np.uint16))
+DisDeltaTable = decodeDeltas(np.arange(0x10000, dtype=np.uint16), DisIdTable).astype(np.int16)
+DisJumps = np.isin(np.arange(len(DisMnemonics)), [DisId[name] for name in DisJumpBase.keys()])
+
+##Read a program image
+#@param fileName .contents.txt (address word), .bin (one word per line,
+#numbered from 0 whatever the program's .ADDRESS), .mem (@addr and hex words)
+#or raw big-endian image
+#@return (addresses, words) as uint16 arrays
+def loadImage(fileName):
+
+    with open(fileName, "rb") as f:
+        data = f.read()
+
+    if fileName.endswith((".contents.txt", ".bin")):
+        #fixed width lines of '0'/'1', unpacked as a character matrix
+        width = 34 if fileName.endswith(".contents.txt") else 17
+        chars = np.frombuffer(data, dtype=np.uint8)
+        if len(chars) % width == 0 and (len(chars) == 0 or np.all(chars[width-1::width] == ord('\n'))):
+            chars = chars.reshape(-1, width)
+            def column(start):
+                return np.packbits(chars[:, start:start+16] == ord('1'), axis=1).view('>u2').ravel().astype(np.uint16)
+            if width == 34:
+                return (column(0), column(17))
+            return (np.arange(len(chars), dtype=np.uint16), column(0))
+
+        #other line endings
+        lines = [line.split() for line in data.decode().splitlines() if line.strip()]
+        if width == 34:
+            return (np.array([int(line[0], 2) for line in lines], dtype=np.uint16),
+                    np.array([int(line[1], 2) for line in lines], dtype=np.uint16))
+        return (np.arange(len(lines), dtype=np.uint16), np.array([int(line[0], 2) for line in lines], dtype=np.uint16))
+
+    if fileName.endswith(".mem"):
+        addrs = []
+        words = []
+        addr = 0
+        for field in data.decode().split():
+            if field.startswith('@'):
+                addr = int(field[1:], 16)
+            else:
+                addrs.append(addr)
+                words.append(int(field, 16))
+                addr += 1
+        return (np.array(addrs, dtype=np.uint16), np.array(words, dtype=np.uint16))
+
+    words = np.frombuffer(data[:len(data) & ~1], dtype='>u2').astype(np.uint16)
+    return (np.arange(len(words), dtype=np.uint16), words)
+
+##Decoded image
+class Disassembly:
+
+    ##Decode all words
+    #@param addrs uint16 addresses
+    #@param words uint16 words
+    def __init__(self, addrs, words):
+
+        w = np.asarray(words, dtype=np.uint16)
+        self.addrs = np.asarray(addrs, dtype=np.uint16)
+        self.words = w
+
+        ##fields
+        self.op = (w >> 12).astype(np.uint8)
+        self.a = ((w >> 8) & 0xF).astype(np.uint8)
+        self.b = ((w >> 4).astype(np.uint8) & 0xF)
+        self.c = (w & 0xF).astype(np.uint8)
+        self.imm = w.astype(np.uint8)
+        self.offset = w & 0xFFF
+
+        ##mnemonic ids, index DisMnemonics
+        self.ids = DisIdTable[w]
+
+        ##jump and branch targets, -1 for other instructions
+        self.targets = np.where(DisJumps[self.ids], (self.addrs + DisDeltaTable[w].astype(np.int32)) & 0xFFFF,
+                                np.int32(-1))
+
+        self.sorted = bool(np.all(self.addrs[1:] > self.addrs[:-1]))
+
+    def __len__(self):
+        return len(self.words)
+
+    ##Mnemonic counts
+    #@return dictionary mnemonic -> count, mnemonics that appear only
+    def Counts(self):
+
+        counts = np.bincount(self.ids, minlength=len(DisMnemonics))
+        return dict((DisMnemonics[n], int(count)) for n, count in enumerate(counts) if count)
+
+    ##Positions of a range of addresses
+    #@param start first address
+    #@param end address after the last, None for the end of the image
+    #@return positions in address order
+    def Positions(self, start=0, end=None):
+
+        end = 0x10000 if end == None else end
+        if self.sorted:
+            first, last = np.searchsorted(self.addrs, [start, end])
+            return range(int(first), int(last))
+
+        #later words at the same address win, as in progmem
+        order = np.argsort(self.addrs, kind="stable")
+        keep = np.append(self.addrs[order][1:] != self.addrs[order][:-1], True)
+        order = order[keep]
+        addrs = self.addrs[order]
+        return [int(n) for n in order[(addrs >= start) & (addrs < end)]]
+
+    ##Source text of one word
+    #@param n position
+    #@return instruction text, the assembler accepts it unless the word is invalid
+    def Text(self, n):
+
+        name = DisMnemonics[self.ids[n]]
+        fmt = DisFormats[name]
+        a, b, c, imm = int(self.a[n]), int(self.b[n]), int(self.c[n]), int(self.imm[n])
+        if fmt == "rr":
+            return "%s $%d, $%d" % (name, a, b)
+        if fmt == "li":
+            return "%s $%d, 0x%02X" % (name, a, imm)
+        if fmt == "w":
+            return "%s $%d, %d($%d)" % (name, a, c, b)
+        if fmt == "j":
+            return "%s %d" % (name, int(self.offset[n]))
+        if fmt == "bz":
+            return "BZ %d,%s" % (int(self.offset[n]), DisPredicates[int(self.op[n]) & 0x3])
+        if fmt == "ra":
+            return "%s $%d" % (name, a)
+        if fmt == "rc":
+            return "%s $%d" % (name, c)
+        if fmt == "u8":
+            return "%s %d" % (name, imm)
+        if fmt == "s8":
+            return "%s %d" % (name, imm - 0x100 if imm & 0x80 else imm)
+        if fmt == "addi":
+            return "ADDI $%d, %d" % (a, imm - 0x100 if imm & 0x80 else imm)
+        if name == DisInvalid:
+            return "-- invalid 0x%04X" % int(self.words[n])
+        return name
+
+    ##Listing of a range: address, word, instruction and jump target
+    #@return list of lines
+    def Listing(self, start=0, end=None):
+
+        out = []
+        for n in self.Positions(start, end):
+            line = "%04x  %04x  %s" % (int(self.addrs[n]), int(self.words[n]), self.Text(n))
+            if self.targets[n] >= 0:
+                line = "%-36s -- 0x%04x" % (line, int(self.targets[n]))
+            out.append(line)
+
+        return out
+
+    ##Source of a range, assembles back to the same words
+    #@return list of lines
+    def Source(self, start=0, end=None):
+
+        out = []
+        next = None
+        for n in self.Positions(start, end):
+            addr = int(self.addrs[n])
+            if addr != next:
+                out.append(".ADDRESS 0x%04X" % addr)
+            line = self.Text(n)
+            if self.targets[n] >= 0:
+                line = "%-24s -- 0x%04x" % (line, int(self.targets[n]))
+            out.append(line)
+            #invalid words are comments, the next word needs its address
+            next = addr + 1 if self.ids[n] != DisId[DisInvalid] else None
+
+        return out
+
+##Disassemble an image file
+#@return Disassembly
+def disassembleFile(fileName):
+    return Disassembly(*loadImage(fileName))
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="ANEM16 disassembler")
+    parser.add_argument("image", help=".contents.txt, .bin, .mem or raw big-endian image")
+    parser.add_argument("-s", "--start", type=lambda x: int(x, 0), default=0, help="first address")
+    parser.add_argument("-e", "--end", type=lambda x: int(x, 0), default=None, help="address after the last")
+    parser.add_argument("-a", "--asm", action="store_true", help="write source that assembles to the same image")
+    parser.add_argument("-c", "--counts", action="store_true", help="only print mnemonic counts")
+    parser.add_argument("-o", "--output", default=None, help="output file (default stdout)")
+    args = parser.parse_args()
+
+    if args.image.endswith(".bin"):
+        sys.stderr.write("%s: .bin has no addresses, words are numbered from 0; "
+                         "use .contents.txt or .mem for programs with .ADDRESS\n" % args.image)
+
+    dis = disassembleFile(args.image)
+    if args.counts:
+        counts = dis.Counts()
+        lines = ["%-8s %d" % (name, counts[name]) for name in sorted(counts, key=lambda x: -counts[x])]
+    elif args.asm:
+        lines = dis.Source(args.start, args.end)
+    else:
+        lines = dis.Listing(args.start, args.end)
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    out.write("".join(line + "\n" for line in lines))
+    if args.output:
+        out.close()
@@ -0,0 +1,186 @@
+#coding=utf-8
+##@package anem_hazard
+# @brief static pipeline hazard analysis of assembled programs
+# @since 10/17/2026
+#
+# Walks the indexed instructions in address order and runs the stall rules of
+# the timing model (anem_timing) on them, without executing anything. Every
+# instruction is checked once after the instruction before it (fall-through)
+# and once more for every J/JAL/BZ/BHLEQ that jumps to it, with that jump and
+# its delay slot ahead in the pipeline. Paths reached through JR, RETI,
+# SYSCALL or after a change of address start with an empty pipeline.
+
+from anem_opcodes import *
+from anem_sim import sext12
+from anem_timing import HazardInfo, StallTypes, stallCycles
+
+##Encoding of NOP (ADD $0,$0)
+HazNOP = (ANEMOpcodeR << 12) | ANEMFuncR['ADD']
+
+##Instructions checked after entering a block from a jump
+HazEdgeDepth = 3
+
+##Control transfer of an instruction word
+#@return (kind, static target or None); kind is None, "jump" (J, JAL, JR,
+#RETI, SYSCALL, always taken) or "branch" (BZ, BHLEQ)
+def controlTransfer(addr, word):
+
+    opcode = word >> 12
+    if opcode in (ANEMOpcodeJ['J'], ANEMOpcodeJ['JAL']):
+        return ("jump", (addr + 1 + sext12(word & 0xFFF)) & 0xFFFF)
+    if opcode == ANEMOpcodeJ['BHLEQ'] or ((word >> 14) == ANEMOpcodeJ['BZ'] and opcode != ANEMOpcodeADDI):
+        return ("branch", (addr + 2 + sext12(word & 0xFFF)) & 0xFFFF)
+    if opcode == ANEMOpcodeW['JR']:
+        return ("jump", None)
+    if opcode == ANEMOpcodeM1:
+        m1op = (word >> 8) & 0xF
+        if m1op == ANEMFuncSYSCALL:
+            return ("jump", None)
+        if m1op == ANEMFuncM4 and (word >> 4) & 0xF == ANEMSubM4['RETI']:
+            return ("jump", None)
+
+    return (None, None)
+
+##Stall site
+class HazardSite:
+
+    __slots__ = ('addr', 'nline', 'line', 'stalls', 'source')
+
+    ##@param addr instruction address
+    #@param nline source line number
+    #@param line instruction text
+    #@param stalls stall type of every stall cycle
+    #@param source address of the jump the path comes from, None for fall-through
+    def __init__(self, addr, nline, line, stalls, source=None):
+        self.addr = addr
+        self.nline = nline
+        self.line = line
+        self.stalls = stalls
+        self.source = source
+
+    def Describe(self):
+
+        counts = dict((name, self.stalls.count(name)) for name in StallTypes if name in self.stalls)
+        path = "after jump at 0x%04x" % self.source if self.source != None else "fall-through"
+        return "0x%04x line %-5d %-24s %d cycle(s) %-14s %s" % (self.addr, self.nline, self.line, len(self.stalls),
+                                                               ", ".join("%s %d" % x for x in counts.items()),
+                                                               path)
+
+##Analysis results
+class HazardReport:
+
+    def __init__(self):
+
+        ##HazardSite list, by address
+        self.sites = []
+        ##taken BZ/BHLEQ whose delay slot stalls: (branch Instr, slot HazardSite)
+        self.dropped = []
+        ##conditional branches, one flush cycle each when taken
+        self.branches = 0
+        ##delay slots holding a NOP
+        self.nopSlots = 0
+        self.instructions = 0
+
+    ##@return estimated stall cycles, every path taken once
+    def StallCycles(self):
+        return sum(len(site.stalls) for site in self.sites)
+
+    ##Printable report
+    def Report(self):
+
+        out = ["%d instructions, %d stall site(s), about %d stall cycle(s) with every path taken once" %
+               (self.instructions, len(self.sites), self.StallCycles())]
+        totals = dict((name, sum(site.stalls.count(name) for site in self.sites)) for name in StallTypes)
+        out.append("stalls: " + ", ".join("%s %d" % (name, totals[name]) for name in StallTypes))
+        out.append("conditional branches: %d (1 flush cycle when taken), delay slots with NOP: %d" %
+                   (self.branches, self.nopSlots))
+        for branch, site in self.dropped:
+            out.append("line %d: delay slot of %s stalls, the pipeline ignores the branch" %
+                       (branch.nline, branch.line))
+        for site in self.sites:
+            out.append(site.Describe())
+
+        return "\n".join(out)
+
+##Issue one instruction along a path
+#@param info HazardInfo
+#@param recent (cycle leaving ID, HazardInfo) of the last instructions, updated
+#@param cycle cycle after the previous instruction left ID
+#@return (cycle it leaves ID, stall types)
+def issue(info, recent, cycle):
+
+    cycle, stalls = stallCycles(info, recent, cycle)
+    recent.append((cycle, info))
+    if len(recent) > 3:
+        del recent[0]
+
+    return (cycle, stalls)
+
+##Analyze an assembled program
+#@param asm Assembler instance after Assemble
+#@return HazardReport
+def analyzeHazards(asm):
+
+    words = dict(zip(asm.binAddr, asm.binWords))
+    code = [instr for instr in asm.code if instr.index in words]
+    infos = dict((instr.index, HazardInfo(words[instr.index])) for instr in code)
+    transfers = dict((instr.index, controlTransfer(instr.index, words[instr.index])) for instr in code)
+    byAddr = dict((instr.index, instr) for instr in code)
+
+    report = HazardReport()
+    report.instructions = len(code)
+
+    #fall-through: pipeline state after every instruction, for jumps into blocks
+    after = {}
+    fallStalls = {}
+    recent = []
+    cycle = 0
+    prev = None
+    for instr in code:
+        addr = instr.index
+        info = infos[addr]
+
+        #only reached from elsewhere: after a gap or the delay slot of a jump
+        if prev == None or prev.index != addr - 1 or transfers.get(prev.index - 1, (None,))[0] == "jump":
+            recent = []
+
+        cycle, stalls = issue(info, recent, cycle + 1)
+        after[addr] = (list(recent), cycle)
+        fallStalls[addr] = stalls
+        if stalls:
+            report.sites.append(HazardSite(addr, instr.nline, instr.line, stalls))
+
+        kind, target = transfers.get(addr - 1, (None, None))
+        if kind != None and words[addr] == HazNOP:
+            report.nopSlots += 1
+        if kind == "branch" and stalls:
+            report.dropped.append((byAddr[addr - 1], report.sites[-1]))
+        prev = instr
+
+    #jumps into blocks: the jump and its slot are ahead in the pipeline
+    for instr in code:
+        kind, target = transfers[instr.index]
+        if kind == "branch":
+            report.branches += 1
+        if target == None or instr.index + 1 not in after or target not in byAddr:
+            continue
+
+        recent, cycle = after[instr.index + 1]
+        recent = list(recent)
+        #a taken BZ/BHLEQ flushes one fetch
+        if kind == "branch":
+            cycle += 1
+
+        addr = target
+        for n in range(HazEdgeDepth):
+            dest = byAddr.get(addr)
+            if dest == None:
+                break
+            cycle, stalls = issue(infos[addr], recent, cycle + 1)
+            if stalls != fallStalls[addr] and stalls:
+                report.sites.append(HazardSite(addr, dest.nline, dest.line, stalls, instr.index))
+            addr += 1
+
+    report.sites.sort(key=lambda site: (site.addr, site.source != None, site.source))
+
+    return report
@@ -0,0 +1,372 @@
+#coding=utf-8
+##@package anem_link
+# @brief relocatable objects and linker
+# @since 10/17/2026
+#
+# assembler.py -c writes <file>.o instead of an image. Code before the first
+# .ADDRESS of a module is relocatable, code after an .ADDRESS stays at that
+# address. Objects hold the encoded words of every section, the code labels
+# and constants of the module, and a relocation for every field the module
+# cannot fill in alone:
+#
+# - U, L: %label%U and %label%L bytes of LIU/LIL
+# - B: a %label% byte of LIU/LIL, the address must fit in 8 bits
+# - J: J/JAL offset, relative to the instruction + 1
+# - BZ: BZ/BHLEQ offset, relative to the instruction + 2
+#
+# The linker places the relocatable sections one after another, skipping the
+# fixed ones, resolves the relocations and writes the same outputs as the
+# assembler. All code labels are global and must be unique across modules;
+# constants may be repeated with the same value.
+
+import argparse
+import json
+import os
+import re
+import sys
+from array import array
+from collections import ChainMap
+
+from anem_msg import *
+from anem_records import *
+from anem_regex import *
+
+##Object format name and version
+ObjFormat = "anem16-object"
+ObjVersion = 1
+
+##Label references in an instruction
+ObjRef = re.compile(r"%(\w+)%([UL]?)")
+
+##Relative jumps: relocation kind and offset base
+ObjRelative = { "J" : ("J", 1), "JAL" : ("J", 1), "BZ" : ("BZ", 2), "BHLEQ" : ("BZ", 2) }
+
+##Field mask of each relocation kind
+ObjMasks = { "U" : 0x00FF, "L" : 0x00FF, "B" : 0x00FF, "J" : 0x0FFF, "BZ" : 0x0FFF }
+
+##Section of every label in clean lines
+#@param lines list of CleanLine
+#@return dictionary label -> position in Assembler.code of the first instruction
+#after it, or None when no instruction follows
+def labelPositions(lines):
+
+    positions = {}
+    waiting = []
+    count = 0
+    for entry in lines:
+        line = entry.line
+        if line.startswith('.'):
+            continue
+        if ':' in line:
+            label, line = line.split(':', 1)
+            waiting.append(label.strip())
+        if line.strip() != '':
+            for label in waiting:
+                positions[label] = count
+            waiting = []
+            count += 1
+
+    for label in waiting:
+        positions[label] = None
+
+    return positions
+
+##Write an object file
+#@param asm Assembler instance after Index (and relaxation)
+#@param fileName object file name
+#@param anchors asm.code as it was after Index, before relaxation
+#@param pinned positions in anchors of the instructions following an .ADDRESS
+#@param codeLabels set of code label names
+#@return True if written; objects with errors are not written, and an old one is removed
+def writeObject(asm, fileName, anchors, pinned, codeLabels):
+
+    #sections: the relocatable one first, then one per .ADDRESS
+    starts = set(id(anchors[pos]) for pos in pinned if pos < len(anchors))
+    sections = [{ "addr" : None, "instrs" : [] }]
+    sectionOf = {}
+    for instr in asm.code:
+        if id(instr) in starts:
+            sections.append({ "addr" : instr.index, "instrs" : [] })
+        sections[-1]["instrs"].append(instr)
+        sectionOf[id(instr)] = len(sections) - 1
+    for section in sections:
+        section["base"] = section["instrs"][0].index if section["instrs"] else 0
+
+    symbols = {}
+    for label, pos in labelPositions(asm.CleanOut).items():
+        if label not in asm.labels or label not in codeLabels:
+            continue
+        section = sectionOf[id(anchors[pos])] if pos != None else len(sections) - 1
+        symbols[label] = [section, asm.labels[label] - sections[section]["base"]]
+    #trampolines added by relaxation, they always label one of their own words
+    byAddr = dict((instr.index, instr) for instr in asm.code)
+    for label in codeLabels:
+        if label not in symbols and asm.labels.get(label) in byAddr:
+            section = sectionOf[id(byAddr[asm.labels[label]])]
+            symbols[label] = [section, asm.labels[label] - sections[section]["base"]]
+
+    constants = dict((name, value) for name, value in asm.labels.items() if name not in codeLabels)
+
+    relocs = []
+    labels = asm.labels
+    out = []
+    try:
+        for n, section in enumerate(sections):
+            words = array('H')
+            code = []
+            for instr in section["instrs"]:
+                mnemonic = instr.line.split(None,1)[0]
+                override = {}
+                for m in ObjRef.finditer(instr.line):
+                    name, part = m.group(1), m.group(2)
+                    known = name in constants or (name in symbols and sections[symbols[name][0]]["addr"] != None)
+                    if mnemonic in ObjRelative:
+                        kind, base = ObjRelative[mnemonic]
+                        #same section, or both ends at fixed addresses
+                        if (name in symbols and symbols[name][0] == n) or (known and section["addr"] != None):
+                            continue
+                        override[name] = instr.index + base
+                    else:
+                        if known:
+                            continue
+                        kind = part if part != '' else "B"
+                        override[name] = 0
+                    relocs.append([n, instr.index - section["base"], kind, name])
+
+                asm.labels = ChainMap(override, labels) if override else labels
+                word = asm.Encode(instr.index, instr.nline, instr.line)
+                asm.labels = labels
+                if word == None:
+                    word = 0
+                words.append(word)
+                code.append([instr.nline, instr.line])
+
+            out.append({ "addr" : section["addr"], "words" : "".join(map("{:04x}".format, words)),
+                         "code" : code })
+    finally:
+        asm.labels = labels
+
+    #a failed word is stored as 0, the linker would not notice
+    if asm.AsmErrorCount:
+        if os.path.exists(fileName):
+            os.remove(fileName)
+        return False
+
+    obj = { "format" : ObjFormat,
+            "version" : ObjVersion,
+            "sections" : out,
+            "symbols" : symbols,
+            "constants" : constants,
+            "relocs" : relocs }
+    with open(fileName, "w") as f:
+        json.dump(obj, f, separators=(',', ':'))
+
+    return True
+
+##Linker
+class Linker:
+
+    def __init__(self):
+
+        from assembler import Assembler
+        ##messages, counts and output writers
+        self.asm = Assembler()
+        self.objects = []
+        ##global symbol -> (address, object file)
+        self.symbols = {}
+        ##constant -> (value, object file)
+        self.constants = {}
+
+    def Error(self, msg):
+        self.asm.Message(msg, AsmMsgType.AsmMsgError)
+
+    ##Read an object file
+    #@param fileName object file
+    def Load(self, fileName):
+
+        try:
+            with open(fileName) as f:
+                obj = json.load(f)
+        except (IOError, ValueError) as e:
+            self.Error("%s: cannot read object file (%s)" % (fileName, e))
+            return
+
+        if obj.get("format") != ObjFormat or obj.get("version") != ObjVersion:
+            self.Error("%s: not an ANEM16 object file of version %d" % (fileName, ObjVersion))
+            return
+
+        obj["file"] = fileName
+        for section in obj["sections"]:
+            hexwords = section["words"]
+            section["data"] = array('H', [int(hexwords[i:i+4], 16) for i in range(0, len(hexwords), 4)])
+        self.objects.append(obj)
+
+    ##Place sections and build the symbol table
+    #@param base address of the first relocatable section
+    def Place(self, base=0):
+
+        fixed = []
+        for obj in self.objects:
+            for section in obj["sections"]:
+                if section["addr"] != None and section["data"]:
+                    fixed.append((section["addr"], section["addr"] + len(section["data"])))
+        fixed.sort()
+
+        cursor = base
+        for obj in self.objects:
+            for section in obj["sections"]:
+                if section["addr"] != None:
+                    section["base"] = section["addr"]
+                    continue
+                size = len(section["data"])
+                #first fit after the previous relocatable section
+                moved = True
+                while moved and size:
+                    moved = False
+                    for start, end in fixed:
+                        if cursor < end and start < cursor + size:
+                            cursor = end
+                            moved = True
+                section["base"] = cursor
+                cursor += size
+
+        for obj in self.objects:
+            for name, (section, offset) in obj["symbols"].items():
+                addr = obj["sections"][section]["base"] + offset
+                if name in self.symbols:
+                    self.Error("symbol %s defined in %s and %s" % (name, self.symbols[name][1], obj["file"]))
+                    continue
+                self.symbols[name] = (addr, obj["file"])
+            for name, value in obj["constants"].items():
+                if name in self.constants and self.constants[name][0] != value:
+                    self.Error("constant %s is %d in %s and %d in %s" %
+                               (name, self.constants[name][0], self.constants[name][1], value, obj["file"]))
+                    continue
+                self.constants.setdefault(name, (value, obj["file"]))
+
+    ##Resolve relocations
+    def Relocate(self):
+
+        for obj in self.objects:
+            for section, offset, kind, name in obj["relocs"]:
+                sect = obj["sections"][section]
+                pc = sect["base"] + offset
+                if name in obj["constants"]:
+                    value = obj["constants"][name]
+                elif name in self.symbols:
+                    value = self.symbols[name][0]
+                elif name in self.constants:
+                    value = self.constants[name][0]
+                else:
+                    self.Error("%s: undefined symbol %s at 0x%04x" % (obj["file"], name, pc))
+                    continue
+
+                if kind == "U":
+                    field = value//256
+                elif kind == "L":
+                    field = value%256
+                elif kind == "B":
+                    field = value
+                    if not 0 <= field <= 0xFF:
+                        self.Error("%s: %s = 0x%04x does not fit in the byte at 0x%04x" % (obj["file"], name, value, pc))
+                        continue
+                else:
+                    field = value - pc - (2 if kind == "BZ" else 1)
+                    if not -2048 <= field <= 2047:
+                        self.Error("%s: %s target %s out of range after linking (offset %d at 0x%04x)" %
+                                   (obj["file"], "BZ/BHLEQ" if kind == "BZ" else "J/JAL", name, field, pc))
+                        continue
+
+                mask = ObjMasks[kind]
+                sect["data"][offset] = (sect["data"][offset] & ~mask & 0xFFFF) | (field & mask)
+
+    ##Build the image in the assembler, checking for overlaps
+    def Build(self):
+
+        image = {}
+        for obj in self.objects:
+            for section in obj["sections"]:
+                for n, word in enumerate(section["data"]):
+                    addr = section["base"] + n
+                    if addr in image:
+                        self.Error("%s and %s overlap at 0x%04x" % (image[addr][0], obj["file"], addr))
+                        return
+                    if addr > 0xFFFF:
+                        self.Error("%s: section does not fit in 64k words" % obj["file"])
+                        return
+                    image[addr] = (obj["file"], word, section["code"][n])
+
+        asm = self.asm
+        asm.binAddr = array('H')
+        asm.binWords = array('H')
+        asm.code = []
+        for addr in sorted(image.keys()):
+            asm.binAddr.append(addr)
+            asm.binWords.append(image[addr][1])
+            nline, line = image[addr][2]
+            asm.code.append(Instr(addr, nline, line))
+        asm.labels = dict((name, value) for name, (value, fileName) in self.constants.items())
+        asm.labels.update((name, addr) for name, (addr, fileName) in self.symbols.items())
+
+    ##Write the linked outputs
+    #@param fileName output base name
+    #@param formats additional output formats
+    def Write(self, fileName, formats=()):
+
+        from assembler import OutputFormats
+
+        asm = self.asm
+        asm.WriteBin(fileName + ".bin")
+        asm.WriteContents(fileName + ".contents.txt")
+        asm.WriteSymbols(fileName + ".sym")
+        asm.WriteIndex(fileName + ".ind")
+        asm.Message("%s.bin, .contents.txt, .sym and .ind written" % fileName, AsmMsgType.AsmMsgInfo)
+
+        for fmt in formats:
+            ext, writer, desc = OutputFormats[fmt]
+            writer(asm, fileName + ext)
+            asm.Message("%s%s written (%s)" % (fileName, ext, desc), AsmMsgType.AsmMsgInfo)
+
+##Link object files
+#@param objects object file names, relocatable sections are placed in this order
+#@param fileName output base name
+#@param formats additional output formats
+#@param base address of the first relocatable section
+#@param verbosity message verbosity
+#@return (error count, warning count)
+def linkFiles(objects, fileName, formats=(), base=0, verbosity=2):
+
+    linker = Linker()
+    linker.asm.Verbosity = verbosity
+    for obj in objects:
+        linker.Load(obj)
+    if linker.asm.AsmErrorCount == 0:
+        linker.Place(base)
+    if linker.asm.AsmErrorCount == 0:
+        linker.Relocate()
+    if linker.asm.AsmErrorCount == 0:
+        linker.Build()
+    if linker.asm.AsmErrorCount == 0:
+        linker.Write(fileName, formats)
+        linker.asm.Message("%d objects linked, %d words" % (len(linker.objects), len(linker.asm.binWords)),
+                           AsmMsgType.AsmMsgInfo)
+
+    return (linker.asm.AsmErrorCount, linker.asm.AsmWarnCount)
+
+if __name__ == "__main__":
+
+    from assembler import OutputFormats
+
+    parser = argparse.ArgumentParser(description="ANEM16 linker")
+    parser.add_argument("objects", nargs="+", help="object files written by assembler.py -c")
+    parser.add_argument("-o", "--output", required=True, help="output base name")
+    parser.add_argument("-f", "--format", action="append", default=[], choices=list(OutputFormats.keys()),
+                        help="additional output format, may be given more than once")
+    parser.add_argument("--base", type=lambda x: int(x, 0), default=0,
+                        help="address of the first relocatable section (default 0)")
+    parser.add_argument("-v", "--verbosity", type=int, default=2, help="message verbosity")
+    args = parser.parse_args()
+
+    errors, warnings = linkFiles(args.objects, args.output, args.format, args.base, args.verbosity)
+    print(formatCounts(errors, warnings))
+    sys.exit(1 if errors else 0)
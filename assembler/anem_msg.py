@@ -0,0 +1,77 @@
+#coding=utf-8
+##@package anem_msg
+# @brief assembler message types and console colors
+# @since 11/14/2014
+
+##Verbose level
+class AsmMsgType:
+
+    AsmMsgError   = 0
+    AsmMsgWarning = 1
+    AsmMsgInfo    = 2
+    AsmMsgDebug   = 3
+
+class MsgColors:
+
+    red = '\033[31m'
+    green = '\033[32m'
+    yellow = '\033[33m'
+    cyan = '\033[36m'
+    nocolor = ''
+    end = '\033[0m'
+
+##Message type self.CleanOut color
+MsgTypeOut = {AsmMsgType.AsmMsgError   : MsgColors.red,
+              AsmMsgType.AsmMsgWarning : MsgColors.yellow,
+              AsmMsgType.AsmMsgInfo    : MsgColors.nocolor,
+              AsmMsgType.AsmMsgDebug   : MsgColors.cyan
+              }
+
+##Colored console self.CleanOut
+def colorize(text, color):
+    if color == MsgColors.nocolor:
+        return text
+    else:
+        return color + text + MsgColors.end
+
+##Format error/warning counts
+def formatCounts(errors, warnings):
+    return (str(errors)+
+            colorize(" error(s) ",MsgTypeOut[AsmMsgType.AsmMsgError])+
+            str(warnings)+
+            colorize(" warning(s) ",MsgTypeOut[AsmMsgType.AsmMsgWarning]))
+
+##Message collected instead of printed (Assembler.Diagnostics)
+class AsmDiagnostic:
+
+    __slots__ = ('msgType', 'msg')
+
+    ##@param msgType AsmMsgType value
+    #@param msg message text
+    def __init__(self, msgType, msg):
+        self.msgType = msgType
+        self.msg = msg
+
+    def IsError(self):
+        return self.msgType == AsmMsgType.AsmMsgError
+
+    def __str__(self):
+        return self.msg
+
+    def __repr__(self):
+        return "AsmDiagnostic(%d, %r)" % (self.msgType, self.msg)
+
+##Assembly failed, raised instead of exiting when messages are collected
+class AsmError(Exception):
+
+    ##@param msg description
+    #@param diagnostics AsmDiagnostic list
+    #@param program partial result, set by the caller that has one
+    def __init__(self, msg, diagnostics, program=None):
+        Exception.__init__(self, msg)
+        self.diagnostics = diagnostics
+        self.program = program
+
+    ##Error messages only
+    def Errors(self):
+        return [d for d in self.diagnostics if d.IsError()]
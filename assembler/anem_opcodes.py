@@ -4,75 +4,81 @@
 # @since 11/15/2014
 # @author Bruno Morais <brunosmmm@gmail.com>
 
-ANEMOpcodeR      = "0000"
+ANEMOpcodeR      = 0b0000
 ##Opcode by operation, type R
-ANEMFuncR        = { "ADD" : "0010",
-                     "SUB" : "0110",
-                     "AND" : "0000",
-                     "OR"  : "0001",
-                     "XOR" : "1111",
-                     "NOR" : "1100",
-                     "SLT" : "0111",
-                     "MUL" : "0011",
-                     "SGT" : "1000"
+ANEMFuncR        = { "ADD" : 0b0010,
+                     "SUB" : 0b0110,
+                     "AND" : 0b0000,
+                     "OR"  : 0b0001,
+                     "XOR" : 0b1111,
+                     "NOR" : 0b1100,
+                     "SLT" : 0b0111,
+                     "MUL" : 0b0011,
+                     "SGT" : 0b1000
                      }
 
-ANEMOpcodeS      = "0001"
-ANEMFuncS        = { "SHL"  : "0010",
-                     "SHR"  : "0001",
-                     "SAR"  : "0000",
-                     "ROL"  : "1000",
-                     "ROR"  : "0100"
+ANEMOpcodeS      = 0b0001
+ANEMFuncS        = { "SHL"  : 0b0010,
+                     "SHR"  : 0b0001,
+                     "SAR"  : 0b0000,
+                     "ROL"  : 0b1000,
+                     "ROR"  : 0b0100
                     }
 
-ANEMOpcodeL      = { "LIU"  : '0100',
-                     'LIL'  : '0101'
+ANEMOpcodeL      = { "LIU"  : 0b0100,
+                     'LIL'  : 0b0101
                    }
 
-ANEMOpcodeJ      = { 'J'    : '1111',
-                     'JAL'  : '1101',
-                     'BZ'   : '10',
-                     'BHLEQ' : '0110'
+##BZ has a 2-bit opcode (bits 15:14) followed by the predicate (bits 13:12)
+ANEMOpcodeJ      = { 'J'    : 0b1111,
+                     'JAL'  : 0b1101,
+                     'BZ'   : 0b10,
+                     'BHLEQ' : 0b0110
                    }
 
-ANEMOpcodeW      = { 'SW'   : '0010',
-                     'LW'   : '0011',
-                     'JR'   : '1100'
+ANEMPredBZ       = { 'X'    : 0b00,
+                     'T'    : 0b01,
+                     'N'    : 0b10
+                   }
+
+ANEMOpcodeW      = { 'SW'   : 0b0010,
+                     'LW'   : 0b0011,
+                     'JR'   : 0b1100
                      }
 
-ANEMOpcodeM1 = "1110"
-ANEMFuncM1   =  { "LHL" : "0000",
-                  "LHH" : "0001",
-                  "LLL" : "0010",
-                  "LLH" : "0011",
-                  "AIS" : "0100",
-                  "AIH" : "0101",
-                  "AIL" : "0110"
+ANEMOpcodeM1 = 0b1110
+ANEMFuncM1   =  { "LHL" : 0b0000,
+                  "LHH" : 0b0001,
+                  "LLL" : 0b0010,
+                  "LLH" : 0b0011,
+                  "AIS" : 0b0100,
+                  "AIH" : 0b0101,
+                  "AIL" : 0b0110
                   }
 
-ANEMFuncM3 = {    "MFHI" : "0111",
-                  "MFLO" : "1000",
-                  "MTHI" : "1001",
-                  "MTLO" : "1010"
+ANEMFuncM3 = {    "MFHI" : 0b0111,
+                  "MFLO" : 0b1000,
+                  "MTHI" : 0b1001,
+                  "MTLO" : 0b1010
 }
 
-ANEMOpcodeSTK = "0111"
-ANEMFuncSTK = {   "PUSH" : "0000",
-                  "POP"  : "0001",
-                  "SPRD" : "0010",
-                  "SPWR" : "0011"
+ANEMOpcodeSTK = 0b0111
+ANEMFuncSTK = {   "PUSH" : 0b0000,
+                  "POP"  : 0b0001,
+                  "SPRD" : 0b0010,
+                  "SPWR" : 0b0011
 }
 
-ANEMOpcodeADDI = "1011"
+ANEMOpcodeADDI = 0b1011
 
-ANEMFuncSYSCALL = "1011"
-ANEMFuncM4      = "1100"
-ANEMSubM4 = {  "RETI"  : "0000",
-               "EI"    : "0001",
-               "DI"    : "0010",
-               "MFEPC" : "0011",
-               "MFECA" : "0100",
-               "MTEPC" : "0101"
+ANEMFuncSYSCALL = 0b1011
+ANEMFuncM4      = 0b1100
+ANEMSubM4 = {  "RETI"  : 0b0000,
+               "EI"    : 0b0001,
+               "DI"    : 0b0010,
+               "MFEPC" : 0b0011,
+               "MFECA" : 0b0100,
+               "MTEPC" : 0b0101
 }
 
 ##@todo bring floating point support although we do not have a FPU now
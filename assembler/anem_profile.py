@@ -0,0 +1,299 @@
+#coding=utf-8
+##@file anem_profile.py
+# @brief hot spot profiler over the PC events of a trace
+# @since 10/17/2026
+#
+# Counts the PC events of a trace (tests/TRACE_FORMAT.md, text or binary) per
+# address in one streaming pass and maps the counts to source lines with the
+# program's .ind file. Traces from anem_sim.py --pc have one event per
+# executed instruction; GHDL traces written with -gTRACE_PC=true have one per
+# clock cycle, so their counts also hold stalls and flushed fetches.
+#
+# Loops are found from the control transfers seen in the same pass. A jump
+# back to a lower address right after the delay slot of a J, BZ or BHLEQ is
+# a back edge; the loop spans from its target to the delay slot. JR, RETI and
+# interrupts are not loops. Counts of nested loops include the inner loops.
+
+import argparse
+import json
+import os
+import sys
+
+from anem_trace import TraceReader, isBinaryTrace
+
+##Instructions whose backward transfers close a loop
+ProfLoopBranches = ("J", "BZ", "BHLEQ")
+
+##Events between a branch and its target: the delay slot, and the flushed fetch in GHDL traces
+ProfBranchDistance = 2
+
+##Addresses, source lines and labels of an assembled program
+class ProgramMap:
+
+    ##@param indName .ind file written by the assembler
+    #@param sourceName assembly source, None if not available
+    def __init__(self, indName, sourceName=None):
+
+        ##address -> (source line number, instruction)
+        self.code = {}
+        ##address -> label
+        self.labels = {}
+        self.source = []
+
+        section = None
+        with open(indName) as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line in (".LABELS", ".CODE"):
+                    section = line
+                    continue
+                fields = line.split("\t", 2)
+                if section == ".LABELS" and len(fields) == 2:
+                    self.labels.setdefault(int(fields[1]), fields[0])
+                elif section == ".CODE" and len(fields) == 3:
+                    self.code[int(fields[0])] = (int(fields[1]), fields[2])
+
+        if sourceName != None and os.path.exists(sourceName):
+            with open(sourceName) as f:
+                self.source = [line.rstrip("\n") for line in f]
+
+    ##@return source line number of an address, None if unknown
+    def Line(self, addr):
+
+        entry = self.code.get(addr)
+        return entry[0] if entry != None else None
+
+    ##@return True when the instruction at addr can close a loop
+    def IsLoopBranch(self, addr):
+
+        entry = self.code.get(addr)
+        return entry != None and entry[1].split(" ", 1)[0].upper() in ProfLoopBranches
+
+    ##Name of an address for reports: label, label+offset or hex address
+    def Name(self, addr):
+
+        base = max((a for a in self.labels if a <= addr), default=None)
+        if base == None:
+            return "0x%04x" % addr
+        if base == addr:
+            return self.labels[base]
+        return "%s+%d" % (self.labels[base], addr - base)
+
+##Execution counts of one trace
+class Profile:
+
+    def __init__(self):
+
+        ##events by address
+        self.counts = [0]*0x10000
+        ##(from, to) -> count of the transfers that did not go to the next address
+        self.edges = {}
+        self.events = 0
+        self.prev = -1
+
+    ##Count the PC events of a text trace
+    #@param f open text file
+    def ReadText(self, f):
+
+        counts = self.counts
+        edges = self.edges
+        prev = self.prev
+        events = 0
+        for line in f:
+            if line.startswith("PC "):
+                pc = int(line[3:], 16)
+                counts[pc] += 1
+                events += 1
+                #a stall fetches the same address again
+                if pc != prev + 1 and pc != prev:
+                    edge = (prev, pc)
+                    edges[edge] = edges.get(edge, 0) + 1
+                prev = pc
+
+        self.prev = prev
+        self.events += events
+
+    ##Count the PC events of a binary trace
+    #@param reader TraceReader
+    def ReadBinary(self, reader):
+
+        counts = self.counts
+        edges = self.edges
+        prev = self.prev
+        events = 0
+        for code, sub, pc, b in reader.Records():
+            if code == 6:
+                counts[pc] += 1
+                events += 1
+                if pc != prev + 1 and pc != prev:
+                    edge = (prev, pc)
+                    edges[edge] = edges.get(edge, 0) + 1
+                prev = pc
+
+        self.prev = prev
+        self.events += events
+
+    ##Count the PC events of a trace file, "-" for standard input
+    def Read(self, fileName):
+
+        if fileName == "-":
+            self.ReadText(sys.stdin)
+        elif isBinaryTrace(fileName):
+            reader = TraceReader(fileName)
+            try:
+                self.ReadBinary(reader)
+            finally:
+                reader.Close()
+        else:
+            with open(fileName) as f:
+                self.ReadText(f)
+
+    ##@return source line number -> events, events of addresses without a line under None
+    def Lines(self, prog):
+
+        lines = {}
+        for addr, count in enumerate(self.counts):
+            if count:
+                line = prog.Line(addr)
+                lines[line] = lines.get(line, 0) + count
+
+        return lines
+
+    ##Loops closed by the back edges seen
+    #@param prog ProgramMap
+    #@return list of dictionaries, most events first
+    def Loops(self, prog):
+
+        loops = {}
+        for (src, dst), count in self.edges.items():
+            if src < 0 or dst > src:
+                continue
+            for branch in range(src - 1, src - 1 - ProfBranchDistance, -1):
+                if dst <= branch and prog.IsLoopBranch(branch):
+                    loops[(dst, branch)] = loops.get((dst, branch), 0) + count
+                    break
+
+        result = []
+        for (start, branch), edges in loops.items():
+            end = branch + 1
+            result.append({ "start" : start, "end" : end, "name" : prog.Name(start),
+                            "first_line" : prog.Line(start), "last_line" : prog.Line(end) or prog.Line(branch),
+                            "back_edges" : edges, "events" : sum(self.counts[start:end+1]) })
+        result.sort(key=lambda loop: (-loop["events"], loop["start"]))
+
+        return result
+
+    ##@return JSON-friendly summary
+    def Summary(self, prog, top=20):
+
+        lines = self.Lines(prog)
+        hot = sorted(((count, line) for line, count in lines.items() if line != None), reverse=True)
+        return { "events" : self.events,
+                 "unmapped" : lines.get(None, 0),
+                 "addresses" : dict(("%04x" % addr, count) for addr, count in enumerate(self.counts) if count),
+                 "lines" : [{ "line" : line, "events" : count } for count, line in hot],
+                 "loops" : self.Loops(prog)[:top] }
+
+    def Percent(self, count):
+        return 100.0*count/self.events if self.events else 0.0
+
+    ##Hot lines and loops
+    #@param prog ProgramMap
+    #@param top entries per table
+    def Report(self, prog, top=20):
+
+        summary = self.Summary(prog, top)
+        out = ["%d PC events, %d source lines executed" % (self.events, len(summary["lines"]))]
+        if summary["unmapped"]:
+            out.append("warning: %d events at addresses not in the program" % summary["unmapped"])
+
+        out.append("hot lines:")
+        out.append("%10s %7s %6s  %s" % ("events", "%", "line", "source"))
+        for entry in summary["lines"][:top]:
+            out.append("%10d %6.2f%% %6d  %s" % (entry["events"], self.Percent(entry["events"]), entry["line"],
+                                                 self.SourceLine(prog, entry["line"])))
+
+        if summary["loops"]:
+            out.append("hot loops:")
+            out.append("%10s %7s %10s  %-13s %-11s %s" % ("events", "%", "back edges", "addresses", "lines", "loop"))
+        for loop in summary["loops"]:
+            out.append("%10d %6.2f%% %10d  0x%04x-0x%04x %-11s %s" %
+                       (loop["events"], self.Percent(loop["events"]), loop["back_edges"], loop["start"], loop["end"],
+                        "%s-%s" % (loop["first_line"], loop["last_line"]), loop["name"]))
+
+        return "\n".join(out)
+
+    ##Text of a source line, the instruction from the .ind when the source is not available
+    def SourceLine(self, prog, line):
+
+        if 0 < line <= len(prog.source):
+            return prog.source[line-1].strip()
+        return " / ".join(text for l, text in prog.code.values() if l == line)
+
+    ##Source with the events of every line
+    #
+    #Lines that hold code but never executed are marked with "-".
+    #@param prog ProgramMap
+    #@return listing text
+    def Listing(self, prog):
+
+        lines = self.Lines(prog)
+        code = set(line for line, text in prog.code.values())
+        source = prog.source
+        if not source:
+            #without the source, list the instructions of the .ind
+            source = [""]*max(code, default=0)
+            for line, text in prog.code.values():
+                source[line-1] = text if not source[line-1] else source[line-1] + " / " + text
+
+        out = []
+        for n, text in enumerate(source, 1):
+            if n in lines:
+                out.append("%10d %6.2f%%  %s" % (lines[n], self.Percent(lines[n]), text))
+            elif n in code:
+                out.append("%10s %7s  %s" % ("-", "", text))
+            else:
+                out.append("%10s %7s  %s" % ("", "", text))
+
+        return "\n".join(out)
+
+##Program files from a name given on the command line
+#@param name base name, or a .asm/.ind/.contents.txt file
+#@return (.ind file, .asm file)
+def programFiles(name):
+
+    for ext in (".contents.txt", ".asm", ".ind"):
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+            break
+
+    return name + ".ind", name + ".asm"
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="ANEM16 hot spot profiler")
+    parser.add_argument("trace", help="trace with PC events, text or binary, - for standard input")
+    parser.add_argument("program", help="assembled program (base name, .asm or .ind), for source lines")
+    parser.add_argument("-t", "--top", type=int, default=20, help="lines and loops to list")
+    parser.add_argument("-l", "--listing", action="store_true", help="print the source annotated with events")
+    parser.add_argument("--json", metavar="FILE", help="write results as JSON")
+    args = parser.parse_args()
+
+    indName, sourceName = programFiles(args.program)
+    if not os.path.exists(indName):
+        parser.error("%s not found, assemble the program first" % indName)
+    prog = ProgramMap(indName, sourceName)
+
+    profile = Profile()
+    profile.Read(args.trace)
+    if profile.events == 0:
+        print("%s: no PC events, write the trace with anem_sim.py --pc or -gTRACE_PC=true" % args.trace)
+        sys.exit(1)
+
+    if args.listing:
+        print(profile.Listing(prog))
+        print("")
+    print(profile.Report(prog, args.top))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(profile.Summary(prog, args.top), f, indent=2)
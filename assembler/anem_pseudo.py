@@ -0,0 +1,162 @@
+#coding=utf-8
+##@package anem_pseudo
+# @brief pseudo-instruction expansion rules
+# @since 10/17/2026
+#
+# Rules are keyed by mnemonic, so a line that is not a pseudo-instruction
+# costs a single dictionary lookup in Assembler.Clean. Each rule is a list of
+# (regex, expander) pairs tried in order; the expander gets the match and
+# returns the replacement lines. Replacement lines are expanded again, so
+# rules and macro templates can use other pseudo-instructions.
+
+import re
+import string
+
+from anem_regex import *
+
+##Deepest nesting of expansions, a rule expanding to itself goes past it
+PseudoMaxDepth = 16
+
+##Operands of template macros
+MACROARGS = re.compile(r"\S+\s*(.*?)\s*$")
+
+def expandNOP(m):
+    return ["ADD $0,$0"]
+
+def expandLIWb(m):
+    data = int(m.group(2),2)
+    ##@todo verify trailing NOP, was a hack for non-pipelined version
+    return ["LIU $%s, %d" % (m.group(1),data//256),
+            "LIL $%s, %d" % (m.group(1),data%256),
+            "ADD $0,$0"]
+
+def expandLIWh(m):
+    data = int(m.group(2),16)
+    return ["LIU $%s, %d" % (m.group(1),data//256),
+            "LIL $%s, %d" % (m.group(1),data%256),
+            "ADD $0,$0"]
+
+def expandLIWd(m):
+
+    #hack for llvm pass
+    if int(m.group(2)) > 0xFFFF:
+        data = int(m.group(2)) >> 8
+    else:
+        data = int(m.group(2))
+
+    return ["LIU $%s, %d" % (m.group(1),data//256),
+            "LIL $%s, %d" % (m.group(1),data%256),
+            "ADD $0,$0"]
+
+def expandMOVE(m):
+    return ["AND $%s, $0" % m.group(1),
+            "OR  $%s, $%s" % (m.group(1),m.group(2))]
+
+def expandLHILOh(m):
+    data = int(m.group(2),16)
+    if m.group(1) == "LHI":
+        return ["LHH %d" % (data//256), "LHL %d" % (data%256)]
+    return ["LLH %d" % (data//256), "LLL %d" % (data%256)]
+
+def expandLHILOd(m):
+    data = int(m.group(2))
+    if m.group(1) == "LHI":
+        return ["LHH %d" % (data//256), "LHL %d" % (data%256)]
+    return ["LLH %d" % (data//256), "LLL %d" % (data%256)]
+
+def expandMADD(m):
+    return ["MUL $%s, $%s" % (m.group(1),m.group(2)),
+            "AIS %d" % (int(m.group(3)))]
+
+##Expansion rules: mnemonic -> [(regex, expander), ...]
+PseudoOps = { "NOP"  : [(NOP, expandNOP)],
+              "LIW"  : [(LIWb, expandLIWb), (LIWh, expandLIWh), (LIWd, expandLIWd)],
+              "MOVE" : [(MOVE, expandMOVE)],
+              "LHI"  : [(L_HILOh, expandLHILOh), (L_HILOd, expandLHILOd)],
+              "LLO"  : [(L_HILOh, expandLHILOh), (L_HILOd, expandLHILOd)],
+              "MADD" : [(MADD, expandMADD)]
+              }
+
+##Register a pseudo-instruction rule
+#@param mnemonic pseudo-instruction name, upper case
+#@param regex compiled regex matched against the line (label removed)
+#@param expander function(match) returning a list of lines, or None to leave the line alone
+def registerPseudoOp(mnemonic, regex, expander):
+    PseudoOps.setdefault(mnemonic.upper(), []).append((regex, expander))
+
+##Register a multi-instruction macro from a template
+#
+#Operands are separated by commas and substituted into the template lines
+#with str.format placeholders, e.g.
+#registerMacro("SWAP", ["XOR {0}, {1}", "XOR {1}, {0}", "XOR {0}, {1}"])
+#makes "SWAP $1, $2" expand to three XOR instructions.
+#@param mnemonic macro name
+#@param template list of instruction lines
+def registerMacro(mnemonic, template):
+
+    template = [line.upper() for line in template]
+    nargs = 0
+    for line in template:
+        for literal, field, spec, conv in string.Formatter().parse(line):
+            if field != None and field != '':
+                nargs = max(nargs, int(field) + 1)
+
+    def expandMacro(m):
+        args = [arg.strip() for arg in m.group(1).split(",")] if m.group(1) else []
+        if len(args) != nargs:
+            return None
+        return [line.format(*args) for line in template]
+
+    registerPseudoOp(mnemonic, MACROARGS, expandMacro)
+
+##Expand a cleaned line
+#@param upLine upper case line without comments
+#@return (label prefix, expanded lines) or None when the line is not a pseudo-instruction
+def expandPseudo(upLine):
+
+    colon = upLine.find(':')
+    rest = upLine[colon+1:]
+    tokens = rest.split(None,1)
+    if not tokens:
+        return None
+
+    rules = PseudoOps.get(tokens[0])
+    if rules == None:
+        return None
+
+    body = rest.strip()
+    for regex, expander in rules:
+        m = regex.match(body)
+        if m != None:
+            out = expander(m)
+            if out != None:
+                return (upLine[:colon+1] + rest[:len(rest)-len(rest.lstrip())], out)
+
+    return None
+
+##Expand the lines produced by an expansion again
+#@param lines expanded lines
+#@param depth nesting levels left
+#@return list of lines without pseudo-instructions
+#@throw ValueError when expansions nest deeper than PseudoMaxDepth
+def expandAgain(lines, depth=PseudoMaxDepth):
+
+    out = []
+    for line in lines:
+        expanded = expandPseudo(line.upper())
+        if expanded == None:
+            out.append(line)
+            continue
+        if depth == 0:
+            raise ValueError("pseudo-instructions nested deeper than %d levels: %s" % (PseudoMaxDepth, line))
+
+        prefix,inner = expanded
+        inner = expandAgain(inner, depth - 1)
+        if len(inner) == 1:
+            out.append(prefix + inner[0])
+            continue
+        if prefix.strip() != '':
+            out.append(prefix.strip())
+        out.extend(inner)
+
+    return out
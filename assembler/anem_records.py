@@ -0,0 +1,31 @@
+#coding=utf-8
+##@package anem_records
+# @brief record types passed between assembler stages
+# @since 10/17/2026
+#
+# Encoded words are not records, they are kept as array('H') columns
+# (Assembler.binAddr and Assembler.binWords).
+
+##Clean source line
+class CleanLine:
+
+    __slots__ = ('nline', 'line')
+
+    ##@param nline source line number
+    #@param line cleaned text
+    def __init__(self, nline, line):
+        self.nline = nline
+        self.line = line
+
+##Indexed instruction
+class Instr:
+
+    __slots__ = ('index', 'nline', 'line')
+
+    ##@param index instruction address
+    #@param nline source line number
+    #@param line instruction text
+    def __init__(self, index, nline, line):
+        self.index = index
+        self.nline = nline
+        self.line = line
@@ -26,6 +26,16 @@ CONSTVd = re.compile(r"\.CONSTANT\s+(\w+)\s*=\s*(\d+)")
 ADDRh   = re.compile(r"\.ADDRESS\s+(0[xX][a-fA-F0-9]+)")
 ADDRd   = re.compile(r"\.ADDRESS\s+(\d+)")
 
+##Instruction operands
+LBYTEu  = re.compile(r"%(\w+)%U")
+LBYTEl  = re.compile(r"%(\w+)%L")
+LBYTEx  = re.compile(r"%(\w+)%")
+LBYTEh  = re.compile(r"0[xX]([a-fA-F0-9]+)")
+LBYTEd  = re.compile(r"[+-]?\d+")
+JADDRd  = re.compile(r"[0-9]+")
+JADDRl  = re.compile(r"%(\w+)%")
+WOFFd   = re.compile(r"\d+")
+
 ##Comments
 COMM = re.compile(r"--.*$")
 
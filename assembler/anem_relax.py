@@ -0,0 +1,436 @@
+#coding=utf-8
+##@package anem_relax
+# @brief relaxation of out-of-range jumps and branches
+# @since 10/17/2026
+#
+# Runs between Index and Assemble. A J, JAL, BZ or BHLEQ whose label is more
+# than 2048 words away is retargeted to a trampoline, a "J %label%" with a
+# delay slot that leaves Z alone, placed within reach. The trampoline jumps the rest of the way
+# (or to the next trampoline), so no register is used: JAL still saves the
+# address after its own delay slot and BZ still executes its delay slot.
+#
+# Trampolines go right after the delay slot of a J, JR or RETI, where
+# execution never falls through. When there is no such place within reach,
+# one is made with a J over the trampolines. Inserting words moves the code
+# after them, so the pass is repeated until every jump is in range; only
+# jumps whose distance changed are checked again.
+
+import bisect
+from anem_regex import *
+from anem_records import Instr
+
+##Jump offsets are signed 12-bit
+RelaxMin = -2048
+RelaxMax = 2047
+
+##Trampolines are placed this far inside the reach of a jump, so that islands
+#inserted between them in the same round rarely push it out of range again
+RelaxSlack = 512
+
+##Give up after this many rounds
+RelaxRounds = 32
+
+##Never fallen through after their delay slot; HAB is a J to the next
+#address and falls through
+RelaxBarriers = ("J", "JR", "RETI")
+
+##Delay slot of guard jumps and trampolines. NOP (ADD $0,$0) sets Z, and an
+#island can sit between an instruction setting Z and the BZ reading it
+RelaxSlot = "LIU $0,0"
+
+##Jumps and branches to a label
+class RelaxJump:
+
+    __slots__ = ('instr', 'mnemonic', 'label', 'base')
+
+    ##@param instr Instr
+    #@param mnemonic J, JAL, BZ or BHLEQ
+    #@param label target label
+    def __init__(self, instr, mnemonic, label):
+        self.instr = instr
+        self.mnemonic = mnemonic
+        self.label = label
+        ##offset is relative to this many words after the instruction
+        self.base = 2 if mnemonic in ("BZ", "BHLEQ") else 1
+
+    def Offset(self, labels):
+        return labels[self.label] - self.instr.index - self.base
+
+    ##Point the instruction to another label
+    def Retarget(self, label):
+        self.instr.line = self.instr.line.replace("%" + self.label + "%", "%" + label + "%", 1)
+        self.label = label
+
+##Trampolines inserted at one place
+class RelaxIsland:
+
+    ##@param segment segment number
+    #@param addr address of the instruction the island goes before
+    #@param guarded needs a J over it
+    #@param nline source line reported for the island
+    def __init__(self, segment, addr, guarded, nline):
+        self.segment = segment
+        self.addr = addr
+        self.guarded = guarded
+        self.nline = nline
+        ##final target label -> [trampoline label, label the trampoline jumps to]
+        self.entries = {}
+
+    def Size(self):
+        return 2*len(self.entries) + (2 if self.guarded else 0)
+
+##Relaxation results
+class RelaxReport:
+
+    def __init__(self):
+        ##jumps retargeted to a trampoline
+        self.relaxed = 0
+        self.trampolines = 0
+        self.rounds = 0
+        ##error messages, the program cannot be relaxed
+        self.errors = []
+
+##Jump to a label, or None
+#@param instr Instr
+#@return RelaxJump or None
+def parseJump(instr):
+
+    mnemonic = instr.line.split(None,1)[0]
+    if mnemonic in ("J", "JAL"):
+        m = typeJ.match(instr.line)
+        target = m.group(3) if m != None else None
+    elif mnemonic == "BZ":
+        m = typeBZ.match(instr.line)
+        target = m.group(2) if m != None else None
+    elif mnemonic == "BHLEQ":
+        m = typeM2.match(instr.line)
+        target = m.group(2) if m != None else None
+    else:
+        return None
+
+    l = JADDRl.match(target) if target != None else None
+    if l == None:
+        return None
+
+    return RelaxJump(instr, mnemonic, l.group(1))
+
+##Split code into runs of consecutive addresses
+#@param code list of Instr
+#@param pinned ids of Instr placed by .ADDRESS, they always start a run
+#@return list of (first position, first address, address after the last), in code order
+def makeSegments(code, pinned=()):
+
+    segments = []
+    for pos, instr in enumerate(code):
+        if segments and segments[-1][2] == instr.index and id(instr) not in pinned:
+            segments[-1][2] += 1
+        else:
+            segments.append([pos, instr.index, instr.index + 1])
+
+    return [tuple(s) for s in segments]
+
+##Segment lookup by address
+class SegmentMap:
+
+    ##@param segments list from makeSegments
+    def __init__(self, segments):
+        self.order = sorted(range(len(segments)), key=lambda n: segments[n][1])
+        self.starts = [segments[n][1] for n in self.order]
+        self.segments = segments
+
+    ##@return number of the segment holding addr, or ending at it, or -1
+    def Find(self, addr):
+        n = bisect.bisect_right(self.starts, addr) - 1
+        if n < 0 or addr > self.segments[self.order[n]][2]:
+            return -1
+        return self.order[n]
+
+##Segments running into the next one
+#@param relocatable skip the code before the first .ADDRESS, the linker places it
+#@return set of (segment start, next segment start)
+def overlaps(code, pinned, relocatable=False):
+
+    segments = makeSegments(code, pinned)
+    if relocatable and code and id(code[0]) not in pinned:
+        segments = segments[1:]
+    spans = sorted((start, end) for first, start, end in segments)
+    return set((a[0], b[0]) for a, b in zip(spans, spans[1:]) if a[1] > b[0])
+
+##Code labels and .ADDRESS placement of clean lines
+#@param lines list of CleanLine
+#@return (set of code label names, set of positions in Assembler.code of the
+#instructions following an .ADDRESS)
+def cleanLayout(lines):
+
+    names = set()
+    pinned = set()
+    count = 0
+    for entry in lines:
+        line = entry.line
+        if line.startswith('.'):
+            if ADDRh.match(line) != None or ADDRd.match(line) != None:
+                pinned.add(count)
+            continue
+        label = None
+        if ':' in line:
+            label, line = line.split(':', 1)
+            names.add(label.strip())
+        if line.strip() != '':
+            count += 1
+
+    return (names, pinned)
+
+##Control transfers, the next instruction is their delay slot
+RelaxTransfers = ("J", "JAL", "JR", "BZ", "BHLEQ", "RETI", "SYSCALL", "HAB")
+
+##Relaxation of one program
+class Relaxer:
+
+    ##@param code list of Instr, updated
+    #@param labels label -> address, updated
+    #@param codeLabels set of names in labels that are code labels, constants do not move; updated
+    #@param pinned positions in code of the instructions following an .ADDRESS
+    #@param local only relax jumps within a segment, for object files
+    def __init__(self, code, labels, codeLabels, pinned, local=False):
+
+        self.code = code
+        self.labels = labels
+        self.codeLabels = codeLabels
+        ##instructions at a fixed address, islands never move them
+        self.pinned = set(id(code[pos]) for pos in pinned if pos < len(code))
+        self.local = local
+        self.report = RelaxReport()
+        self.serial = 0
+
+    ##Relax until every jump is in range
+    #@return RelaxReport
+    def Run(self):
+
+        report = self.report
+        jumps = [j for j in map(parseJump, self.code)
+                 if j != None and j.label in self.codeLabels and j.label in self.labels]
+        if self.local:
+            #other segments of an object move when linking, the linker checks those
+            segmap = SegmentMap(makeSegments(self.code, self.pinned))
+            jumps = [j for j in jumps if segmap.Find(j.instr.index) == segmap.Find(self.labels[j.label])]
+        far = [j for j in jumps if not RelaxMin <= j.Offset(self.labels) <= RelaxMax]
+        #overlaps in the source are not relaxation's doing
+        overlapping = overlaps(self.code, self.pinned, self.local)
+
+        while far:
+            report.rounds += 1
+            if report.rounds > RelaxRounds:
+                report.errors.append("branch relaxation did not settle after %d rounds" % RelaxRounds)
+                return report
+
+            self.Prepare()
+            for jump in sorted(far, key=lambda j: j.instr.index):
+                self.Plan(jump)
+            if report.errors:
+                return report
+
+            #distances before the insertion, to find the jumps that moved apart
+            before = dict((id(j), self.labels[j.label] - j.instr.index) for j in jumps)
+            jumps.extend(self.Apply())
+            if self.code and max(instr.index for instr in self.code) > 0xFFFF:
+                report.errors.append("program does not fit in 64k words after branch relaxation")
+                return report
+
+            far = [j for j in jumps
+                   if (id(j) not in before or self.labels[j.label] - j.instr.index != before[id(j)]) and
+                      not RelaxMin <= j.Offset(self.labels) <= RelaxMax]
+
+        for start, following in sorted(overlaps(self.code, self.pinned, self.local) - overlapping):
+            report.errors.append("code at 0x%04x runs into .ADDRESS 0x%04x after branch relaxation" %
+                                 (start, following))
+
+        return report
+
+    ##Layout of the current code, for planning a round
+    def Prepare(self):
+
+        self.segments = makeSegments(self.code, self.pinned)
+        self.segmap = SegmentMap(self.segments)
+        self.byAddr = dict((instr.index, instr) for instr in self.code)
+        ##places never fallen into, by segment
+        self.dead = [[addr for addr in range(start + 2, end + 1)
+                      if self.byAddr[addr - 2].line.split(None,1)[0] in RelaxBarriers]
+                     for first, start, end in self.segments]
+        ##(segment, address) -> RelaxIsland planned this round
+        self.islands = {}
+        ##island addresses by segment, sorted
+        self.planned = {}
+
+    ##Retarget an out-of-range jump to a chain of trampolines
+    #@param jump RelaxJump
+    def Plan(self, jump):
+
+        label = jump.label
+        target = self.labels[label]
+        addr = jump.instr.index
+        base = jump.base
+        nline = jump.instr.nline
+        previous = None
+
+        while True:
+            island = self.Place(addr, base, target, nline)
+            if island == None:
+                self.report.errors.append("Line %d: %s target out of range and no room for a trampoline" %
+                                          (jump.instr.nline, jump.instr.line))
+                return
+
+            entry = island.entries.get(label)
+            known = entry != None
+            if not known:
+                name = self.NewLabel()
+                #reserve the name, the address is set on insertion
+                self.labels[name] = 0
+                entry = island.entries[label] = [name, label]
+                self.report.trampolines += 1
+
+            if previous == None:
+                jump.Retarget(entry[0])
+                self.report.relaxed += 1
+            else:
+                previous[1] = entry[0]
+
+            #the rest of the chain is planned already, or the trampoline reaches
+            addr = island.addr + 2*len(island.entries)
+            if known or RelaxMin <= target - addr - 1 <= RelaxMax:
+                return
+            previous = entry
+            base = 1
+
+    ##Island reachable from a jump
+    #@param addr jump address
+    #@param base 1 for J/JAL, 2 for BZ/BHLEQ
+    #@param target target address
+    #@param nline source line reported for a new island
+    #@return RelaxIsland or None
+    def Place(self, addr, base, target, nline):
+
+        seg = self.segmap.Find(addr)
+        first, start, end = self.segments[seg]
+        forward = target > addr
+
+        #places reachable with room to spare, toward the target; the first
+        #instruction of a segment keeps its address
+        if forward:
+            lo, hi = addr + 2, min(addr + base + RelaxMax - RelaxSlack, end)
+            near, far = (addr + hi)//2, hi
+        else:
+            lo, hi = max(addr + base + RelaxMin + RelaxSlack, start + 1), addr
+            near, far = (lo + addr)//2, lo
+
+        #farthest island of this round or place never fallen into, in the far
+        #half of the reach, otherwise a guarded island at the edge; every hop
+        #gets at least halfway
+        place = None
+        for places in (self.planned.get(seg, []), self.dead[seg]):
+            if forward:
+                n = bisect.bisect_right(places, hi) - 1
+                if n >= 0 and places[n] >= max(near, place if place != None else lo):
+                    place = places[n]
+            else:
+                n = bisect.bisect_left(places, lo)
+                if n < len(places) and places[n] <= min(near, place if place != None else hi):
+                    place = places[n]
+
+        guarded = place == None
+        if guarded:
+            place = far
+            #never between a jump and its delay slot
+            while lo <= place <= hi and place > start and \
+                  self.byAddr[place - 1].line.split(None,1)[0] in RelaxTransfers:
+                place += -1 if forward else 1
+            if not lo <= place <= hi:
+                return None
+
+        island = self.islands.get((seg, place))
+        if island == None:
+            island = self.islands[(seg, place)] = RelaxIsland(seg, place, guarded, nline)
+            bisect.insort(self.planned.setdefault(seg, []), place)
+
+        return island
+
+    ##Insert the islands planned this round, moving code and labels after them
+    #@return RelaxJump list of the new trampolines
+    def Apply(self):
+
+        labels = self.labels
+        segments = self.segments
+
+        #words inserted up to each island of a segment
+        shifts = {}
+        for seg, places in self.planned.items():
+            total = 0
+            totals = []
+            for place in places:
+                total += self.islands[(seg, place)].Size()
+                totals.append(total)
+            shifts[seg] = (places, totals)
+
+        def shiftOf(seg, addr):
+            places, totals = shifts[seg]
+            n = bisect.bisect_right(places, addr) - 1
+            return totals[n] if n >= 0 else 0
+
+        #labels move with the instruction they point to, or with the end of a segment
+        for name in self.codeLabels:
+            addr = labels.get(name)
+            seg = self.segmap.Find(addr) if addr != None else -1
+            if seg in shifts:
+                labels[name] = addr + shiftOf(seg, addr)
+
+        newCode = []
+        newJumps = []
+        for seg, (first, start, end) in enumerate(segments):
+            group = [self.islands[(seg, place)] for place in self.planned.get(seg, [])]
+            n = 0
+            for old in range(start, end + 1):
+                while n < len(group) and group[n].addr == old:
+                    island = group[n]
+                    addr = old + shiftOf(seg, old) - island.Size()
+                    if island.guarded:
+                        skip = self.NewLabel()
+                        labels[skip] = addr + island.Size()
+                        self.codeLabels.add(skip)
+                        newCode.append(Instr(addr, island.nline, "J %%%s%%" % skip))
+                        newCode.append(Instr(addr + 1, island.nline, RelaxSlot))
+                        addr += 2
+                    for name, to in island.entries.values():
+                        trampoline = Instr(addr, island.nline, "J %%%s%%" % to)
+                        newCode.append(trampoline)
+                        newCode.append(Instr(addr + 1, island.nline, RelaxSlot))
+                        labels[name] = addr
+                        self.codeLabels.add(name)
+                        newJumps.append(RelaxJump(trampoline, "J", to))
+                        addr += 2
+                    n += 1
+                if old < end:
+                    instr = self.code[first + old - start]
+                    if seg in shifts:
+                        instr.index += shiftOf(seg, old)
+                    newCode.append(instr)
+        self.code[:] = newCode
+
+        return newJumps
+
+    ##Unused label name
+    def NewLabel(self):
+
+        while True:
+            self.serial += 1
+            label = "_RELAX%d" % self.serial
+            if label not in self.labels:
+                return label
+
+##Relax out-of-range jumps of an indexed program
+#@param code list of Instr, updated
+#@param labels label -> address, updated
+#@param codeLabels set of names in labels that are code labels, constants do not move; updated
+#@param pinned positions in code of the instructions following an .ADDRESS
+#@param local only relax jumps within a segment, for object files
+#@return RelaxReport
+def relaxJumps(code, labels, codeLabels, pinned=(), local=False):
+    return Relaxer(code, labels, codeLabels, pinned, local).Run()
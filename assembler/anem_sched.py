@@ -0,0 +1,349 @@
+#coding=utf-8
+##@package anem_sched
+# @brief pipeline-aware scheduling of cleaned source lines
+# @since 10/17/2026
+#
+# Runs between Clean and Index, so labels are assigned to the final layout by
+# the indexer as usual. Padding NOPs are dropped where the hazard unit
+# interlocks the dependency they were covering, and instructions are
+# reordered inside basic blocks to fill stall cycles. Both are checked
+# against the stall rules of the timing model (anem_timing) and a block is
+# only changed when it gets cheaper.
+#
+# Basic blocks are runs of R/S/LIU/LIL/ADDI/LW/SW instructions. Labels,
+# directives, control transfers and their delay slots, and instructions using
+# HI, LO, SP, EPC or the interrupt enable end a block and are never moved.
+# Those registers are not interlocked, so NOPs shortly after such an
+# instruction are kept as well.
+#
+# NOP (ADD $0,$0) sets Z, so it is only dropped when a later R/S instruction
+# overwrites Z before any branch can read it.
+
+from anem_opcodes import *
+from anem_records import CleanLine
+from anem_timing import HazardInfo, stallCycles
+
+##Encoding of NOP (ADD $0,$0)
+SchedNOP = (ANEMOpcodeR << 12) | ANEMFuncR['ADD']
+
+##Control transfers, the next instruction is their delay slot
+SchedTransfers = ("J", "JAL", "JR", "BZ", "BHLEQ", "RETI", "SYSCALL", "HAB")
+
+##Conditional branches, ignored by the fetch logic when their delay slot stalls
+SchedBranches = ("BZ", "BHLEQ")
+
+##NOPs this close after a HI/LO/SP/EPC/interrupt instruction are kept
+SchedSpecialDistance = 4
+
+##Instructions after a block that its order can still delay
+SchedTail = 3
+
+##Memory as a scheduling resource, register numbers are the others
+SchedMem = 16
+
+##Z flag as a scheduling resource
+SchedZ = 17
+
+##Source item: one instruction, label or directive
+class SchedItem:
+
+    __slots__ = ('kind', 'nline', 'text', 'mnemonic', 'word', 'info', 'reads', 'writes', 'special', 'slot')
+
+    ##@param kind "instr", "label" or "directive"
+    #@param nline source line number
+    #@param text line text
+    def __init__(self, kind, nline, text):
+
+        self.kind = kind
+        self.nline = nline
+        self.text = text
+        self.mnemonic = text.split(None,1)[0] if kind == "instr" else None
+        self.word = None
+        self.info = None
+        self.reads = ()
+        self.writes = ()
+        ##uses state the hazard unit does not track, never moved
+        self.special = True
+        ##delay slot of a control transfer
+        self.slot = False
+
+    ##Fill in the fields used for scheduling
+    #@param word encoded word with label references as 0
+    def Decode(self, word):
+
+        self.word = word
+        self.info = HazardInfo(word)
+        opcode = word >> 12
+        a = (word >> 8) & 0xF
+        b = (word >> 4) & 0xF
+        ra = (a,) if a else ()
+        rb = (b,) if b else ()
+
+        if self.mnemonic in SchedTransfers:
+            return
+
+        if opcode == ANEMOpcodeR and (word & 0xF) != ANEMFuncR['MUL']:
+            self.reads, self.writes = ra + rb, ra + (SchedZ,)
+        elif opcode == ANEMOpcodeS:
+            self.reads, self.writes = ra, ra + (SchedZ,)
+        elif opcode in (ANEMOpcodeL['LIU'], ANEMOpcodeL['LIL']):
+            #byte writes keep the other byte
+            self.reads, self.writes = ra, ra
+        elif opcode == ANEMOpcodeADDI:
+            self.reads, self.writes = ra, ra + (SchedZ,)
+        elif opcode == ANEMOpcodeW['LW']:
+            #loads may have side effects on peripherals, memory accesses keep their order
+            self.reads, self.writes = rb + (SchedMem,), ra + (SchedMem,)
+        elif opcode == ANEMOpcodeW['SW']:
+            self.reads, self.writes = ra + rb + (SchedMem,), (SchedMem,)
+        else:
+            return
+
+        self.special = False
+
+    def IsNOP(self):
+        return self.word == SchedNOP
+
+    ##Writes Z for sure (R/S type)
+    def KillsZ(self):
+        return self.word != None and (self.word >> 12) in (ANEMOpcodeR, ANEMOpcodeS) and not self.IsNOP()
+
+##Scheduling results
+class SchedReport:
+
+    def __init__(self):
+
+        self.nopsRemoved = 0
+        self.blocksReordered = 0
+        ##estimated stall cycles on the fall-through path
+        self.stallsBefore = 0
+        self.stallsAfter = 0
+        self.instrBefore = 0
+        self.instrAfter = 0
+
+##Split clean lines into items
+#@param lines list of CleanLine
+#@param encode function(line) -> word or None
+#@return list of SchedItem
+def makeItems(lines, encode):
+
+    items = []
+    for entry in lines:
+        line = entry.line
+        if line.startswith('.'):
+            items.append(SchedItem("directive", entry.nline, line))
+            continue
+
+        colon = line.find(':')
+        if colon >= 0:
+            items.append(SchedItem("label", entry.nline, line[:colon+1]))
+            line = line[colon+1:].strip()
+        if line != '':
+            items.append(SchedItem("instr", entry.nline, line))
+
+    prevTransfer = False
+    for item in items:
+        if item.kind != "instr":
+            continue
+        word = encode(item.text)
+        if word != None:
+            item.Decode(word)
+        item.slot = prevTransfer
+        prevTransfer = item.mnemonic in SchedTransfers
+
+    return items
+
+##Find the NOPs that can be dropped
+#@param items list of SchedItem
+#@return set of item positions
+def removableNOPs(items):
+
+    #Z is dead after an item when an R/S instruction overwrites it before any
+    #control transfer or address change; NOPs do not count, they may go too
+    dead = [False]*len(items)
+    state = False
+    for n in range(len(items) - 1, -1, -1):
+        dead[n] = state
+        item = items[n]
+        if item.kind == "directive" or (item.kind == "instr" and item.mnemonic in SchedTransfers):
+            state = False
+        elif item.kind == "instr" and item.KillsZ():
+            state = True
+
+    removable = set()
+    sinceSpecial = SchedSpecialDistance
+    for n, item in enumerate(items):
+        if item.kind != "instr":
+            continue
+        if item.IsNOP() and not item.slot and dead[n] and sinceSpecial >= SchedSpecialDistance:
+            removable.add(n)
+        sinceSpecial = 0 if item.special and not item.IsNOP() else sinceSpecial + 1
+
+    return removable
+
+##Dependency graph of a block
+#@param block list of SchedItem in source order
+#@return list of predecessor position sets
+def makeDeps(block):
+
+    preds = [set() for item in block]
+    zWriters = [n for n, item in enumerate(block) if SchedZ in item.writes]
+    for j, later in enumerate(block):
+        for i in range(j):
+            earlier = block[i]
+            if set(earlier.writes) & set(later.reads) or set(earlier.reads) & set(later.writes) or \
+               (set(earlier.writes) & set(later.writes)) - set((SchedZ,)):
+                preds[j].add(i)
+
+    #only the final Z value is visible, the last Z writer stays last
+    if zWriters:
+        last = zWriters[-1]
+        for i in zWriters[:-1]:
+            preds[last].add(i)
+
+    return preds
+
+##Issue a sequence of items along the fall-through path
+#@param seq list of SchedItem with info
+#@param recent (cycle leaving ID, HazardInfo) of the last instructions
+#@param cycle cycle the previous instruction left ID
+#@return (stall cycles, stall cycles of conditional branch delay slots)
+def issueSeq(seq, recent, cycle):
+
+    stalls = 0
+    slotStalls = 0
+    prev = None
+    for item in seq:
+        before = cycle
+        recent, cycle = advance(item, recent, cycle)
+        stalls += cycle - before - 1
+        if prev != None and prev.mnemonic in SchedBranches:
+            slotStalls += cycle - before - 1
+        prev = item
+
+    return (stalls, slotStalls)
+
+##Issue one item on the running fall-through state
+#@return (recent, cycle the item leaves ID)
+def advance(item, recent, cycle):
+
+    cycle, stalls = stallCycles(item.info, recent, cycle + 1)
+    recent = recent + [(cycle, item.info)]
+    return (recent[-3:], cycle)
+
+##List schedule a block
+#@param block list of SchedItem
+#@param recent pipeline state before the block
+#@param cycle cycle the previous instruction left ID
+#@return scheduled list
+def listSchedule(block, recent, cycle):
+
+    preds = makeDeps(block)
+    succs = [[] for item in block]
+    for j, p in enumerate(preds):
+        for i in p:
+            succs[i].append(j)
+
+    #longest path to the end of the block, unit latency
+    height = [0]*len(block)
+    for n in range(len(block) - 1, -1, -1):
+        height[n] = 1 + max([height[j] for j in succs[n]] + [0])
+
+    waiting = [len(p) for p in preds]
+    ready = [n for n in range(len(block)) if waiting[n] == 0]
+    recent = list(recent)
+    out = []
+    while ready:
+        best = None
+        for n in ready:
+            exit, stalls = stallCycles(block[n].info, recent, cycle + 1)
+            key = (len(stalls), -height[n], n)
+            if best == None or key < best[0]:
+                best = (key, n, exit)
+        key, n, cycle = best
+        ready.remove(n)
+        out.append(block[n])
+        recent.append((cycle, block[n].info))
+        if len(recent) > 3:
+            del recent[0]
+        for j in succs[n]:
+            waiting[j] -= 1
+            if waiting[j] == 0:
+                ready.append(j)
+
+    return out
+
+##Schedule clean lines
+#@param lines list of CleanLine
+#@param encode function(line) -> encoded word with label references as 0, or None
+#@return (list of CleanLine, SchedReport)
+def scheduleLines(lines, encode):
+
+    report = SchedReport()
+    items = makeItems(lines, encode)
+    removable = removableNOPs(items)
+    instrs = [item for item in items if item.kind == "instr"]
+    report.instrBefore = len(instrs)
+    if any(item.info == None for item in instrs):
+        #malformed lines are reported by Assemble, leave the program alone
+        return (lines, report)
+
+    report.stallsBefore = issueSeq(instrs, [], 0)[0]
+
+    out = []
+    recent = []
+    cycle = 0
+    n = 0
+    while n < len(items):
+        item = items[n]
+        if item.kind != "instr" or item.special or item.slot:
+            if item.kind == "instr" and not (item.IsNOP() and n in removable):
+                recent, cycle = advance(item, recent, cycle)
+                out.append(item)
+            elif item.kind == "instr":
+                report.nopsRemoved += 1
+            else:
+                out.append(item)
+            n += 1
+            continue
+
+        #block: movable instructions and droppable NOPs
+        end = n
+        while end < len(items) and items[end].kind == "instr" and \
+              (not (items[end].special or items[end].slot) or (items[end].IsNOP() and end in removable)):
+            end += 1
+        original = items[n:end]
+        kept = [items[k] for k in range(n, end) if k not in removable]
+        tail = []
+        for x in items[end:]:
+            if len(tail) == SchedTail:
+                break
+            if x.kind == "instr":
+                tail.append(x)
+        candidate = listSchedule(kept, recent, cycle)
+
+        #cycles up to the end of the tail, delay slots of conditional
+        #branches in the tail must not start stalling
+        before = issueSeq(original + tail, recent, cycle)
+        after = issueSeq(candidate + tail, recent, cycle)
+        costBefore = before[0] + len(original)
+        costAfter = after[0] + len(candidate)
+        if (costAfter < costBefore or (costAfter == costBefore and len(candidate) < len(original))) and \
+           after[1] == 0 and before[1] == 0:
+            chosen = candidate
+            report.nopsRemoved += len(original) - len(kept)
+            if [x for x in original if x in kept] != candidate:
+                report.blocksReordered += 1
+        else:
+            chosen = original
+
+        for x in chosen:
+            recent, cycle = advance(x, recent, cycle)
+        out.extend(chosen)
+        n = end
+
+    outInstrs = [item for item in out if item.kind == "instr"]
+    report.instrAfter = len(outInstrs)
+    report.stallsAfter = issueSeq(outInstrs, [], 0)[0]
+
+    return ([CleanLine(item.nline, item.text) for item in out], report)
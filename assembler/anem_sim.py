@@ -0,0 +1,745 @@
+#coding=utf-8
+##@file anem_sim.py
+# @brief behavioral instruction set simulator
+# @since 10/17/2026
+#
+# Executes assembled programs one instruction at a time and writes traces in
+# the format of tests/TRACE_FORMAT.md. Every program word is decoded once into
+# a closure bound to its operands, so the main loop is a table lookup and a
+# call per instruction.
+#
+# Semantics follow the pipeline RTL rather than the cycle timing: J, JAL, JR,
+# RETI and SYSCALL execute the following instruction (delay slot) before
+# the target; taken BZ/BHLEQ also execute the next instruction and flush the
+# one after it, which gives the same sequence. Control transfers inside a
+# delay slot are ignored, JAL in a delay slot still writes $15.
+
+import argparse
+import os
+import sys
+import time
+
+from anem_opcodes import *
+from anem_trace import BinaryTraceWriter
+
+##Register file slots past the 16 GPRs
+SimZ     = 16  #last result of a Z updating instruction, Z = 1 when it is 0
+SimHI    = 17
+SimLO    = 18
+SimSP    = 19
+SimEPC   = 20
+SimECA   = 21
+SimIEN   = 22
+SimNULL  = 23  #writes to $0 land here
+SimState = 24
+
+##Exception vector
+SimExcVector = 0x0002
+
+##Stack pointer after reset
+SimSPReset = 0xFFCF
+
+##First MAC peripheral address, writes from here on are not traced
+SimPeriphStart = 0xFFD0
+
+##J to self, stops the simulation
+SimHaltInstr = 0xFFFF
+
+##Default instruction limit
+SimMaxSteps = 10000000
+
+##Trace format version
+TraceVersion = 1
+
+def sext8(i):
+    return i - 0x100 if i & 0x80 else i
+
+def sext12(i):
+    return i - 0x1000 if i & 0x800 else i
+
+class SimStop(Exception):
+    pass
+
+##Text trace writer, see tests/TRACE_FORMAT.md
+class TraceWriter:
+
+    ##@param outFile open text file
+    #@param memReads also write optional MR events
+    #@param fetches also write optional PC events
+    def __init__(self, outFile, memReads=False, fetches=False):
+
+        self.outFile = outFile
+        self.memReads = memReads
+        self.fetches = fetches
+        self.mwCount = 0
+
+    ##Write comment lines
+    def Header(self, program, source="anem_sim (python)"):
+        self.outFile.write("# anem16-trace v%d\n# Program: %s\n# Source: %s\n" % (TraceVersion, program, source))
+
+    def MemWrite(self, addr, data):
+        self.outFile.write("MW %04x %04x\n" % (addr, data))
+        self.mwCount += 1
+
+    def MemRead(self, addr, data):
+        self.outFile.write("MR %04x %04x\n" % (addr, data))
+
+    def Fetch(self, addr):
+        self.outFile.write("PC %04x\n" % addr)
+
+    ##Write register dump and END
+    #@param regs list of 16 register values
+    #@param hi HI register
+    #@param lo LO register
+    def Finish(self, regs, hi, lo):
+
+        for n in range(16):
+            self.outFile.write("RF %d %04x\n" % (n, regs[n]))
+        self.outFile.write("SR HI %04x\nSR LO %04x\n" % (hi, lo))
+        self.outFile.write("END %d\n" % self.mwCount)
+
+class Simulator:
+
+    ##@param trace object with MemWrite/MemRead methods or None
+    def __init__(self, trace=None):
+
+        self.trace = trace
+        self.rom = {}
+        self.Reset()
+
+    ##Reset architectural state, program memory is kept
+    def Reset(self):
+
+        self.r = [0]*SimState
+        self.r[SimZ] = 1
+        self.r[SimSP] = SimSPReset
+        self.mem = [0]*0x10000
+        self.pc = 0
+        self.npc = 1
+        self.inSlot = False
+        self.steps = 0
+        self.irqs = []
+        self.interrupts = 0
+        self.stopReason = None
+
+        self.code = [self.Unwritten]*0x10000
+        self.slotCode = [self.Unwritten]*0x10000
+        for addr, word in self.rom.items():
+            self.code[addr] = self.Decode(addr, word)
+            self.slotCode[addr] = self.Decode(addr, word, True)
+
+    ##Load program memory
+    #@param words dictionary address -> instruction word
+    def LoadWords(self, words):
+
+        self.rom.update(words)
+        for addr, word in words.items():
+            self.code[addr] = self.Decode(addr, word)
+            self.slotCode[addr] = self.Decode(addr, word, True)
+
+    ##Load a program file: .contents.txt (address and word in binary) or .img (big-endian words from 0)
+    def Load(self, fileName):
+
+        words = {}
+        if fileName.endswith(".img"):
+            with open(fileName, "rb") as f:
+                data = f.read()
+            for n in range(len(data) // 2):
+                words[n] = (data[2*n] << 8) | data[2*n+1]
+        else:
+            with open(fileName) as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 2:
+                        words[int(fields[0], 2)] = int(fields[1], 2)
+
+        self.LoadWords(words)
+
+    def Unwritten(self):
+        raise SimStop("unwritten")
+
+    def Halt(self):
+        raise SimStop("halt")
+
+    ##Assert the external interrupt before a given instruction count
+    #
+    #The interrupt stays pending until taken, which happens after an
+    #instruction that is neither a taken control transfer nor in a delay slot,
+    #with interrupts enabled.
+    #@param step instruction count
+    def Interrupt(self, step):
+        self.irqs.append(step)
+        self.irqs.sort()
+
+    ##Decode an instruction word into a closure
+    #
+    #The closure returns None to continue with the next instruction or the
+    #address to continue from after the delay slot.
+    #@param addr instruction address
+    #@param word instruction word
+    #@param slot decode for execution in a delay slot
+    def Decode(self, addr, word, slot=False):
+
+        if word == SimHaltInstr:
+            return self.Halt
+
+        opcode = word >> 12
+        if (word >> 14) == ANEMOpcodeJ['BZ'] and opcode != ANEMOpcodeADDI:
+            return decodeBZ(self, addr, word, slot)
+
+        return SimDecoders.get(opcode, decodeNop)(self, addr, word, slot)
+
+    ##Write a PC event to the trace before every instruction executes
+    #
+    #Wraps the decoded instructions, so the main loop is unchanged when PC
+    #events are not wanted. Call after loading the program.
+    def TraceFetches(self):
+
+        fetch = self.trace.Fetch
+        def wrap(op, addr):
+            def fetched():
+                fetch(addr)
+                return op()
+            return fetched
+
+        for addr in self.rom:
+            self.code[addr] = wrap(self.code[addr], addr)
+            self.slotCode[addr] = wrap(self.slotCode[addr], addr)
+
+    ##Run the program
+    #@param maxSteps instruction limit for this call
+    #@return stop reason: "halt", "limit" or "unwritten"
+    def Run(self, maxSteps=SimMaxSteps):
+
+        r = self.r
+        code = self.code
+        slotCode = self.slotCode
+        irqs = self.irqs
+        pc = self.pc
+        npc = self.npc
+        table = slotCode if self.inSlot else code
+        steps = self.steps
+        limit = steps + maxSteps
+        reason = "limit"
+
+        try:
+            while steps < limit:
+
+                stop = limit
+                if irqs and irqs[0] < stop:
+                    stop = max(irqs[0], steps)
+
+                while steps < stop:
+                    t = table[pc]()
+                    steps += 1
+                    if t is None:
+                        table = code
+                        pc = npc
+                        npc = (npc + 1) & 0xFFFF
+                    else:
+                        table = slotCode
+                        pc = npc
+                        npc = t
+
+                #interrupt pending: single step until it can be taken
+                while steps < limit:
+                    plain = table is code
+                    t = table[pc]()
+                    steps += 1
+                    if t is None:
+                        table = code
+                        pc = npc
+                        npc = (npc + 1) & 0xFFFF
+                    else:
+                        table = slotCode
+                        pc = npc
+                        npc = t
+
+                    if t is None and plain and r[SimIEN]:
+                        r[SimEPC] = pc
+                        r[SimECA] = 0x00FF
+                        r[SimIEN] = 0
+                        pc = SimExcVector
+                        npc = SimExcVector + 1
+                        irqs.pop(0)
+                        self.interrupts += 1
+                        break
+
+        except SimStop as e:
+            reason = str(e)
+
+        self.pc = pc
+        self.npc = npc
+        self.inSlot = table is slotCode
+        self.steps = steps
+        self.stopReason = reason
+
+        return reason
+
+##Fallback for words that do nothing
+def decodeNop(sim, addr, word, slot):
+    return lambda: None
+
+def decodeR(sim, addr, word, slot):
+
+    r = sim.r
+    a = (word >> 8) & 0xF
+    b = (word >> 4) & 0xF
+    func = word & 0xF
+    w = a if a else SimNULL
+
+    if func == ANEMFuncR['ADD']:
+        def op():
+            v = (r[a] + r[b]) & 0xFFFF
+            r[w] = v
+            r[SimZ] = v
+    elif func == ANEMFuncR['SUB']:
+        def op():
+            v = (r[a] - r[b]) & 0xFFFF
+            r[w] = v
+            r[SimZ] = v
+    elif func == ANEMFuncR['AND']:
+        def op():
+            v = r[a] & r[b]
+            r[w] = v
+            r[SimZ] = v
+    elif func == ANEMFuncR['OR']:
+        def op():
+            v = r[a] | r[b]
+            r[w] = v
+            r[SimZ] = v
+    elif func == ANEMFuncR['XOR']:
+        def op():
+            v = r[a] ^ r[b]
+            r[w] = v
+            r[SimZ] = v
+    elif func == ANEMFuncR['NOR']:
+        def op():
+            v = ~(r[a] | r[b]) & 0xFFFF
+            r[w] = v
+            r[SimZ] = v
+    #flipping the sign bit turns a signed comparison into an unsigned one
+    elif func == ANEMFuncR['SLT']:
+        def op():
+            v = 1 if (r[a] ^ 0x8000) < (r[b] ^ 0x8000) else 0
+            r[w] = v
+            r[SimZ] = v
+    elif func == ANEMFuncR['SGT']:
+        def op():
+            v = 1 if (r[a] ^ 0x8000) > (r[b] ^ 0x8000) else 0
+            r[w] = v
+            r[SimZ] = v
+    #MUL writes HI:LO and also the low word to Ra, like the ALU path does
+    elif func == ANEMFuncR['MUL']:
+        def op():
+            p = r[a] * r[b]
+            v = p & 0xFFFF
+            r[SimHI] = p >> 16
+            r[SimLO] = v
+            r[w] = v
+            r[SimZ] = v
+    else:
+        def op():
+            r[w] = 0
+            r[SimZ] = 0
+
+    return op
+
+def decodeS(sim, addr, word, slot):
+
+    r = sim.r
+    a = (word >> 8) & 0xF
+    n = (word >> 4) & 0xF
+    func = word & 0xF
+    w = a if a else SimNULL
+
+    if func == ANEMFuncS['SHL']:
+        def op():
+            v = (r[a] << n) & 0xFFFF
+            r[w] = v
+            r[SimZ] = v
+    elif func == ANEMFuncS['SHR']:
+        def op():
+            v = r[a] >> n
+            r[w] = v
+            r[SimZ] = v
+    elif func == ANEMFuncS['SAR']:
+        def op():
+            x = r[a]
+            v = ((x - ((x & 0x8000) << 1)) >> n) & 0xFFFF
+            r[w] = v
+            r[SimZ] = v
+    elif func == ANEMFuncS['ROL']:
+        def op():
+            x = r[a]
+            v = ((x << n) | (x >> (16 - n))) & 0xFFFF
+            r[w] = v
+            r[SimZ] = v
+    elif func == ANEMFuncS['ROR']:
+        def op():
+            x = r[a]
+            v = ((x >> n) | (x << (16 - n))) & 0xFFFF
+            r[w] = v
+            r[SimZ] = v
+    else:
+        def op():
+            r[w] = 0
+            r[SimZ] = 0
+
+    return op
+
+def decodeL(sim, addr, word, slot):
+
+    r = sim.r
+    a = (word >> 8) & 0xF
+    imm = word & 0xFF
+    w = a if a else SimNULL
+
+    if (word >> 12) == ANEMOpcodeL['LIU']:
+        imm <<= 8
+        def op():
+            r[w] = imm | (r[w] & 0x00FF)
+    else:
+        def op():
+            r[w] = (r[w] & 0xFF00) | imm
+
+    return op
+
+def decodeSW(sim, addr, word, slot):
+
+    r = sim.r
+    mem = sim.mem
+    a = (word >> 8) & 0xF
+    b = (word >> 4) & 0xF
+    off = word & 0xF
+    mw = sim.trace.MemWrite if sim.trace != None else None
+
+    def op():
+        m = (r[b] + off) & 0xFFFF
+        v = r[a]
+        mem[m] = v
+        if m < SimPeriphStart and mw != None:
+            mw(m, v)
+
+    return op
+
+def decodeLW(sim, addr, word, slot):
+
+    r = sim.r
+    mem = sim.mem
+    a = (word >> 8) & 0xF
+    b = (word >> 4) & 0xF
+    off = word & 0xF
+    w = a if a else SimNULL
+
+    if sim.trace != None and sim.trace.memReads:
+        mr = sim.trace.MemRead
+        def op():
+            m = (r[b] + off) & 0xFFFF
+            v = mem[m]
+            r[w] = v
+            mr(m, v)
+    else:
+        def op():
+            r[w] = mem[(r[b] + off) & 0xFFFF]
+
+    return op
+
+def decodeJ(sim, addr, word, slot):
+
+    target = (addr + 1 + sext12(word & 0xFFF)) & 0xFFFF
+    if slot:
+        return lambda: None
+    return lambda: target
+
+def decodeJAL(sim, addr, word, slot):
+
+    r = sim.r
+    target = (addr + 1 + sext12(word & 0xFFF)) & 0xFFFF
+    link = (addr + 2) & 0xFFFF
+
+    if slot:
+        def op():
+            r[15] = link
+    else:
+        def op():
+            r[15] = link
+            return target
+
+    return op
+
+def decodeJR(sim, addr, word, slot):
+
+    r = sim.r
+    a = (word >> 8) & 0xF
+    if slot:
+        return lambda: None
+    return lambda: r[a]
+
+##BZ X and BZ T both branch on Z = 1, BZ N on Z = 0
+def decodeBZ(sim, addr, word, slot):
+
+    r = sim.r
+    target = (addr + 2 + sext12(word & 0xFFF)) & 0xFFFF
+    if slot:
+        return lambda: None
+
+    if ((word >> 12) & 0x3) == ANEMPredBZ['N']:
+        def op():
+            if r[SimZ] != 0:
+                return target
+    else:
+        def op():
+            if r[SimZ] == 0:
+                return target
+
+    return op
+
+def decodeBHLEQ(sim, addr, word, slot):
+
+    r = sim.r
+    target = (addr + 2 + sext12(word & 0xFFF)) & 0xFFFF
+    if slot:
+        return lambda: None
+
+    def op():
+        if r[SimHI] == r[SimLO]:
+            return target
+
+    return op
+
+def decodeSTK(sim, addr, word, slot):
+
+    r = sim.r
+    mem = sim.mem
+    a = (word >> 8) & 0xF
+    func = word & 0xF
+    w = a if a else SimNULL
+
+    if func == ANEMFuncSTK['PUSH']:
+        mw = sim.trace.MemWrite if sim.trace != None else None
+        def op():
+            m = (r[SimSP] - 1) & 0xFFFF
+            r[SimSP] = m
+            v = r[a]
+            mem[m] = v
+            if m < SimPeriphStart and mw != None:
+                mw(m, v)
+    elif func == ANEMFuncSTK['POP']:
+        mr = sim.trace.MemRead if sim.trace != None and sim.trace.memReads else None
+        def op():
+            m = r[SimSP]
+            v = mem[m]
+            r[w] = v
+            r[SimSP] = (m + 1) & 0xFFFF
+            if mr != None:
+                mr(m, v)
+    elif func == ANEMFuncSTK['SPRD']:
+        def op():
+            v = r[SimSP]
+            r[w] = v
+            r[SimZ] = v
+    elif func == ANEMFuncSTK['SPWR']:
+        def op():
+            r[SimSP] = r[a]
+    else:
+        op = lambda: None
+
+    return op
+
+def decodeADDI(sim, addr, word, slot):
+
+    r = sim.r
+    a = (word >> 8) & 0xF
+    imm = sext8(word & 0xFF)
+    w = a if a else SimNULL
+
+    def op():
+        v = (r[a] + imm) & 0xFFFF
+        r[w] = v
+        r[SimZ] = v
+
+    return op
+
+##HI/LO byte loads and immediate adds, indexed by M1 function
+def decodeM1(sim, addr, word, slot):
+
+    r = sim.r
+    func = (word >> 8) & 0xF
+    imm = word & 0xFF
+    reg = word & 0xF
+    w = reg if reg else SimNULL
+
+    if func == ANEMFuncSYSCALL:
+        return decodeSYSCALL(sim, addr, word, slot)
+    if func == ANEMFuncM4:
+        return decodeM4(sim, addr, word, slot)
+
+    if func in (ANEMFuncM1['LHL'], ANEMFuncM1['LLL']):
+        dst = SimHI if func == ANEMFuncM1['LHL'] else SimLO
+        def op():
+            r[dst] = (r[dst] & 0xFF00) | imm
+    elif func in (ANEMFuncM1['LHH'], ANEMFuncM1['LLH']):
+        dst = SimHI if func == ANEMFuncM1['LHH'] else SimLO
+        high = imm << 8
+        def op():
+            r[dst] = high | (r[dst] & 0x00FF)
+    elif func in (ANEMFuncM1['AIH'], ANEMFuncM1['AIL']):
+        dst = SimHI if func == ANEMFuncM1['AIH'] else SimLO
+        simm = sext8(imm)
+        def op():
+            r[dst] = (r[dst] + simm) & 0xFFFF
+    elif func == ANEMFuncM1['AIS']:
+        simm = sext8(imm)
+        def op():
+            v = (((r[SimHI] << 16) | r[SimLO]) + simm) & 0xFFFFFFFF
+            r[SimHI] = v >> 16
+            r[SimLO] = v & 0xFFFF
+    elif func == ANEMFuncM3['MFHI']:
+        def op():
+            r[w] = r[SimHI]
+    elif func == ANEMFuncM3['MFLO']:
+        def op():
+            r[w] = r[SimLO]
+    elif func == ANEMFuncM3['MTHI']:
+        def op():
+            r[SimHI] = r[reg]
+    elif func == ANEMFuncM3['MTLO']:
+        def op():
+            r[SimLO] = r[reg]
+    else:
+        op = lambda: None
+
+    return op
+
+##EPC skips the delay slot, which executes before the handler
+def decodeSYSCALL(sim, addr, word, slot):
+
+    r = sim.r
+    epc = (addr + 2) & 0xFFFF
+    eca = 0x100 | (word & 0xFF)
+    if slot:
+        return lambda: None
+
+    def op():
+        r[SimEPC] = epc
+        r[SimECA] = eca
+        r[SimIEN] = 0
+        return SimExcVector
+
+    return op
+
+def decodeM4(sim, addr, word, slot):
+
+    r = sim.r
+    sub = (word >> 4) & 0xF
+    reg = word & 0xF
+    w = reg if reg else SimNULL
+
+    #interrupt enable changes are also ignored in a delay slot
+    if sub in (ANEMSubM4['RETI'], ANEMSubM4['EI'], ANEMSubM4['DI']) and slot:
+        return lambda: None
+
+    if sub == ANEMSubM4['RETI']:
+        def op():
+            r[SimIEN] = 1
+            return r[SimEPC]
+    elif sub == ANEMSubM4['EI']:
+        def op():
+            r[SimIEN] = 1
+    elif sub == ANEMSubM4['DI']:
+        def op():
+            r[SimIEN] = 0
+    elif sub in (ANEMSubM4['MFEPC'], ANEMSubM4['MFECA']):
+        src = SimEPC if sub == ANEMSubM4['MFEPC'] else SimECA
+        def op():
+            v = r[src]
+            r[w] = v
+            r[SimZ] = v
+    elif sub == ANEMSubM4['MTEPC']:
+        def op():
+            v = r[reg]
+            r[SimEPC] = v
+            r[SimZ] = v
+    else:
+        op = lambda: None
+
+    return op
+
+##Decoders by opcode, BZ is matched on its 2-bit opcode before this table
+SimDecoders = { ANEMOpcodeR              : decodeR,
+                ANEMOpcodeS              : decodeS,
+                ANEMOpcodeL['LIU']       : decodeL,
+                ANEMOpcodeL['LIL']       : decodeL,
+                ANEMOpcodeW['SW']        : decodeSW,
+                ANEMOpcodeW['LW']        : decodeLW,
+                ANEMOpcodeW['JR']        : decodeJR,
+                ANEMOpcodeJ['J']         : decodeJ,
+                ANEMOpcodeJ['JAL']       : decodeJAL,
+                ANEMOpcodeJ['BHLEQ']     : decodeBHLEQ,
+                ANEMOpcodeSTK            : decodeSTK,
+                ANEMOpcodeADDI           : decodeADDI,
+                ANEMOpcodeM1             : decodeM1
+                }
+
+##Simulate a program and write its trace
+#@param fileName program file, .contents.txt or .img
+#@param traceFile output file object
+#@param maxSteps instruction limit
+#@param irqs instruction counts at which the external interrupt is asserted
+#@param memReads write MR events
+#@param binary None for a text trace, "fixed" or "varint" for a binary trace (traceFile in binary mode)
+#@param fetches write PC events
+#@return Simulator instance after the run
+def simulateFile(fileName, traceFile, maxSteps=SimMaxSteps, irqs=(), memReads=False, binary=None, fetches=False):
+
+    if binary != None:
+        trace = BinaryTraceWriter(traceFile, memReads, binary == "varint", fetches=fetches)
+    else:
+        trace = TraceWriter(traceFile, memReads, fetches)
+    trace.Header(os.path.basename(fileName).split(".")[0])
+
+    sim = Simulator(trace)
+    sim.Load(fileName)
+    if fetches:
+        sim.TraceFetches()
+    for step in irqs:
+        sim.Interrupt(step)
+
+    sim.Run(maxSteps)
+    trace.Finish(sim.r, sim.r[SimHI], sim.r[SimLO])
+
+    return sim
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="ANEM16 instruction set simulator")
+    parser.add_argument("filename", help="program, .contents.txt or .img")
+    parser.add_argument("-T", "--trace", metavar="FILE",
+                        help="trace output, default is standard output, binary when FILE ends in .btr")
+    parser.add_argument("--varint", action="store_true", help="varint records in binary traces")
+    parser.add_argument("-n", "--max-steps", type=int, default=SimMaxSteps, help="instruction limit")
+    parser.add_argument("--irq", type=int, action="append", default=[], metavar="STEP",
+                        help="assert the external interrupt after STEP instructions")
+    parser.add_argument("--mr", action="store_true", help="also trace memory reads")
+    parser.add_argument("--pc", action="store_true", help="also trace the address of every instruction executed")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.trace and args.trace.endswith(".btr"):
+        with open(args.trace, "wb") as f:
+            sim = simulateFile(args.filename, f, args.max_steps, args.irq, args.mr,
+                               "varint" if args.varint else "fixed", args.pc)
+    elif args.trace:
+        with open(args.trace, "w") as f:
+            sim = simulateFile(args.filename, f, args.max_steps, args.irq, args.mr, fetches=args.pc)
+    else:
+        sim = simulateFile(args.filename, sys.stdout, args.max_steps, args.irq, args.mr, fetches=args.pc)
+    elapsed = time.perf_counter() - start
+
+    sys.stderr.write("%s: %s at 0x%04x after %d instructions, %d interrupt(s), %.3f s (%.2f MIPS)\n" %
+                     (args.filename, sim.stopReason, sim.pc, sim.steps, sim.interrupts, elapsed,
+                      sim.steps / elapsed / 1e6 if elapsed > 0 else 0))
+
+    if sim.stopReason == "unwritten":
+        sys.exit(1)
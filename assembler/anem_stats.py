@@ -0,0 +1,87 @@
+#coding=utf-8
+##@package anem_stats
+# @brief opt-in timing and instruction class statistics for the assembler
+# @since 10/17/2026
+
+import json
+import time
+from contextlib import contextmanager
+
+class AsmStats:
+
+    def __init__(self):
+
+        ##stage name -> [wall time, line count], in execution order
+        self.stages = {}
+        ##instruction class -> encoded instruction count
+        self.classes = {}
+
+    ##Time a stage
+    #@param name stage name
+    @contextmanager
+    def Stage(self, name):
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += time.perf_counter() - start
+
+    ##Record lines processed by a stage
+    def Lines(self, name, count):
+        self.stages.setdefault(name, [0.0, 0])[1] += count
+
+    ##Count one encoded instruction
+    def Hit(self, iclass):
+        self.classes[iclass] = self.classes.get(iclass, 0) + 1
+
+    ##Merge a summary from another run
+    #@param summary dictionary from Summary()
+    def Merge(self, summary):
+
+        for name, stage in summary["stages"].items():
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += stage["time"]
+            entry[1] += stage["lines"]
+        for iclass, count in summary["classes"].items():
+            self.classes[iclass] = self.classes.get(iclass, 0) + count
+
+    ##@return JSON serializable summary
+    def Summary(self):
+
+        stages = {}
+        for name, (elapsed, lines) in self.stages.items():
+            stages[name] = { "time" : elapsed,
+                             "lines" : lines,
+                             "lines_per_s" : lines / elapsed if elapsed > 0 else None
+                             }
+
+        return { "stages" : stages,
+                 "classes" : dict(sorted(self.classes.items(), key=lambda x: -x[1])),
+                 "total_time" : sum(stage[0] for stage in self.stages.values())
+                 }
+
+    ##Write JSON summary
+    #@param filename output file
+    #@param extra additional top-level entries
+    def WriteJSON(self, filename, extra=None):
+
+        summary = self.Summary()
+        if extra:
+            summary.update(extra)
+        with open(filename, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    ##Printable report
+    def Report(self):
+
+        out = ["%-16s %10s %10s %12s" % ("stage", "time (s)", "lines", "lines/s")]
+        for name, (elapsed, lines) in self.stages.items():
+            out.append("%-16s %10.4f %10d %12s" % (name, elapsed, lines,
+                                                 "%.0f" % (lines / elapsed) if elapsed > 0 else "-"))
+        total = sum(self.classes.values())
+        for iclass, count in sorted(self.classes.items(), key=lambda x: -x[1]):
+            out.append("%-16s %10d %9.1f%%" % (iclass, count, 100.0 * count / total))
+
+        return "\n".join(out)
@@ -0,0 +1,102 @@
+#coding=utf-8
+##@package anem_stream
+# @brief streaming assembly
+# @since 10/17/2026
+#
+# Cleaning, indexing and encoding are chained generators and every output is
+# written as soon as its line is known. Instructions referencing a label that
+# is not defined yet get a placeholder word; their .bin and .contents.txt
+# records have a fixed width, so they are patched in place once the whole
+# source has been read. Memory is proportional to labels and pending
+# references, not to program size.
+
+import shutil
+import tempfile
+
+from anem_msg import *
+
+##Width of a .bin record in bytes
+BinRecordSize = 17
+
+##Width of a .contents.txt record in bytes
+ContentsRecordSize = 34
+
+##Write clean lines while passing them on
+def teeClean(lines, outFile):
+    for entry in lines:
+        outFile.write(str(entry.nline)+'\t'+entry.line+'\n')
+        yield entry
+
+##Write indexed lines while passing them on
+def teeIndex(code, outFile):
+    for instr in code:
+        outFile.write(str(instr.index)+'\t'+str(instr.nline)+'\t'+instr.line+'\n')
+        yield instr
+
+##Assemble a program in streaming mode
+#@param asm Assembler instance
+#@param fileName program base name, reads <fileName>.asm
+def assembleStream(asm, fileName):
+
+    #forward references: (record number, Instr)
+    pending = []
+    nwords = 0
+
+    with open(fileName+".asm",'r') as src, \
+         open(fileName+".clean","w") as cleanFile, \
+         tempfile.TemporaryFile("w+") as codeFile, \
+         open(fileName+".bin","wb") as binFile, \
+         open(fileName+".contents.txt","wb") as contentsFile:
+
+        asm.labels = {}
+        code = teeIndex(asm.IndexIter(teeClean(asm.CleanIter(src), cleanFile)), codeFile)
+
+        for instr in code:
+            try:
+                word = asm.Encode(instr.index,instr.nline,instr.line)
+            except KeyError:
+                #label not seen yet, patched below
+                pending.append((nwords,instr))
+                word = 0
+            except ValueError as e:
+                asm.Message("Line %d: %s: %s" % (instr.nline, e, instr.line), AsmMsgType.AsmMsgError)
+                continue
+
+            if word == None:
+                continue
+
+            binFile.write(("{:016b}\n".format(word)).encode())
+            contentsFile.write(("{:016b} {:016b}\n".format(instr.index,word)).encode())
+            nwords += 1
+
+        for record,instr in pending:
+            try:
+                word = asm.Encode(instr.index,instr.nline,instr.line)
+            except KeyError as e:
+                asm.Message("Line %d: undefined label %s" % (instr.nline, e), AsmMsgType.AsmMsgError)
+                continue
+            except ValueError as e:
+                asm.Message("Line %d: %s: %s" % (instr.nline, e, instr.line), AsmMsgType.AsmMsgError)
+                continue
+
+            binFile.seek(record*BinRecordSize)
+            binFile.write(("{:016b}".format(word)).encode())
+            contentsFile.seek(record*ContentsRecordSize+17)
+            contentsFile.write(("{:016b}".format(word)).encode())
+
+        #labels go before the code in .ind, which was spooled to a temporary file
+        codeFile.seek(0)
+        with open(fileName+".ind","w") as outFile:
+            outFile.write(".LABELS\n")
+            for label in asm.labels.keys():
+                outFile.write(label+'\t'+str(asm.labels[label])+'\n')
+
+            outFile.write(".CODE\n")
+            shutil.copyfileobj(codeFile, outFile)
+
+    with open(fileName + ".sym", "w") as outFile:
+        for label in asm.labels.keys():
+            outFile.write(label + '\t' + str(asm.labels[label]) + '\n')
+
+    asm.Message("%s: %d words written, %d forward reference(s) patched" % (fileName, nwords, len(pending)),
+                AsmMsgType.AsmMsgInfo)
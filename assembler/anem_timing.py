@@ -0,0 +1,369 @@
+#coding=utf-8
+##@file anem_timing.py
+# @brief cycle-approximate pipeline timing model
+# @since 10/17/2026
+#
+# Runs a program on the instruction set simulator and replays the executed
+# instruction stream through the hazard rules of control/hazunit.vhd and
+# control/fwunit.vhd. Only ID can stall, ALU/MEM/WB always advance, so the
+# model keeps the cycle at which each instruction leaves ID and looks at the
+# last three to know what is in ALU, MEM and WB.
+#
+# Cycle counts are approximate: reset, peripherals and the fetch of flushed
+# instructions are not modelled.
+
+import argparse
+import json
+import sys
+
+from anem_opcodes import *
+from anem_sim import *
+
+##Register bank write controls, as in idecode.vhd
+RegNone  = 0b000
+RegALU   = 0b001
+RegLIU   = 0b010
+RegLIL   = 0b011
+RegMem   = 0b100
+RegJAL   = 0b101
+RegMFHI  = 0b110
+RegMFLO  = 0b111
+
+##Writes that can not be forwarded (NFW stall)
+RegNoForward = (RegLIU, RegLIL, RegJAL, RegMFHI, RegMFLO)
+
+##Stall types, checked in this order; a stall cycle is counted once
+StallTypes = ("lw", "sw", "nfw", "jr", "epc")
+
+##Hazard related fields of an instruction word
+class HazardInfo:
+
+    __slots__ = ('sela', 'selb', 'regctl', 'load', 'store', 'reads', 'jr', 'epcRead', 'epcWrite', 'branch')
+
+    def __init__(self, word):
+
+        opcode = word >> 12
+        m1op = (word >> 8) & 0xF
+        sub = (word >> 4) & 0xF
+        func = word & 0xF
+        m1 = opcode == ANEMOpcodeM1
+        m4 = m1 and m1op == ANEMFuncM4
+
+        #M3 and MFEPC/MFECA/MTEPC have the register in bits 3:0
+        if (m1 and m1op in ANEMFuncM3.values()) or \
+           (m4 and sub in (ANEMSubM4['MFEPC'], ANEMSubM4['MFECA'], ANEMSubM4['MTEPC'])):
+            self.sela = word & 0xF
+        else:
+            self.sela = (word >> 8) & 0xF
+        self.selb = (word >> 4) & 0xF
+
+        if m1 and m1op == ANEMFuncM3['MFHI']:
+            self.regctl = RegMFHI
+        elif m1 and m1op == ANEMFuncM3['MFLO']:
+            self.regctl = RegMFLO
+        elif m4 and sub in (ANEMSubM4['MFEPC'], ANEMSubM4['MFECA']):
+            self.regctl = RegALU
+        elif opcode == ANEMOpcodeL['LIU']:
+            self.regctl = RegLIU
+        elif opcode == ANEMOpcodeL['LIL']:
+            self.regctl = RegLIL
+        elif opcode in (ANEMOpcodeR, ANEMOpcodeS, ANEMOpcodeADDI):
+            self.regctl = RegALU
+        elif opcode == ANEMOpcodeSTK and func == ANEMFuncSTK['SPRD']:
+            self.regctl = RegALU
+        elif opcode == ANEMOpcodeSTK and func == ANEMFuncSTK['POP']:
+            self.regctl = RegMem
+        elif opcode == ANEMOpcodeW['LW']:
+            self.regctl = RegMem
+        elif opcode == ANEMOpcodeJ['JAL']:
+            self.regctl = RegJAL
+        else:
+            self.regctl = RegNone
+
+        stk = opcode == ANEMOpcodeSTK
+        self.load = opcode == ANEMOpcodeW['LW'] or (stk and func == ANEMFuncSTK['POP'])
+        self.store = opcode == ANEMOpcodeW['SW'] or (stk and func == ANEMFuncSTK['PUSH'])
+
+        #deny list of hazunit.vhd
+        self.reads = not (opcode in (ANEMOpcodeL['LIU'], ANEMOpcodeL['LIL'], ANEMOpcodeJ['J'],
+                                     ANEMOpcodeJ['JAL'], ANEMOpcodeJ['BHLEQ'], 0b1000, 0b1001, 0b1010) or
+                          (stk and func in (ANEMFuncSTK['POP'], ANEMFuncSTK['SPRD'])) or
+                          (m1 and m1op == ANEMFuncSYSCALL) or
+                          (m4 and sub != ANEMSubM4['MTEPC']))
+
+        self.jr = opcode == ANEMOpcodeW['JR']
+        self.epcRead = m4 and sub in (ANEMSubM4['RETI'], ANEMSubM4['MFEPC'])
+        self.epcWrite = m4 and sub == ANEMSubM4['MTEPC']
+        self.branch = opcode in (ANEMOpcodeJ['BHLEQ'], 0b1000, 0b1001, 0b1010)
+
+##Per address counters
+class AddrStats:
+
+    __slots__ = ('word', 'count', 'stalls', 'flushes', 'fwdALU', 'fwdMEM', 'dropped')
+
+    def __init__(self, word):
+
+        self.word = word
+        self.count = 0
+        self.stalls = dict((name, 0) for name in StallTypes)
+        self.flushes = 0
+        self.fwdALU = 0
+        self.fwdMEM = 0
+        self.dropped = 0
+
+    def Summary(self):
+        return { "word" : "%04x" % self.word,
+                 "count" : self.count,
+                 "stalls" : dict(self.stalls),
+                 "flushes" : self.flushes,
+                 "forward_alu_alu" : self.fwdALU,
+                 "forward_mem_alu" : self.fwdMEM,
+                 "dropped_branches" : self.dropped
+                 }
+
+class TimingModel:
+
+    ##@param sim Simulator with the program loaded
+    def __init__(self, sim):
+
+        self.sim = sim
+        self.addrs = {}
+        self.instructions = 0
+        self.lastExit = 0
+        ##(exit cycle, HazardInfo) of the last three instructions, newest last
+        self.recent = []
+        self.bubbles = 0
+        self.interrupts = 0
+        ##AddrStats of a taken branch waiting for its delay slot
+        self.branch = None
+
+        self.Instrument()
+
+    ##Wrap every decoded instruction of the simulator so it reports to the model
+    def Instrument(self):
+
+        sim = self.sim
+        for addr, word in sim.rom.items():
+            if word == SimHaltInstr:
+                continue
+            stats = AddrStats(word)
+            self.addrs[addr] = stats
+            info = HazardInfo(word)
+            sim.code[addr] = self.Wrap(sim.code[addr], stats, info)
+            sim.slotCode[addr] = self.Wrap(sim.slotCode[addr], stats, info)
+
+    def Wrap(self, op, stats, info):
+
+        issue = self.Issue
+        def timed():
+            t = op()
+            issue(stats, info, t)
+            return t
+
+        return timed
+
+    ##Account for one executed instruction
+    #@param stats AddrStats of its address
+    #@param info HazardInfo of its word
+    #@param t value returned by the simulator handler, not None for a taken control transfer
+    def Issue(self, stats, info, t):
+
+        stats.count += 1
+        self.instructions += 1
+        cycle = self.lastExit + 1 + self.bubbles
+        self.bubbles = 0
+        recent = self.recent
+
+        cycle, stalls = stallCycles(info, recent, cycle)
+        if stalls:
+            for stall in stalls:
+                stats.stalls[stall] += 1
+            #the ifetch ignores a branch resolved while ID stalls
+            if self.branch != None:
+                self.branch.dropped += 1
+
+        #the flushed fetch follows the delay slot
+        if self.branch != None:
+            self.bubbles += 1
+            self.branch = None
+
+        #forwarding happens when this instruction is in ALU, from MEM and WB
+        mem = wb = None
+        for exit, prod in recent:
+            if exit == cycle - 1:
+                mem = prod
+            elif exit == cycle - 2:
+                wb = prod
+        for sel in (info.sela, info.selb):
+            if sel == 0:
+                continue
+            if mem != None and mem.regctl == RegALU and mem.sela == sel:
+                stats.fwdALU += 1
+            elif wb != None and wb.regctl in (RegALU, RegMem) and wb.sela == sel:
+                stats.fwdMEM += 1
+
+        recent.append((cycle, info))
+        if len(recent) > 3:
+            del recent[0]
+        self.lastExit = cycle
+
+        #a taken BZ/BHLEQ flushes the instruction fetched after its delay slot, one bubble
+        #after the slot
+        if info.branch and t != None:
+            stats.flushes += 1
+            self.branch = stats
+
+        #an interrupt flushes the instruction in IF
+        if self.sim.interrupts != self.interrupts:
+            self.interrupts = self.sim.interrupts
+            self.bubbles += 1
+
+    ##Run the program
+    #@param maxSteps instruction limit
+    def Run(self, maxSteps=SimMaxSteps):
+        return self.sim.Run(maxSteps)
+
+    ##@return total cycles, including pipeline fill and drain
+    def Cycles(self):
+        return self.lastExit + 4 if self.instructions else 0
+
+    ##@return JSON serializable summary
+    def Summary(self):
+
+        cycles = self.Cycles()
+        stalls = dict((name, sum(s.stalls[name] for s in self.addrs.values())) for name in StallTypes)
+        return { "instructions" : self.instructions,
+                 "cycles" : cycles,
+                 "cpi" : cycles / self.instructions if self.instructions else None,
+                 "stalls" : stalls,
+                 "flushes" : sum(s.flushes for s in self.addrs.values()) + self.interrupts,
+                 "interrupts" : self.interrupts,
+                 "forward_alu_alu" : sum(s.fwdALU for s in self.addrs.values()),
+                 "forward_mem_alu" : sum(s.fwdMEM for s in self.addrs.values()),
+                 "dropped_branches" : sum(s.dropped for s in self.addrs.values()),
+                 "stop" : self.sim.stopReason,
+                 "addresses" : dict(("%04x" % addr, s.Summary()) for addr, s in sorted(self.addrs.items())
+                                    if s.count)
+                 }
+
+    ##Printable report
+    #@param top number of addresses to list, by stall and flush cycles
+    def Report(self, top=20):
+
+        summary = self.Summary()
+        out = ["%d instructions, %d cycles, CPI %.3f (%s)" % (summary["instructions"], summary["cycles"],
+                                                            summary["cpi"] or 0, summary["stop"]),
+               "stalls: " + ", ".join("%s %d" % (name, summary["stalls"][name]) for name in StallTypes),
+               "flushes: %d (%d interrupt), forwarding: ALU->ALU %d, MEM->ALU %d" %
+               (summary["flushes"], summary["interrupts"], summary["forward_alu_alu"], summary["forward_mem_alu"])]
+        if summary["dropped_branches"]:
+            out.append("warning: %d taken branch(es) resolved while the delay slot stalled, "
+                       "the pipeline does not take them" % summary["dropped_branches"])
+
+        def cost(item):
+            s = item[1]
+            return sum(s.stalls.values()) + s.flushes
+
+        busy = [item for item in self.addrs.items() if cost(item) or item[1].dropped]
+        busy.sort(key=lambda item: -cost(item))
+        if busy:
+            out.append("%-6s %-6s %10s " % ("addr", "word", "count") +
+                       " ".join("%8s" % name for name in StallTypes) +
+                       " %8s %8s %8s %8s" % ("flush", "fwdALU", "fwdMEM", "dropped"))
+        for addr, s in busy[:top]:
+            out.append("0x%04x %04x   %10d " % (addr, s.word, s.count) +
+                       " ".join("%8d" % s.stalls[name] for name in StallTypes) +
+                       " %8d %8d %8d %8d" % (s.flushes, s.fwdALU, s.fwdMEM, s.dropped))
+
+        return "\n".join(out)
+
+##Hold an instruction in ID until no hazard is left
+#@param info HazardInfo of the instruction
+#@param recent (cycle leaving ID, HazardInfo) of the previous instructions
+#@param cycle first cycle the instruction could leave ID
+#@return (cycle it leaves ID, stall type of every stall cycle)
+def stallCycles(info, recent, cycle):
+
+    stalls = []
+    while True:
+        alu = mem = wb = None
+        for exit, prod in recent:
+            if exit == cycle - 1:
+                alu = prod
+            elif exit == cycle - 2:
+                mem = prod
+            elif exit == cycle - 3:
+                wb = prod
+
+        stall = stallType(info, alu, mem, wb)
+        if stall == None:
+            return (cycle, stalls)
+
+        stalls.append(stall)
+        cycle += 1
+
+##Stall type for an instruction in ID, per hazunit.vhd
+#@param info HazardInfo of the instruction in ID
+#@param alu HazardInfo in ALU or None
+#@param mem HazardInfo in MEM or None
+#@param wb HazardInfo in WB or None
+#@return stall type or None
+def stallType(info, alu, mem, wb):
+
+    sels = (info.sela, info.selb)
+
+    #LW: load in ALU writing a register read by ID
+    if info.reads and alu != None and alu.load and alu.sela != 0 and alu.sela in sels:
+        return "lw"
+
+    #SW: store data register still being produced
+    if info.store and info.sela != 0:
+        for prod in (alu, mem, wb):
+            if prod != None and prod.regctl != RegNone and prod.sela == info.sela:
+                return "sw"
+
+    #NFW: data that does not go through the ALU path
+    if info.reads:
+        for prod in (alu, mem, wb):
+            if prod != None and prod.regctl in RegNoForward and prod.sela != 0 and prod.sela in sels:
+                return "nfw"
+
+    #JR reads its register in ID, WB is covered by the write-through bypass
+    if info.jr:
+        for prod in (alu, mem):
+            if prod != None and prod.regctl != RegNone and prod.sela != 0 and prod.sela == info.sela:
+                return "jr"
+
+    if info.epcRead:
+        for prod in (alu, mem):
+            if prod != None and prod.epcWrite:
+                return "epc"
+
+    return None
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="ANEM16 pipeline timing model")
+    parser.add_argument("filename", help="program, .contents.txt or .img")
+    parser.add_argument("-n", "--max-steps", type=int, default=SimMaxSteps, help="instruction limit")
+    parser.add_argument("--irq", type=int, action="append", default=[], metavar="STEP",
+                        help="assert the external interrupt after STEP instructions")
+    parser.add_argument("-t", "--top", type=int, default=20, help="addresses to list")
+    parser.add_argument("--json", metavar="FILE", help="write results as JSON")
+    args = parser.parse_args()
+
+    sim = Simulator()
+    sim.Load(args.filename)
+    for step in args.irq:
+        sim.Interrupt(step)
+
+    model = TimingModel(sim)
+    model.Run(args.max_steps)
+
+    print(model.Report(args.top))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(model.Summary(), f, indent=2)
+
+    if sim.stopReason == "unwritten":
+        sys.exit(1)
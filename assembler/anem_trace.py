@@ -0,0 +1,483 @@
+#coding=utf-8
+##@file anem_trace.py
+# @brief binary trace encoding with indexed random access
+# @since 10/17/2026
+#
+# Binary form of the trace format in tests/TRACE_FORMAT.md. Events are either
+# fixed 6-byte records, so event K sits at a computed offset, or varint records
+# with addresses delta coded against the previous access of the same kind. An
+# index of the byte offset of every IndexEvery-th event, with the MW and MR
+# counts before it, follows the records; deltas restart at every indexed event
+# so decoding can start there. PC events are delta coded like addresses, so a
+# straight run of fetches takes two bytes per event.
+
+import argparse
+import mmap
+import struct
+import sys
+
+##File magic and trailer magic
+BinMagic = b"A16B"
+BinIndexMagic = b"A16X"
+
+##Binary format version
+BinVersion = 1
+
+##Header flags
+BinFlagVarint = 0x01
+
+##Header: magic, version, flags, reserved, index interval, comment length
+BinHeader = struct.Struct("<4sBBHII")
+
+##Fixed record: kind, sub, a, b
+BinRecord = struct.Struct("<BBHH")
+
+##Index entry: byte offset, MW and MR events before it
+BinIndexEntry = struct.Struct("<QQQ")
+
+##Trailer: event count, index offset, magic
+BinTrailer = struct.Struct("<QQ4s")
+
+##Default events between index entries
+IndexEvery = 4096
+
+##Event kinds, text name -> code
+BinKinds = { "MW" : 1, "MR" : 2, "RF" : 3, "SR" : 4, "END" : 5, "PC" : 6 }
+BinKindNames = dict((code, name) for name, code in BinKinds.items())
+
+##SR names by sub field
+BinSRNames = ("HI", "LO")
+
+##Format an event as a text v1 line (without newline)
+#@param event (kind, a, b) tuple as returned by TraceReader
+def formatEvent(event):
+
+    kind, a, b = event
+    if kind == "MW" or kind == "MR":
+        return "%s %04x %04x" % (kind, a, b)
+    if kind == "RF":
+        return "RF %d %04x" % (a, b)
+    if kind == "SR":
+        return "SR %s %04x" % (a, b)
+    if kind == "PC":
+        return "PC %04x" % a
+    return "END %d" % a
+
+##Parse a text v1 line
+#@return (kind, a, b) tuple, None for comments and blank lines
+def parseEvent(line):
+
+    fields = line.split()
+    if not fields or fields[0][0] == '#':
+        return None
+
+    kind = fields[0]
+    if (kind == "MW" or kind == "MR") and len(fields) == 3:
+        return (kind, int(fields[1], 16), int(fields[2], 16))
+    if kind == "RF" and len(fields) == 3:
+        return (kind, int(fields[1]), int(fields[2], 16))
+    if kind == "SR" and len(fields) == 3 and fields[1] in BinSRNames:
+        return (kind, fields[1], int(fields[2], 16))
+    if kind == "END" and len(fields) == 2:
+        return (kind, int(fields[1]), None)
+    if kind == "PC" and len(fields) == 2:
+        return (kind, int(fields[1], 16), None)
+
+    raise ValueError("not a trace v1 event: %s" % line.strip())
+
+def putVarint(out, v):
+
+    while v > 0x7F:
+        out.append((v & 0x7F) | 0x80)
+        v >>= 7
+    out.append(v)
+
+##Binary trace writer
+#
+#Has the interface of anem_sim.TraceWriter, so the simulator can write binary
+#traces directly.
+class BinaryTraceWriter:
+
+    ##@param outFile file opened in binary mode
+    #@param memReads also write MR events
+    #@param varint use varint records
+    #@param indexEvery events between index entries
+    #@param fetches also write PC events
+    def __init__(self, outFile, memReads=False, varint=False, indexEvery=IndexEvery, fetches=False):
+
+        self.outFile = outFile
+        self.memReads = memReads
+        self.fetches = fetches
+        self.varint = varint
+        self.indexEvery = indexEvery
+        self.mwCount = 0
+        self.count = 0
+        ##events written by kind code
+        self.counts = [0]*(max(BinKinds.values()) + 1)
+        self.comments = []
+        self.index = []
+        self.buf = bytearray()
+        self.offset = None
+        ##previous address by kind code, for delta coding
+        self.prev = [0]*(max(BinKinds.values()) + 1)
+
+    ##Add comment lines, only before the first event
+    def Header(self, program, source="anem_sim (python)"):
+        self.Comment("# anem16-trace v1\n# Program: %s\n# Source: %s\n" % (program, source))
+
+    def Comment(self, text):
+
+        if self.offset != None:
+            raise ValueError("comments must come before the first event")
+        self.comments.append(text)
+
+    def Start(self):
+
+        comments = "".join(self.comments).encode()
+        self.outFile.write(BinHeader.pack(BinMagic, BinVersion, BinFlagVarint if self.varint else 0, 0,
+                                          self.indexEvery, len(comments)))
+        self.outFile.write(comments)
+        self.offset = BinHeader.size + len(comments)
+
+    ##Append one event
+    #@param code kind code
+    #@param sub RF index or SR name index
+    #@param a address, value or END count
+    #@param b data
+    def Event(self, code, sub, a, b):
+
+        if self.offset == None:
+            self.Start()
+
+        buf = self.buf
+        if self.count % self.indexEvery == 0:
+            self.index.append((self.offset + len(buf), self.counts[1], self.counts[2]))
+            self.prev = [0]*len(self.prev)
+
+        if not self.varint:
+            buf += BinRecord.pack(code, sub, a & 0xFFFF, b & 0xFFFF)
+        else:
+            buf.append(code | (sub << 3))
+            if code <= 2 or code == 6:
+                #zigzag of the 16-bit wrapped delta
+                d = ((a - self.prev[code] + 0x8000) & 0xFFFF) - 0x8000
+                self.prev[code] = a
+                putVarint(buf, d << 1 if d >= 0 else (-d << 1) - 1)
+                if code != 6:
+                    putVarint(buf, b)
+            else:
+                putVarint(buf, a | (b << 16) if code == 5 else b)
+
+        self.count += 1
+        self.counts[code] += 1
+        if len(buf) >= 0x10000:
+            self.Flush()
+
+    def Flush(self):
+
+        self.outFile.write(self.buf)
+        self.offset += len(self.buf)
+        self.buf = bytearray()
+
+    def MemWrite(self, addr, data):
+        self.Event(1, 0, addr, data)
+        self.mwCount += 1
+
+    def MemRead(self, addr, data):
+        self.Event(2, 0, addr, data)
+
+    def Fetch(self, addr):
+        self.Event(6, 0, addr, 0)
+
+    ##Write register dump, END and the index
+    def Finish(self, regs, hi, lo):
+
+        for n in range(16):
+            self.Event(3, n, 0, regs[n])
+        self.Event(4, 0, 0, hi)
+        self.Event(4, 1, 0, lo)
+        self.End(self.mwCount)
+
+    ##Write END and the index, for converters
+    def End(self, count):
+
+        #the END count may not fit a 16-bit field
+        self.Event(5, 0, count & 0xFFFF, count >> 16)
+        self.Close()
+
+    def Close(self):
+
+        if self.offset == None:
+            self.Start()
+        self.Flush()
+        for entry in self.index:
+            self.outFile.write(BinIndexEntry.pack(*entry))
+        self.outFile.write(BinTrailer.pack(self.count, self.offset, BinIndexMagic))
+
+##Binary trace reader
+#
+#The file is memory mapped; len() gives the event count and reader[k] the
+#event k as a (kind, a, b) tuple, see parseEvent.
+class TraceReader:
+
+    ##@param fileName binary trace
+    def __init__(self, fileName):
+
+        self.fileName = fileName
+        with open(fileName, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        m = self.map
+        if len(m) < BinHeader.size + BinTrailer.size:
+            raise ValueError("%s: not a binary trace" % fileName)
+        magic, version, flags, reserved, self.indexEvery, clen = BinHeader.unpack_from(m, 0)
+        if magic != BinMagic:
+            raise ValueError("%s: not a binary trace" % fileName)
+        if version != BinVersion:
+            raise ValueError("%s: unsupported binary trace version %d" % (fileName, version))
+        self.count, indexOffset, magic = BinTrailer.unpack_from(m, len(m) - BinTrailer.size)
+        if magic != BinIndexMagic:
+            raise ValueError("%s: binary trace is truncated" % fileName)
+
+        self.varint = bool(flags & BinFlagVarint)
+        self.comments = m[BinHeader.size:BinHeader.size + clen].decode()
+        self.start = BinHeader.size + clen
+        self.end = indexOffset
+        index = m[indexOffset:len(m) - BinTrailer.size]
+        if indexOffset < self.start or len(index) % BinIndexEntry.size:
+            raise ValueError("%s: bad binary trace index" % fileName)
+        ##(byte offset, MW before, MR before) of every indexEvery-th event
+        self.index = list(BinIndexEntry.iter_unpack(index))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, k):
+
+        if k < 0:
+            k += self.count
+        if not 0 <= k < self.count:
+            raise IndexError("event %d out of range" % k)
+        return next(self.Events(k))
+
+    def Close(self):
+        self.map.close()
+
+    ##Iterate events
+    #@param first first event number
+    #@return generator of (kind, a, b)
+    def Events(self, first=0):
+
+        for code, sub, a, b in self.Records(first):
+            yield makeEvent(code, sub, a, b)
+
+    ##Iterate raw records, cheaper than Events when only comparing
+    #@param first first event number
+    #@return generator of (kind code, sub, a, b)
+    def Records(self, first=0):
+
+        if first >= self.count:
+            return iter(())
+        if not self.varint:
+            return self.FixedRecords(first)
+
+        return self.VarintRecords(first)
+
+    def FixedRecords(self, first):
+
+        m = self.map
+        step = BinRecord.size*0x10000
+        end = self.start + self.count*BinRecord.size
+        for pos in range(self.start + first*BinRecord.size, end, step):
+            yield from BinRecord.iter_unpack(m[pos:min(pos + step, end)])
+
+    def VarintRecords(self, first):
+
+        m = self.map
+        every = self.indexEvery
+        block = first // every
+        pos = self.index[block][0]
+        k = block*every
+        prev = [0]*(max(BinKinds.values()) + 1)
+        while k < self.count:
+            if k % every == 0:
+                prev = [0]*len(prev)
+            head = m[pos]
+            pos += 1
+            code = head & 0x07
+
+            values = []
+            for n in range(2 if code <= 2 else 1):
+                v = m[pos]
+                pos += 1
+                if v & 0x80:
+                    v &= 0x7F
+                    shift = 7
+                    while True:
+                        c = m[pos]
+                        pos += 1
+                        v |= (c & 0x7F) << shift
+                        shift += 7
+                        if c < 0x80:
+                            break
+                values.append(v)
+
+            if code <= 2 or code == 6:
+                d = values[0]
+                d = -(d >> 1) - 1 if d & 1 else d >> 1
+                a = (prev[code] + d) & 0xFFFF
+                prev[code] = a
+                record = (code, 0, a, values[1] if code != 6 else 0)
+            elif code == 5:
+                record = (code, 0, values[0], 0)
+            else:
+                record = (code, head >> 3, 0, values[0])
+
+            if k >= first:
+                yield record
+            k += 1
+
+##Events at the start of two traces known to be identical
+#
+#Compares the encoded bytes between index entries, so it only works on traces
+#with the same encoding and index interval and has index granularity.
+#@param a TraceReader
+#@param b TraceReader
+#@return event count, a multiple of the index interval unless the traces are identical
+def commonPrefix(a, b):
+
+    if a.varint != b.varint or a.indexEvery != b.indexEvery:
+        return 0
+
+    ma = memoryview(a.map)
+    mb = memoryview(b.map)
+    try:
+        for j in range(min(len(a.index), len(b.index))):
+            ea = a.index[j+1][0] if j + 1 < len(a.index) else a.end
+            eb = b.index[j+1][0] if j + 1 < len(b.index) else b.end
+            if ma[a.index[j][0]:ea] != mb[b.index[j][0]:eb]:
+                return j*a.indexEvery
+    finally:
+        ma.release()
+        mb.release()
+
+    return min(a.count, b.count)
+
+##Build an event tuple from record fields
+def makeEvent(code, sub, a, b):
+
+    kind = BinKindNames.get(code)
+    if kind == "MW" or kind == "MR":
+        return (kind, a, b)
+    if kind == "RF":
+        return (kind, sub, b)
+    if kind == "SR":
+        return (kind, BinSRNames[sub], b)
+    if kind == "END":
+        return (kind, a | (b << 16), None)
+    if kind == "PC":
+        return (kind, a, None)
+
+    raise ValueError("bad event kind %d" % code)
+
+##Check for the binary trace magic
+def isBinaryTrace(fileName):
+
+    with open(fileName, "rb") as f:
+        return f.read(len(BinMagic)) == BinMagic
+
+##Convert a text v1 trace to binary
+#@param textName input trace
+#@param binName output file
+#@param varint use varint records
+#@param indexEvery events between index entries
+#@return event count
+def textToBinary(textName, binName, varint=False, indexEvery=IndexEvery):
+
+    with open(textName) as f, open(binName, "wb") as out:
+        writer = BinaryTraceWriter(out, varint=varint, indexEvery=indexEvery)
+        ended = False
+        for lineno, line in enumerate(f, 1):
+            try:
+                event = parseEvent(line)
+            except ValueError as e:
+                raise ValueError("%s:%d: %s" % (textName, lineno, e))
+
+            if event == None:
+                #comments after the first event are not kept
+                if writer.offset == None and line.strip():
+                    writer.Comment(line if line.endswith("\n") else line + "\n")
+                continue
+
+            kind, a, b = event
+            if kind == "END":
+                writer.End(a)
+                ended = True
+                break
+            if kind == "SR":
+                a = BinSRNames.index(a)
+            writer.Event(BinKinds[kind], a if kind in ("RF", "SR") else 0,
+                         a if kind in ("MW", "MR", "PC") else 0, b if b != None else 0)
+        if not ended:
+            writer.Close()
+
+        return writer.count
+
+##Convert a binary trace to text v1
+#@param binName input trace
+#@param outFile text file object
+#@param first first event
+#@param count events to write, None for all
+def binaryToText(binName, outFile, first=0, count=None):
+
+    reader = TraceReader(binName)
+    try:
+        if first == 0:
+            outFile.write(reader.comments)
+        for n, event in enumerate(reader.Events(first)):
+            if count != None and n >= count:
+                break
+            outFile.write(formatEvent(event) + "\n")
+    finally:
+        reader.Close()
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="ANEM16 binary trace converter")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("encode", help="text trace to binary")
+    p.add_argument("input")
+    p.add_argument("output")
+    p.add_argument("--varint", action="store_true", help="varint records, delta coded addresses")
+    p.add_argument("--index", type=int, default=IndexEvery, help="events between index entries")
+    p = sub.add_parser("decode", help="binary trace to text")
+    p.add_argument("input")
+    p.add_argument("output", nargs="?", help="default is standard output")
+    p = sub.add_parser("show", help="print events starting at event K")
+    p.add_argument("input")
+    p.add_argument("first", type=int, metavar="K")
+    p.add_argument("-c", "--count", type=int, default=1, help="events to print")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "encode":
+            count = textToBinary(args.input, args.output, args.varint, args.index)
+            sys.stderr.write("%s: %d events\n" % (args.output, count))
+        elif args.command == "decode":
+            if args.output:
+                with open(args.output, "w") as f:
+                    binaryToText(args.input, f)
+            else:
+                binaryToText(args.input, sys.stdout)
+        elif args.command == "show":
+            reader = TraceReader(args.input)
+            for n, event in enumerate(reader.Events(args.first)):
+                if n >= args.count:
+                    break
+                print("%d %s" % (args.first + n, formatEvent(event)))
+            reader.Close()
+        else:
+            parser.print_help()
+    except (ValueError, IOError) as e:
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
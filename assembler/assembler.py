@@ -4,42 +4,54 @@
 # @author Bruno Morais <brunosmmm@gmail.com>
 # @since 11/14/2014
 
-import re
+import argparse
+import concurrent.futures
+import cProfile
+import glob
+import os
+import pstats
 import sys
+from array import array
+from collections import defaultdict
 from anem_opcodes import *
 from anem_regex import *
+from anem_msg import *
+from anem_records import *
+from anem_pseudo import *
+from anem_cache import AsmCache
+from anem_stream import assembleStream
+from anem_stats import AsmStats
+from anem_hazard import analyzeHazards
+from anem_sched import scheduleLines
+from anem_relax import relaxJumps, cleanLayout
+from anem_link import writeObject
+
+
+##Make instruction fields
+#@param i integer value, negative values are two's complemented
+#@param size field width in bits
+def makeField(i,size):
+
+    if i < 0:
+        i += 1 << size
+
+    if i < 0 or i >> size:
+        raise ValueError("number already bigger than desired size, maybe invalid register?")
 
+    return i
 
-##Verbose level
-class AsmMsgType:
-
-    AsmMsgError   = 0
-    AsmMsgWarning = 1
-    AsmMsgInfo    = 2
-    AsmMsgDebug   = 3
-
-class MsgColors:
-
-    red = '\033[31m'
-    green = '\033[32m'
-    yellow = '\033[33m'
-    cyan = '\033[36m'
-    nocolor = ''
-    end = '\033[0m'
+##Data bytes per Intel HEX record
+IHexRecordSize = 16
 
-##Message type self.CleanOut color
-MsgTypeOut = {AsmMsgType.AsmMsgError   : MsgColors.red,
-              AsmMsgType.AsmMsgWarning : MsgColors.yellow,
-              AsmMsgType.AsmMsgInfo    : MsgColors.nocolor,
-              AsmMsgType.AsmMsgDebug   : MsgColors.cyan
-              }
+##Make Intel HEX record
+#@param addr 16-bit record address
+#@param rtype record type
+#@param data record data bytes
+#@return record line
+def makeIHexRecord(addr, rtype, data):
 
-##Colored console self.CleanOut
-def colorize(text, color):
-    if color == MsgColors.nocolor:
-        return text
-    else:
-        return color + text + MsgColors.end
+    record = bytes([len(data), addr >> 8, addr & 0xFF, rtype]) + data
+    return ":%s%02X\n" % (record.hex().upper(), -sum(record) & 0xFF)
 
 ##Make binary strings
 def makeBinStr(i,size):
@@ -63,6 +75,10 @@ class Assembler:
     AsmFatalError = False
     ##verbosity
     Verbosity = 2
+    ##instruction class statistics (AsmStats), None disables counting
+    Stats = None
+    ##AsmDiagnostic list to collect messages instead of printing them, None prints
+    Diagnostics = None
 
     ##Print out assembler messages
     #@param msg string
@@ -70,6 +86,9 @@ class Assembler:
     #@return fatal error occurred or not
     def Message(self,msg,msgType):
 
+        if self.Diagnostics != None:
+            return self.Collect(msg,msgType)
+
         fatal = False
 
         if msgType == AsmMsgType.AsmMsgError:
@@ -96,13 +115,30 @@ class Assembler:
 
         return fatal
 
+    ##Record a message in Diagnostics
+    #
+    #Errors and warnings are always kept, info and debug messages depend on
+    #the verbosity.
+    #@return False, fatal errors raise AsmError
+    def Collect(self,msg,msgType):
+
+        if msgType == AsmMsgType.AsmMsgError:
+            self.AsmErrorCount += 1
+        elif msgType == AsmMsgType.AsmMsgWarning:
+            self.AsmWarnCount += 1
+
+        if msgType <= max(self.Verbosity, AsmMsgType.AsmMsgWarning):
+            self.Diagnostics.append(AsmDiagnostic(msgType,msg))
+
+        if msgType == AsmMsgType.AsmMsgError and self.AsmFatalError == True:
+            raise AsmError(msg,self.Diagnostics)
+
+        return False
+
     ##Output messages when done
     def Done(self):
 
-        print(str(self.AsmErrorCount)+
-              colorize(" error(s) ",MsgTypeOut[AsmMsgType.AsmMsgError])+
-              str(self.AsmWarnCount)+
-              colorize(" warning(s) ",MsgTypeOut[AsmMsgType.AsmMsgWarning]))
+        print(formatCounts(self.AsmErrorCount, self.AsmWarnCount))
 
     ##Output messages on init
     def Init(self):
@@ -110,109 +146,75 @@ class Assembler:
         print(colorize("ANEM Assembler",MsgColors.green))
 
     def Clean(self, lines):
-        nline = 0
         self.CleanOut = []
+        self.CleanLines(lines, 0)
+
+    ##Clean a run of source lines, appending to CleanOut
+    #@param lines source lines
+    #@param nline line number before the first line
+    def CleanLines(self, lines, nline):
+        self.CleanOut.extend(self.CleanIter(lines, nline))
+
+    ##Clean source lines as they are read
+    #@param lines iterable of source lines
+    #@param nline line number before the first line
+    #@return generator of CleanLine
+    def CleanIter(self, lines, nline=0):
         for line in lines:
             nline = nline + 1
             upLine = line.upper()
             upLine = upLine.strip()
-            upLine = COMM.sub('',upLine)         #Comments are ignored!
-            upLine = NOP.sub("ADD $0,$0",upLine) #Substitute NOP
-
-            label = None
-            if re.match(r".*:\s+LIW.*",upLine) != None:
-                #Cannot substitute LIW when there is a label
-                self.Message("Line %d: label followed by LIW" % nline,AsmMsgType.AsmMsgDebug)
-                label,upLine = upLine.split(':')
-                upLine = upLine.strip()
-                self.CleanOut.append([nline,label+':'])
-
-            #LIW replace
-            m = LIWb.match(upLine)
-            if m != None:
-                #binary value
-                self.CleanOut.append([nline,"LIU $%s, %d" % (m.group(1),int(m.group(2),2)//256)])
-                self.CleanOut.append([nline,"LIL $%s, %d" % (m.group(1),int(m.group(2),2)%256)])
-                self.CleanOut.append([nline,"ADD $0,$0"]) #this is a NOP after LIL
-                ##@todo verify this, was a hack for non-pipelined version
-
-                continue
-
-            m = LIWh.match(upLine)
-            if m != None:
-                #hexadecimal
-                self.CleanOut.append([nline,"LIU $%s, %d" % (m.group(1),int(m.group(2),16)//256)])
-                self.CleanOut.append([nline,"LIL $%s, %d" % (m.group(1),int(m.group(2),16)%256)])
-                self.CleanOut.append([nline,"ADD $0,$0"])
-
-                continue
-
-            m = LIWd.match(upLine)
-            if m != None:
-                #decimal
-
-                #hack for llvm pass
-                if int(m.group(2)) > 0xFFFF:
-                    data = int(m.group(2)) >> 8
-                else:
-                    data = int(m.group(2))
-
-                self.CleanOut.append([nline,"LIU $%s, %d" % (m.group(1),data//256)])
-                self.CleanOut.append([nline,"LIL $%s, %d" % (m.group(1),data%256)])
-                self.CleanOut.append([nline,"ADD $0,$0"])
-
-                continue
-
-            #replace MOVE
-            m = MOVE.match(upLine)
-            if m != None:
-                self.CleanOut.append([nline,"AND $%s, $0" % m.group(1)])
-                self.CleanOut.append([nline,"OR  $%s, $%s" % (m.group(1),m.group(2))])
+            if '--' in upLine:
+                upLine = COMM.sub('',upLine)     #Comments are ignored!
 
-                continue
-
-            #replace LHI & LLO
-
-            #hex
-            m = L_HILOh.match(upLine)
-            if m != None:
-                if m.group(1) == "LHI":
-                    self.CleanOut.append([nline,"LHH %d" % (int(m.group(2),16)//256)])
-                    self.CleanOut.append([nline,"LHL %d" % (int(m.group(2),16)%256)])
-                elif m.group(1) == "LLO":
-                    self.CleanOut.append([nline,"LLH %d" % (int(m.group(2),16)//256)])
-                    self.CleanOut.append([nline,"LLL %d" % (int(m.group(2),16)%256)])
-
-                continue
-            #decimal
-            m = L_HILOd.match(upLine)
-            if m != None:
-                if m.group(1) == "LHI":
-                    self.CleanOut.append([nline,"LHH %d" % (int(m.group(2))//256)])
-                    self.CleanOut.append([nline,"LHL %d" % (int(m.group(2))%256)])
-                elif m.group(1) == "LLO":
-                    self.CleanOut.append([nline,"LLH %d" % (int(m.group(2))//256)])
-                    self.CleanOut.append([nline,"LLL %d" % (int(m.group(2))%256)])
+            #pseudo-instructions, a normal line costs one lookup
+            expanded = expandPseudo(upLine)
+            if expanded != None:
+                prefix,out = expanded
+                try:
+                    out = expandAgain(out)
+                except ValueError as e:
+                    self.Message("Line %d: %s" % (nline, e), AsmMsgType.AsmMsgError)
+                    continue
+                if len(out) == 1:
+                    yield CleanLine(nline,prefix+out[0])
+                    continue
 
-                continue
+                if prefix != '':
+                    #label goes on its own line before a multi-line expansion
+                    self.Message("Line %d: label followed by pseudo-instruction" % nline,AsmMsgType.AsmMsgDebug)
+                    yield CleanLine(nline,prefix.strip())
 
-            #replace MADD
-            m = MADD.match(upLine)
-            if m != None:
-                self.CleanOut.append([nline,"MUL $%s, $%s" % (m.group(1),m.group(2))])
-                self.CleanOut.append([nline,"AIS %d" % (int(m.group(3)))])
+                for instr in out:
+                    yield CleanLine(nline,instr)
 
                 continue
 
             if upLine != '':
-                self.CleanOut.append([nline,upLine])
+                yield CleanLine(nline,upLine)
 
     def Index(self):
-        index = 0
         self.labels = {}
         self.code = []
+        self.IndexLines(self.CleanOut, 0)
+
+    ##Index a run of clean lines, appending to code and labels
+    #@param lines clean lines
+    #@param index address of the first instruction
+    #@return address after the last instruction
+    def IndexLines(self, lines, index):
+        self.code.extend(self.IndexIter(lines, index))
+        return self.indexEnd
+
+    ##Index clean lines as they are produced, labels are updated on the way
+    #@param lines iterable of clean lines
+    #@param index address of the first instruction
+    #@return generator of Instr, indexEnd is set when done
+    def IndexIter(self, lines, index=0):
         iline = ''
-        for nline,line in self.CleanOut:
+        for entry in lines:
+            nline = entry.nline
+            line = entry.line
 
             #constant handling
             if CONST.match(line) != None:
@@ -254,64 +256,81 @@ class Assembler:
                     self.labels[label.strip()] = index
 
                 if iline != '':
-                    self.code.append([index,nline,iline.strip()])
+                    yield Instr(index,nline,iline.strip())
                     index = index + 1
 
+        self.indexEnd = index
+
+    ##Reorder CleanOut and drop NOPs to avoid stalls (anem_sched)
+    #@return SchedReport
+    def Schedule(self):
+
+        self.CleanOut, report = scheduleLines(self.CleanOut, shapeWord)
+        self.Message("Scheduled: %d NOPs removed, %d blocks reordered, about %d -> %d stall cycles" %
+                     (report.nopsRemoved, report.blocksReordered, report.stallsBefore, report.stallsAfter),
+                     AsmMsgType.AsmMsgInfo)
+        return report
+
+    ##Send out-of-range jumps through trampolines (anem_relax), after Index
+    #@param local only relax jumps within a section, for objects
+    #@return RelaxReport, errors are reported as messages
+    def Relax(self, local=False):
+
+        self.codeLabels, self.pinned = cleanLayout(self.CleanOut)
+        report = relaxJumps(self.code, self.labels, self.codeLabels, self.pinned, local)
+        for msg in report.errors:
+            self.Message(msg, AsmMsgType.AsmMsgError)
+        if report.relaxed:
+            self.Message("%d out-of-range jumps relaxed through %d trampolines (%d rounds)" %
+                         (report.relaxed, report.trampolines, report.rounds), AsmMsgType.AsmMsgInfo)
+        return report
+
     ##Make R type instructions
     def makeRInstr(self,func,ra,rb):
-        return ANEMOpcodeR+makeBinStr(int(ra),4)+makeBinStr(int(rb),4)+ANEMFuncR[func]
+        return (ANEMOpcodeR << 12) | (makeField(int(ra),4) << 8) | (makeField(int(rb),4) << 4) | ANEMFuncR[func]
 
     ##Make S type instructions
     def makeSInstr(self,func,ra,shamt):
-        return ANEMOpcodeS+makeBinStr(int(ra),4)+makeBinStr(int(shamt),4)+ANEMFuncS[func]
+        return (ANEMOpcodeS << 12) | (makeField(int(ra),4) << 8) | (makeField(int(shamt),4) << 4) | ANEMFuncS[func]
 
     ##@todo make this right
     def makeLInstr(self,instr,ra,byte):
 
-        u = re.match(r"%(\w+)%U",byte)
-        l = re.match(r"%(\w+)%L",byte)
-        x = re.match(r"%(\w+)%",byte)
-        h = re.match(r"0[xX]([a-fA-F0-9]+)",byte)
-        d = re.match(r"[+-]?\d+",byte)
+        u = LBYTEu.match(byte)
+        l = LBYTEl.match(byte)
+        x = LBYTEx.match(byte)
+        h = LBYTEh.match(byte)
+        d = LBYTEd.match(byte)
 
         if u != None:
-            out = makeBinStr(int(self.labels[u.group(1)])//256,8)
+            out = makeField(int(self.labels[u.group(1)])//256,8)
         elif l != None:
-            out = makeBinStr(int(self.labels[l.group(1)])%256,8)
+            out = makeField(int(self.labels[l.group(1)])%256,8)
         elif h != None:
-            out = makeBinStr(int(byte,16),8)
+            out = makeField(int(byte,16),8)
         elif d != None:
-            out = makeBinStr(int(byte),8)
+            out = makeField(int(byte),8)
         elif x != None:
-            out = makeBinStr(int(self.labels[byte]),8)
+            out = makeField(int(self.labels[x.group(1)]),8)
         else:
             raise ValueError("malformed instruction")
 
-        return ANEMOpcodeL[instr]+makeBinStr(int(ra),4)+out
+        return (ANEMOpcodeL[instr] << 12) | (makeField(int(ra),4) << 8) | out
 
     def makeJInstr(self, jtype, addr, cur_index,jpred=None):
 
-        d = re.match(r"[0-9]+", addr)
-        l = re.match(r"%(\w+)%", addr)
+        d = JADDRd.match(addr)
+        l = JADDRl.match(addr)
 
         if d != None:
-            out = makeBinStr(int(addr), 12)
+            out = makeField(int(addr), 12)
         elif l != None:
 
             #this will not work!! re-write for predicate
             if jtype == 'BZ' or jtype == 'BHLEQ':
                 off_dec = int(self.labels[l.group(1)])-int(cur_index)-2
-                if jpred == 'T':
-                    predicate = '01'
-                elif jpred == 'N':
-                    predicate = '10'
-                else:
-                    predicate = '00'
-                if jtype == 'BZ':
-                    out = predicate+makeBinStr(off_dec, 12)
-                else:
-                    out = makeBinStr(off_dec,12)
-                self.Message("BZ jump offset is %d (0b%s)" % (int(off_dec), out), AsmMsgType.AsmMsgDebug)
+                out = makeField(off_dec,12)
+                self.Message("BZ jump offset is %d (0b%s)" % (int(off_dec), makeBinStr(out,12)), AsmMsgType.AsmMsgDebug)
                 if off_dec > 2047 or off_dec < -2048:
                 #impossible BZ
                     self.AsmFatalError = True
@@ -320,211 +339,540 @@ class Assembler:
                 offset = int(self.labels[l.group(1)]) - int(cur_index) - 1
 
                 if offset > 2047 or offset < -2048:
-                    #impossible jump
-                    ##@todo look into generating intermediate jumps
+                    #impossible jump, anem_relax adds trampolines before this except when streaming
                     self.AsmFatalError = True
                     self.Message("INST %d: J cannot jump to label" % (cur_index), AsmMsgType.AsmMsgError)
                 else:
-                    out = makeBinStr(offset, 12) #relative jump
+                    out = makeField(offset, 12) #relative jump
         else:
             raise ValueError("malformed instruction")
 
-        return ANEMOpcodeJ[jtype]+out
+        if jtype == 'BZ':
+            return (ANEMOpcodeJ[jtype] << 14) | (ANEMPredBZ.get(jpred,0) << 12) | out
+
+        return (ANEMOpcodeJ[jtype] << 12) | out
 
     def makeWInstr(self,instr,ra,rb,offset,index):
 
-        o = re.match(r"%(\w+)%",offset)
-        d = re.match(r"\d+",offset)
+        d = WOFFd.match(offset)
         if d != None:
-            out = makeBinStr(int(offset),4)
-        #elif o != None:
-        #    out = makeBinStr(off_dec,4)
+            out = makeField(int(offset),4)
         else:
             raise ValueError("BZ offset error")
 
-        return ANEMOpcodeW[instr]+makeBinStr(int(ra),4)+makeBinStr(int(rb),4)+out
+        return (ANEMOpcodeW[instr] << 12) | (makeField(int(ra),4) << 8) | (makeField(int(rb),4) << 4) | out
 
 
     def makeM1Instr(self,mop,data):
 
-        return ANEMOpcodeM1+ANEMFuncM1[mop] + makeBinStr(int(data),8)
+        return (ANEMOpcodeM1 << 12) | (ANEMFuncM1[mop] << 8) | makeField(int(data),8)
 
     def makeM3Instr(self,mop, reg):
 
-        return ANEMOpcodeM1+ANEMFuncM3[mop] + makeBinStr(0,4)+ makeBinStr(int(reg),4)
+        return (ANEMOpcodeM1 << 12) | (ANEMFuncM3[mop] << 8) | makeField(int(reg),4)
 
     def makeSTKInstr(self, sop, reg):
-        return ANEMOpcodeSTK+makeBinStr(int(reg),4)+makeBinStr(0,4)+ANEMFuncSTK[sop]
+        return (ANEMOpcodeSTK << 12) | (makeField(int(reg),4) << 8) | ANEMFuncSTK[sop]
 
     def makeADDIInstr(self, reg, imm):
-        return ANEMOpcodeADDI+makeBinStr(int(reg),4)+makeBinStr(int(imm),8)
+        return (ANEMOpcodeADDI << 12) | (makeField(int(reg),4) << 8) | makeField(int(imm),8)
 
     def makeSYSCALLInstr(self, svc_num):
-        return ANEMOpcodeM1+ANEMFuncSYSCALL+makeBinStr(int(svc_num),8)
+        return (ANEMOpcodeM1 << 12) | (ANEMFuncSYSCALL << 8) | makeField(int(svc_num),8)
 
     def makeM4Instr(self, mop, reg=0):
-        return ANEMOpcodeM1+ANEMFuncM4+ANEMSubM4[mop]+makeBinStr(int(reg),4)
+        return (ANEMOpcodeM1 << 12) | (ANEMFuncM4 << 8) | (ANEMSubM4[mop] << 4) | makeField(int(reg),4)
 
     def Assemble(self):
 
-        self.binCode = []
-        for index,nline,line in self.code:
+        #addresses and encoded words are kept as parallel 16-bit arrays,
+        #rendering to text only happens when writing output files
+        self.binAddr = array('H')
+        self.binWords = array('H')
+        for instr in self.code:
+            try:
+                word = self.Encode(instr.index,instr.nline,instr.line)
+            except KeyError as e:
+                self.Message("Line %d: undefined label %s" % (instr.nline, e), AsmMsgType.AsmMsgError)
+                continue
+            except ValueError as e:
+                self.Message("Line %d: %s: %s" % (instr.nline, e, instr.line), AsmMsgType.AsmMsgError)
+                continue
+            if word != None:
+                self.binWords.append(word)
+                self.binAddr.append(instr.index)
+
+    ##Encode one instruction
+    #@return encoded word or None if the instruction is invalid
+    def Encode(self, index, nline, line):
+
+        #dispatch on the mnemonic, each line is matched against one regex only
+        try:
+            regex,encode,iclass = InstrDispatch[line.split(None,1)[0]]
+        except (IndexError,KeyError):
+            regex = None
+
+        if regex != None:
+            m = regex.match(line)
+            if m != None:
+                #forward references fail here in streaming mode and are encoded again, count once
+                word = encode(self,m,index)
+                if self.Stats != None:
+                    self.Stats.Hit(iclass)
+                return word
+
+        ##@todo make floating point supported
+        #m = typeF.match(line)
+
+        self.Message("Line %d: unsupported or malformed instruction: %s" % (nline, line), AsmMsgType.AsmMsgError)
+        return None
+
+    ##Run the static hazard analysis (anem_hazard), after Assemble
+    #@return HazardReport, dropped branches are reported as warnings
+    def Hazards(self):
+
+        report = analyzeHazards(self)
+        for branch, site in report.dropped:
+            self.Message("Line %d: delay slot of %s stalls (%s), the pipeline will not take the branch" %
+                         (branch.nline, branch.line, ", ".join(sorted(set(site.stalls)))), AsmMsgType.AsmMsgWarning)
+        return report
+
+    def WriteClean(self, filename):
+        """Write .clean file, source line number and cleaned line."""
+        with open(filename, "w") as f:
+            f.write("".join("%d\t%s\n" % (entry.nline, entry.line) for entry in self.CleanOut))
 
+    def WriteIndex(self, filename):
+        """Write .ind file, labels then address, source line and instruction."""
+        with open(filename, "w") as f:
+            f.write(".LABELS\n")
+            f.write("".join("%s\t%s\n" % (label, self.labels[label]) for label in self.labels.keys()))
+            f.write(".CODE\n")
+            f.write("".join("%d\t%d\t%s\n" % (instr.index, instr.nline, instr.line) for instr in self.code))
 
-            m = typeR.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeRInstr(m.group(1),m.group(3),m.group(4))])
-                continue
+    def WriteSymbols(self, filename):
+        """Write .sym file, label and address."""
+        with open(filename, "w") as f:
+            f.write("".join("%s\t%s\n" % (label, self.labels[label]) for label in self.labels.keys()))
 
-            m = typeS.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeSInstr(m.group(1),m.group(3),m.group(4))])
-                continue
+    def WriteBin(self, filename):
+        """Write .bin file, one binary word per line."""
+        with open(filename, "w") as f:
+            f.write("".join(map("{:016b}\n".format, self.binWords)))
 
-            m = typeL.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeLInstr(m.group(1),m.group(2),m.group(3))])
-                continue
+    def WriteContents(self, filename):
+        """Write contents.txt for VHDL progmem simulation."""
+        with open(filename, "w") as f:
+            f.write("".join(map("{:016b} {:016b}\n".format, self.binAddr, self.binWords)))
+
+    ##Contiguous runs of assembled words
+    #@return list of (start address, array of words), in address order
+    def Segments(self):
+
+        #later words at the same address win, as in progmem
+        image = dict(zip(self.binAddr, self.binWords))
+        segments = []
+        for addr in sorted(image.keys()):
+            if segments and segments[-1][0] + len(segments[-1][1]) == addr:
+                segments[-1][1].append(image[addr])
+            else:
+                segments.append((addr, array('H', [image[addr]])))
+
+        return segments
+
+    def WriteImage(self, filename):
+        """Write packed big-endian raw image, gaps filled with zeros."""
+        image = array('H', bytes(2*(max(self.binAddr)+1) if self.binAddr else 0))
+        for addr, words in self.Segments():
+            image[addr:addr+len(words)] = words
+        if sys.byteorder == 'little':
+            image.byteswap()
+        with open(filename, "wb") as f:
+            f.write(image.tobytes())
+
+    def WriteMem(self, filename):
+        """Write hex-per-line memory init file ($readmemh style)."""
+        out = []
+        for addr, words in self.Segments():
+            out.append("@%04x\n" % addr)
+            out.extend(map("{:04x}\n".format, words))
+        with open(filename, "w") as f:
+            f.write("".join(out))
+
+    def WriteIHex(self, filename):
+        """Write Intel HEX file, byte addressed and big-endian."""
+        out = []
+        upper = 0
+        for addr, words in self.Segments():
+            if sys.byteorder == 'little':
+                words = array('H', words)
+                words.byteswap()
+            data = words.tobytes()
+            start = addr*2
+            pos = 0
+            while pos < len(data):
+                byteaddr = start + pos
+                if byteaddr >> 16 != upper:
+                    upper = byteaddr >> 16
+                    out.append(makeIHexRecord(0, 0x04, bytes([upper >> 8, upper & 0xFF])))
+                #records never cross a 64k boundary
+                count = min(IHexRecordSize, len(data) - pos, 0x10000 - (byteaddr & 0xFFFF))
+                out.append(makeIHexRecord(byteaddr & 0xFFFF, 0x00, data[pos:pos+count]))
+                pos += count
+        out.append(makeIHexRecord(0, 0x01, b''))
+        with open(filename, "w") as f:
+            f.write("".join(out))
 
-            m = typeJ.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeJInstr(m.group(1),m.group(3),index)])
-                continue
+##Build instruction dispatch table from the opcode tables
+#@return dictionary mnemonic -> (regex, encoder, instruction class)
+def makeDispatch():
 
-            m = typeW.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeWInstr(m.group(1),m.group(2),m.group(4),m.group(3),index)])
-                continue
+    table = {}
 
-            ##@todo this REGEX is probably wrong, verify
-            m = typeBZ.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeJInstr(m.group(1),m.group(2),index,m.group(3))])
-                continue
+    for mnemonic in ANEMFuncR.keys():
+        table[mnemonic] = (typeR, lambda asm,m,index: asm.makeRInstr(m.group(1),m.group(3),m.group(4)), 'R')
 
-            m = typeJR.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeWInstr(m.group(1),m.group(2),'0','0',index)])
-                continue
+    for mnemonic in ANEMFuncS.keys():
+        table[mnemonic] = (typeS, lambda asm,m,index: asm.makeSInstr(m.group(1),m.group(3),m.group(4)), 'S')
 
-            m = typeHAB.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),"1111000000000000"])
-                continue
+    for mnemonic in ANEMOpcodeL.keys():
+        table[mnemonic] = (typeL, lambda asm,m,index: asm.makeLInstr(m.group(1),m.group(2),m.group(3)), 'L')
 
-            m = typeM1.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeM1Instr(m.group(1),m.group(2))])
-                continue
+    for mnemonic in ('J','JAL'):
+        table[mnemonic] = (typeJ, lambda asm,m,index: asm.makeJInstr(m.group(1),m.group(3),index), 'J')
 
-            m = typeM2.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeJInstr(m.group(1),m.group(2),index)])
-                continue
+    ##@todo this REGEX is probably wrong, verify
+    table['BZ'] = (typeBZ, lambda asm,m,index: asm.makeJInstr(m.group(1),m.group(2),index,m.group(3)), 'BZ')
+    table['BHLEQ'] = (typeM2, lambda asm,m,index: asm.makeJInstr(m.group(1),m.group(2),index), 'BHLEQ')
 
-            m = typeM3.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeM3Instr(m.group(1),m.group(2))])
-                continue
+    for mnemonic in ('SW','LW'):
+        table[mnemonic] = (typeW, lambda asm,m,index: asm.makeWInstr(m.group(1),m.group(2),m.group(4),m.group(3),index), 'W')
 
-            m = typeSTK.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeSTKInstr(m.group(1),m.group(2))])
-                continue
+    table['JR'] = (typeJR, lambda asm,m,index: asm.makeWInstr(m.group(1),m.group(2),'0','0',index), 'JR')
+    table['HAB'] = (typeHAB, lambda asm,m,index: ANEMOpcodeJ['J'] << 12, 'HAB')
 
-            m = typeADDI.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeADDIInstr(m.group(1),m.group(2))])
-                continue
+    for mnemonic in ANEMFuncM1.keys():
+        table[mnemonic] = (typeM1, lambda asm,m,index: asm.makeM1Instr(m.group(1),m.group(2)), 'M1')
 
-            m = typeSYSCALL.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeSYSCALLInstr(m.group(1))])
-                continue
+    for mnemonic in ANEMFuncM3.keys():
+        table[mnemonic] = (typeM3, lambda asm,m,index: asm.makeM3Instr(m.group(1),m.group(2)), 'M3')
 
-            m = typeM4_noreg.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeM4Instr(m.group(1))])
-                continue
+    for mnemonic in ANEMFuncSTK.keys():
+        table[mnemonic] = (typeSTK, lambda asm,m,index: asm.makeSTKInstr(m.group(1),m.group(2)), 'STK')
 
-            m = typeM4_reg.match(line)
-            if m != None:
-                self.binCode.append([makeBinStr(int(index),16),self.makeM4Instr(m.group(1),m.group(2))])
-                continue
+    table['ADDI'] = (typeADDI, lambda asm,m,index: asm.makeADDIInstr(m.group(1),m.group(2)), 'ADDI')
+    table['SYSCALL'] = (typeSYSCALL, lambda asm,m,index: asm.makeSYSCALLInstr(m.group(1)), 'SYSCALL')
 
-            ##@todo make floating point supported
-            #m = typeF.match(line)
+    for mnemonic in ('RETI','EI','DI'):
+        table[mnemonic] = (typeM4_noreg, lambda asm,m,index: asm.makeM4Instr(m.group(1)), 'M4')
 
-            self.Message("Line %d: unsupported or malformed instruction: %s" % (nline, line), AsmMsgType.AsmMsgError)
+    for mnemonic in ('MFEPC','MFECA','MTEPC'):
+        table[mnemonic] = (typeM4_reg, lambda asm,m,index: asm.makeM4Instr(m.group(1),m.group(2)), 'M4')
 
-    def WriteContents(self, filename):
-        """Write contents.txt for VHDL progmem simulation."""
-        with open(filename, "w") as f:
-            for index, instruction in self.binCode:
-                f.write(index + " " + instruction + "\n")
+    return table
 
-##program body
-if __name__ == "__main__":
+##Instruction dispatch table
+InstrDispatch = makeDispatch()
 
-    asm = Assembler()
+##Assembler used to encode lines before labels are known
+ShapeAssembler = Assembler()
+ShapeAssembler.Verbosity = 0
+ShapeAssembler.labels = defaultdict(int)
 
-    asm.Init()
+##Encode a line before indexing, for the scheduler
+#
+#Label references read as 0 and the line is placed at address 0, so only the
+#opcode and register fields are meaningful.
+#@return encoded word or None if the line is malformed
+def shapeWord(line):
 
     try:
-        fileName = sys.argv[1]
-    except:
-        asm.AsmFatalError = True
-        asm.Message("Error: no filename specified",AsmMsgType.AsmMsgError)
-        exit(1)
+        regex,encode,iclass = InstrDispatch[line.split(None,1)[0]]
+    except (IndexError,KeyError):
+        return None
 
-    #load program
+    m = regex.match(line)
+    if m == None:
+        return None
+    try:
+        return encode(ShapeAssembler,m,0)
+    except ValueError:
+        return None
+
+##Additional output formats: name -> (extension, writer, description)
+OutputFormats = { "img" : (".img", Assembler.WriteImage, "raw big-endian image"),
+                  "hex" : (".hex", Assembler.WriteIHex, "Intel HEX"),
+                  "mem" : (".mem", Assembler.WriteMem, "hex memory init")
+                  }
+
+##Assemble one program and write its outputs
+#@param fileName program base name, reads <fileName>.asm
+#@param formats additional output formats
+#@param cacheDir cache directory, None disables the cache
+#@param verbosity message verbosity
+#@param stream use the streaming assembler
+#@param stats AsmStats instance to record timings and instruction classes, or None
+#@param hazards run the static hazard analysis and write <fileName>.haz
+#@param schedule reorder instructions and drop NOPs to avoid stalls (anem_sched)
+#@param objectFile write a relocatable <fileName>.o instead of an image (anem_link)
+#@return (error count, warning count)
+def assembleFile(fileName, formats=(), cacheDir=None, verbosity=2, stream=False, stats=None, hazards=False,
+                 schedule=False, objectFile=False):
+
+    asm = Assembler()
+    asm.Verbosity = verbosity
+    asm.Stats = stats
+    timing = stats if stats != None else AsmStats()
 
-    with open(fileName+".asm",'r') as f:
-        lines = f.readlines()
+    if stream:
+        with timing.Stage("Stream"):
+            assembleStream(asm, fileName)
+        return (asm.AsmErrorCount, asm.AsmWarnCount)
 
-    #clean
+    #load program
+
+    with timing.Stage("Read"):
+        with open(fileName+".asm",'r') as f:
+            lines = f.readlines()
+    timing.Lines("Read", len(lines))
+
+    cache = None
+    if cacheDir:
+        cache = AsmCache(cacheDir, fileName, sorted(formats) + (["hazards"] if hazards else []) +
+                         (["schedule"] if schedule else []) + (["object"] if objectFile else []))
+        if cache.UpToDate(lines):
+            asm.Message("%s is up to date" % fileName, AsmMsgType.AsmMsgInfo)
+            return (0, 0)
+        cache.Load()
+
+    #clean (and index, when cached); scheduling moves lines across chunks,
+    #scheduled programs are only cached as a whole
+
+    if cache != None and not schedule:
+        with timing.Stage("Clean+Index"):
+            cache.CleanIndex(asm, lines)
+        timing.Lines("Clean+Index", len(lines))
+    else:
+        with timing.Stage("Clean"):
+            asm.Clean(lines)
+        timing.Lines("Clean", len(lines))
 
-    asm.Clean(lines)
+    if schedule:
+        with timing.Stage("Schedule"):
+            asm.Schedule()
+        timing.Lines("Schedule", len(asm.CleanOut))
 
     #writes .clean file
-    with open(fileName+".clean","w") as outFile:
-        for nline,line in asm.CleanOut:
-            outFile.write(str(nline)+'\t'+line+'\n')
+    with timing.Stage("Write .clean"):
+        asm.WriteClean(fileName+".clean")
+    timing.Lines("Write .clean", len(asm.CleanOut))
 
     asm.Message("%s.clean written" % fileName,AsmMsgType.AsmMsgInfo)
 
     #indexer
-    asm.Index()
-
-    with open(fileName+".ind","w") as outFile:
-        outFile.write(".LABELS\n")
-        for label in asm.labels.keys():
-            outFile.write(label+'\t'+str(asm.labels[label])+'\n')
-
-        outFile.write(".CODE\n")
-        for index,nline,iline in asm.code:
-            outFile.write(str(index)+'\t'+str(nline)+'\t'+iline+'\n')
+    if cache == None or schedule:
+        with timing.Stage("Index"):
+            asm.Index()
+        timing.Lines("Index", len(asm.CleanOut))
+
+    #out-of-range jumps go through trampolines
+    anchors = list(asm.code) if objectFile else None
+    with timing.Stage("Relax"):
+        relax = asm.Relax(objectFile)
+    timing.Lines("Relax", len(asm.code))
+    if relax.errors:
+        return (asm.AsmErrorCount, asm.AsmWarnCount)
+
+    with timing.Stage("Write .ind"):
+        asm.WriteIndex(fileName+".ind")
+    timing.Lines("Write .ind", len(asm.code))
 
     asm.Message("%s.ind written" % fileName, AsmMsgType.AsmMsgInfo)
 
+    #relocatable object, linked by anem_link
+    if objectFile:
+        with timing.Stage("Write .o"):
+            written = writeObject(asm, fileName+".o", anchors, asm.pinned, asm.codeLabels)
+        timing.Lines("Write .o", len(asm.code))
+        if written:
+            asm.Message("%s.o written" % fileName, AsmMsgType.AsmMsgInfo)
+        if cache != None and asm.AsmErrorCount == 0 and asm.AsmWarnCount == 0:
+            cache.Save([".clean", ".ind", ".o"])
+        return (asm.AsmErrorCount, asm.AsmWarnCount)
+
     #assembler
-    asm.Assemble()
+    with timing.Stage("Assemble"):
+        asm.Assemble()
+    timing.Lines("Assemble", len(asm.code))
 
-    with open(fileName+".bin","w") as outFile:
-        for index,instruction in asm.binCode:
-            outFile.write(instruction+'\n')
+    with timing.Stage("Write .bin"):
+        asm.WriteBin(fileName+".bin")
+    timing.Lines("Write .bin", len(asm.binWords))
 
     asm.Message("%s.bin written" % fileName, AsmMsgType.AsmMsgInfo)
 
     # Write symbol table
-    with open(fileName + ".sym", "w") as outFile:
-        for label in asm.labels.keys():
-            outFile.write(label + '\t' + str(asm.labels[label]) + '\n')
+    with timing.Stage("Write .sym"):
+        asm.WriteSymbols(fileName+".sym")
+    timing.Lines("Write .sym", len(asm.labels))
 
     asm.Message("%s.sym written" % fileName, AsmMsgType.AsmMsgInfo)
 
     # Write contents.txt for VHDL simulation
-    asm.WriteContents(fileName+".contents.txt")
+    with timing.Stage("Write .contents"):
+        asm.WriteContents(fileName+".contents.txt")
+    timing.Lines("Write .contents", len(asm.binWords))
     asm.Message("%s.contents.txt written (VHDL simulation format)" % fileName, AsmMsgType.AsmMsgInfo)
 
-    asm.Done()
+    # Additional output formats
+    for fmt in formats:
+        ext,writer,desc = OutputFormats[fmt]
+        with timing.Stage("Write "+ext):
+            writer(asm, fileName+ext)
+        timing.Lines("Write "+ext, len(asm.binWords))
+        asm.Message("%s%s written (%s)" % (fileName,ext,desc), AsmMsgType.AsmMsgInfo)
+
+    #static hazard analysis
+    if hazards:
+        with timing.Stage("Hazards"):
+            report = asm.Hazards()
+            with open(fileName+".haz","w") as outFile:
+                outFile.write(report.Report()+'\n')
+        timing.Lines("Hazards", len(asm.code))
+        asm.Message("%s.haz written (%d stall sites, about %d stall cycles)" %
+                    (fileName, len(report.sites), report.StallCycles()), AsmMsgType.AsmMsgInfo)
+
+    #programs with errors or warnings are always reassembled, a hit prints nothing
+    if cache != None and asm.AsmErrorCount == 0 and asm.AsmWarnCount == 0:
+        cache.Save([".clean", ".ind", ".bin", ".sym", ".contents.txt"] +
+                   [OutputFormats[fmt][0] for fmt in formats] + ([".haz"] if hazards else []))
+
+    return (asm.AsmErrorCount, asm.AsmWarnCount)
+
+##Batch worker, never raises
+#@return (error count, warning count, failure description or None, stats summary or None)
+def assembleWorker(fileName, formats, cacheDir, verbosity, stream, withStats, hazards, schedule, objectFile):
+
+    stats = AsmStats() if withStats else None
+    try:
+        errors, warnings = assembleFile(fileName, formats, cacheDir, verbosity, stream, stats, hazards, schedule,
+                                        objectFile)
+    except SystemExit:
+        #fatal assembler error, already reported
+        return (1, 0, "fatal error", None)
+    except Exception as e:
+        return (1, 0, "%s: %s" % (type(e).__name__, e), None)
+
+    return (errors, warnings, None, stats.Summary() if stats != None else None)
+
+##Expand command line inputs into program base names
+#@param names base names, .asm files, directories or glob patterns
+#@return list of program base names
+def expandInputs(names):
+
+    progs = []
+    for name in names:
+        if os.path.isdir(name):
+            found = sorted(glob.glob(os.path.join(name, "*.asm")))
+        elif any(c in name for c in "*?["):
+            found = sorted(glob.glob(name))
+        else:
+            found = [name]
+
+        for f in found:
+            progs.append(f[:-4] if f.endswith(".asm") else f)
+
+    return progs
+
+##program body
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="ANEM Assembler")
+    parser.add_argument("filename", nargs="+",
+                        help="program base name (reads <filename>.asm), .asm file, directory or glob pattern")
+    parser.add_argument("-f", "--format", action="append", default=[], choices=list(OutputFormats.keys()),
+                        help="additional output format, may be given more than once")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="skip unchanged programs and reuse unchanged regions using a cache in DIR")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="worker processes when assembling several programs")
+    parser.add_argument("-v", "--verbosity", type=int, default=None,
+                        help="message verbosity (default 2, 1 when assembling several programs)")
+    parser.add_argument("--stream", action="store_true",
+                        help="streaming assembly, memory proportional to labels instead of program size")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="record per-stage timings and instruction class counts, write a JSON summary to FILE")
+    parser.add_argument("--hazards", action="store_true",
+                        help="report pipeline stall sites and their cost in <filename>.haz")
+    parser.add_argument("-O", "--schedule", action="store_true",
+                        help="reorder instructions within basic blocks and drop padding NOPs to avoid stalls")
+    parser.add_argument("-c", "--object", action="store_true",
+                        help="write a relocatable object <filename>.o for anem_link.py instead of an image")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run under cProfile and write the report to FILE (single program only)")
+    args = parser.parse_args()
+
+    if args.stream and (args.cache or args.format or args.hazards or args.schedule):
+        parser.error("--stream cannot be combined with --cache, --format, --hazards or --schedule")
+    if args.object and (args.stream or args.format or args.hazards):
+        parser.error("--object cannot be combined with --stream, --format or --hazards, link first")
+
+    Assembler().Init()
+
+    progs = expandInputs(args.filename)
+    stats = AsmStats() if args.stats else None
+
+    if len(progs) == 1:
+        verbosity = 2 if args.verbosity == None else args.verbosity
+        if args.profile:
+            profiler = cProfile.Profile()
+            errors, warnings = profiler.runcall(assembleFile, progs[0], args.format, args.cache,
+                                                verbosity, args.stream, stats, args.hazards, args.schedule,
+                                                args.object)
+            with open(args.profile, "w") as f:
+                pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats()
+        else:
+            errors, warnings = assembleFile(progs[0], args.format, args.cache, verbosity, args.stream, stats,
+                                            args.hazards, args.schedule, args.object)
+        if stats != None:
+            print(stats.Report())
+            stats.WriteJSON(args.stats, { "programs" : 1 })
+        print(formatCounts(errors, warnings))
+        exit(1 if errors else 0)
+
+    if args.profile:
+        parser.error("--profile needs a single program")
+
+    #batch mode: one process pool, counts are aggregated per program
+    verbosity = 1 if args.verbosity == None else args.verbosity
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+        futures = dict((pool.submit(assembleWorker, prog, args.format, args.cache, verbosity, args.stream,
+                                          stats != None, args.hazards, args.schedule, args.object), prog)
+                       for prog in progs)
+        for future in concurrent.futures.as_completed(futures):
+            results[futures[future]] = future.result()
+
+    failed = 0
+    totalErrors = 0
+    totalWarnings = 0
+    for prog in progs:
+        errors, warnings, failure, summary = results[prog]
+        if summary != None:
+            stats.Merge(summary)
+        totalErrors += errors
+        totalWarnings += warnings
+        if errors or warnings:
+            print("%s: %s" % (prog, formatCounts(errors, warnings)))
+        if failure != None:
+            print(colorize("%s: %s" % (prog, failure), MsgColors.red))
+        if errors:
+            failed += 1
+
+    if stats != None:
+        print(stats.Report())
+        stats.WriteJSON(args.stats, { "programs" : len(progs), "failed" : failed })
+
+    print("%d program(s), %d failed" % (len(progs), failed))
+    print(formatCounts(totalErrors, totalWarnings))
+    exit(1 if failed else 0)
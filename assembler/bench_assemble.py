@@ -0,0 +1,201 @@
+#coding=utf-8
+##@file bench_assemble.py
+# @brief assembler benchmark on generated programs
+# @since 10/17/2026
+#
+# Generates programs of configurable size and instruction mix, runs the whole
+# Clean -> Index -> Assemble -> write pipeline and reports throughput per stage
+# and peak memory.
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from assembler import *
+
+##Instruction templates by mix class: (template, words after expansion)
+BenchTemplates = { "R"     : [("%(rop)s $%(ra)d, $%(rb)d", 1)],
+                   "S"     : [("%(sop)s $%(ra)d, $%(sh)d", 1)],
+                   "L"     : [("LIU $%(ra)d, %(imm)d", 1),
+                              ("LIL $%(ra)d, 0x%(imm)x", 1),
+                              ("LIL $%(ra)d, %%%(const)s%%L", 1),
+                              ("LIU $%(ra)d, %%%(label)s%%U", 1)],
+                   "J"     : [("J %%%(label)s%%", 1),
+                              ("JAL %%%(label)s%%", 1)],
+                   "BZ"    : [("BZ %%%(label)s%%,%(pred)s", 1),
+                              ("BHLEQ %%%(label)s%%", 1)],
+                   "W"     : [("LW $%(ra)d, %(sh)d($%(rb)d)", 1),
+                              ("SW $%(ra)d, %(sh)d($%(rb)d)", 1)],
+                   "JR"    : [("JR $%(ra)d", 1)],
+                   "STK"   : [("%(stkop)s $%(ra)d", 1)],
+                   "M"     : [("%(m1op)s %(imm)d", 1),
+                              ("%(m3op)s $%(ra)d", 1),
+                              ("ADDI $%(ra)d, %(simm)d", 1),
+                              ("SYSCALL %(imm)d", 1),
+                              ("%(m4op)s", 1),
+                              ("%(m4rop)s $%(ra)d", 1)],
+                   "LIW"   : [("LIW $%(ra)d, %(word)d", 3),
+                              ("LIW $%(ra)d, 0x%(word)x", 3),
+                              ("LIW $%(ra)d, 0b%(word)s", 3)],
+                   "MOVE"  : [("MOVE $%(ra)d, $%(rb)d", 2)],
+                   "MADD"  : [("MADD $%(ra)d, $%(rb)d, %(imm)d", 2)],
+                   "LHILO" : [("LHI %(word)d", 2),
+                              ("LLO 0x%(word)x", 2)],
+                   "NOP"   : [("NOP", 1)]
+                   }
+
+##Default instruction mix (relative weights)
+BenchMix = { "R" : 20, "S" : 6, "L" : 8, "J" : 4, "BZ" : 4, "W" : 12, "JR" : 1,
+             "STK" : 6, "M" : 10, "LIW" : 10, "MOVE" : 4, "MADD" : 2, "LHILO" : 2,
+             "NOP" : 5 }
+
+##Parse an instruction mix
+#@param text comma separated class=weight list, e.g. "R=10,LIW=5"
+#@return dictionary class -> weight
+def parseMix(text):
+
+    mix = {}
+    for item in text.split(","):
+        name, weight = item.split("=")
+        name = name.strip().upper()
+        if name not in BenchTemplates:
+            raise ValueError("unknown instruction class %s" % name)
+        mix[name] = int(weight)
+
+    return mix
+
+##Generate a synthetic program
+#@param nlines number of instruction lines
+#@param seed random seed
+#@param mix instruction mix, class -> weight
+#@param labelEvery instruction lines between labels
+#@param nconst number of .CONSTANT directives
+#@return list of source lines
+def makeProgram(nlines, seed=0, mix=None, labelEvery=16, nconst=32):
+
+    if mix == None:
+        mix = BenchMix
+
+    rnd = random.Random(seed)
+    classes = [name for name in mix.keys() if mix[name] > 0]
+    weights = [mix[name] for name in classes]
+    consts = ["C%d" % n for n in range(max(nconst, 1))]
+
+    lines = ["-- generated benchmark program, seed %d\n" % seed]
+    for name in consts:
+        lines.append(".CONSTANT %s = 0x%x\n" % (name, rnd.randint(0, 0xFFFF)))
+
+    #targets stay within a few labels, far below the +-2048 branch range
+    nlabels = nlines // labelEvery + 1
+    words = 0
+    for n in range(nlines):
+        if n % labelEvery == 0:
+            lines.append("L%d:\n" % (n // labelEvery))
+        cur = n // labelEvery
+        fields = { "ra" : rnd.randint(0, 15),
+                   "rb" : rnd.randint(0, 15),
+                   "sh" : rnd.randint(0, 15),
+                   "imm" : rnd.randint(0, 255),
+                   "simm" : rnd.randint(-128, 127),
+                   "word" : rnd.randint(0, 0xFFFF),
+                   "label" : "L%d" % min(max(cur + rnd.randint(-8, 8), 0), nlabels - 1),
+                   "const" : rnd.choice(consts),
+                   "pred" : rnd.choice("TNX"),
+                   "rop" : rnd.choice(list(ANEMFuncR.keys())),
+                   "sop" : rnd.choice(list(ANEMFuncS.keys())),
+                   "stkop" : rnd.choice(list(ANEMFuncSTK.keys())),
+                   "m1op" : rnd.choice(list(ANEMFuncM1.keys())),
+                   "m3op" : rnd.choice(list(ANEMFuncM3.keys())),
+                   "m4op" : rnd.choice(["RETI", "EI", "DI"]),
+                   "m4rop" : rnd.choice(["MFEPC", "MFECA", "MTEPC"])
+                   }
+        template, size = rnd.choice(BenchTemplates[rnd.choices(classes, weights)[0]])
+        if "0b%(word)s" in template:
+            fields["word"] = format(fields["word"], "b")
+        lines.append("    " + template % fields + " -- generated\n")
+        words += size
+    lines.append("L%d: J %%L%d%%\n" % (nlabels - 1, nlabels - 1))
+
+    if words + 1 > 0x10000:
+        raise ValueError("program needs %d words, more than the 16-bit address space" % (words + 1))
+
+    return lines
+
+##Run the full pipeline on a program
+#@param path directory to write into
+#@param lines source lines
+#@param formats additional output formats
+#@param stats AsmStats instance or None
+#@return (wall time, error count)
+def runPipeline(path, lines, formats, stats=None):
+
+    fileName = os.path.join(path, "bench")
+    with open(fileName + ".asm", "w") as f:
+        f.writelines(lines)
+
+    start = time.perf_counter()
+    errors, warnings = assembleFile(fileName, formats, verbosity=0, stats=stats)
+
+    return (time.perf_counter() - start, errors)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="ANEM assembler benchmark")
+    parser.add_argument("-n", "--lines", type=int, default=40000, help="instruction lines to generate")
+    parser.add_argument("-m", "--mix", default=None,
+                        help="instruction mix as class=weight list, classes: %s" % ",".join(BenchTemplates.keys()))
+    parser.add_argument("-s", "--seed", type=int, default=0, help="generator seed")
+    parser.add_argument("-r", "--runs", type=int, default=5, help="timed runs, the best one is reported")
+    parser.add_argument("--label-every", type=int, default=16, help="instruction lines between labels")
+    parser.add_argument("--constants", type=int, default=32, help=".CONSTANT directives to generate")
+    parser.add_argument("-f", "--format", action="append", default=[], choices=list(OutputFormats.keys()),
+                        help="also time an additional output format")
+    parser.add_argument("--save", metavar="FILE", help="save the generated program")
+    parser.add_argument("--json", metavar="FILE", help="write results as JSON")
+    args = parser.parse_args()
+
+    try:
+        mix = parseMix(args.mix) if args.mix else BenchMix
+        lines = makeProgram(args.lines, args.seed, mix, args.label_every, args.constants)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.save:
+        with open(args.save, "w") as f:
+            f.writelines(lines)
+
+    path = tempfile.mkdtemp(prefix="anembench")
+    try:
+        best = None
+        for run in range(max(args.runs, 1)):
+            stats = AsmStats()
+            elapsed, errors = runPipeline(path, lines, args.format, stats)
+            if best == None or elapsed < best[0]:
+                best = (elapsed, stats)
+
+        #separate run, tracing allocations slows everything down
+        tracemalloc.start()
+        runPipeline(path, lines, args.format)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(path)
+
+    elapsed, stats = best
+    srcBytes = sum(len(line) for line in lines)
+    print(stats.Report())
+    print("%d source lines (%.2f MB), best of %d: %.3f s, %.0f lines/s, peak memory %.1f MB, %d error(s)" %
+          (len(lines), srcBytes / 1e6, args.runs, elapsed, len(lines) / elapsed, peak / 1e6, errors))
+
+    if args.json:
+        stats.WriteJSON(args.json, { "source_lines" : len(lines),
+                                     "source_bytes" : srcBytes,
+                                     "seed" : args.seed,
+                                     "mix" : mix,
+                                     "wall_time" : elapsed,
+                                     "lines_per_s" : len(lines) / elapsed,
+                                     "peak_memory" : peak,
+                                     "errors" : errors
+                                     })
@@ -0,0 +1,204 @@
+#coding=utf-8
+##@package board_sim
+# @brief pseudo-terminal stand-in for a board running the loader firmware
+# @since 10/17/2026
+#
+# Every board is a pty served by a thread. It answers the chunked protocol of
+# loader.py and accepts the original PRGCMD frames, so the loader can be run
+# against it without hardware:
+#
+#     python3 loader/board_sim.py -n 4 --fault 0.05
+#     python3 loader/loader.py /dev/pts/5 prog.contents.txt
+#
+# --fault makes a fraction of the frames fail, half of them with a NAK and
+# half without any answer, to exercise the loader's resends.
+
+import argparse
+import os
+import random
+import select
+import struct
+import sys
+import threading
+import time
+import tty
+from array import array
+
+from loader import *
+
+##A frame that stops for this long is dropped, as the firmware does
+SimFrameTimeout = 0.1
+
+##Largest WRCMD/RDCMD/ERCMD count accepted
+SimMaxCount = 0x1000
+
+##Board running the loader firmware
+class BoardSim:
+
+    ##@param size memory size in words
+    #@param fault fraction of frames that fail
+    #@param latency seconds added before every answer
+    #@param seed random seed for the faults
+    def __init__(self, size=0x10000, fault=0.0, latency=0.0, seed=None):
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        ##path the loader opens
+        self.path = os.ttyname(self.slave)
+        self.memory = array('H', bytes(2*size))
+        self.fault = fault
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.frames = 0
+        self.naks = 0
+        self.dropped = 0
+        self.resets = 0
+        self.stop = threading.Event()
+
+    ##Read bytes of a frame
+    #@return bytes, None if the frame stopped
+    def Get(self, count):
+
+        data = b''
+        while len(data) < count:
+            ready, w, x = select.select([self.master], [], [], SimFrameTimeout)
+            if not ready:
+                return None
+            data += os.read(self.master, count - len(data))
+
+        return data
+
+    def Answer(self, data):
+
+        if self.latency:
+            time.sleep(self.latency)
+        os.write(self.master, data)
+
+    ##Serve frames until stopped
+    def Serve(self):
+
+        while not self.stop.is_set():
+            ready, w, x = select.select([self.master], [], [], SimFrameTimeout)
+            if not ready:
+                continue
+            try:
+                self.Frame(os.read(self.master, 1)[0])
+            except OSError:
+                return
+
+    ##Handle one frame
+    #@param cmd command byte
+    def Frame(self, cmd):
+
+        if cmd == PRGCMD:
+            size = self.Get(1)
+            data = self.Get(size[0] + 1) if size != None else None
+            if data == None or data[-1] != TERM:
+                return
+            self.frames += 1
+            for n in range(size[0]):
+                shift = 0 if n % 2 else 8
+                self.memory[n//2] = (self.memory[n//2] & ~(0xFF << shift) & 0xFFFF) | (data[n] << shift)
+            return
+
+        if cmd in (PINGCMD, RESETCMD):
+            header = b''
+        elif cmd in (WRCMD, RDCMD, ERCMD):
+            header = self.Get(4)
+            if header == None:
+                return
+        else:
+            #not a command, the loader is resynchronizing
+            return
+
+        count = struct.unpack(">HH", header)[1] if header else 0
+        data = self.Get(2*count if cmd == WRCMD else 0) if count <= SimMaxCount else None
+        crc = self.Get(2)
+        if data == None or crc == None:
+            return
+        self.frames += 1
+
+        body = bytes([cmd]) + header + data
+        if self.fault and self.random.random() < self.fault:
+            if self.random.random() < 0.5:
+                self.dropped += 1
+                return
+            crc = b'\0\0' if crc != b'\0\0' else b'\1\1'
+        addr = struct.unpack(">HH", header)[0] if header else 0
+        if crc16(body) != struct.unpack(">H", crc)[0] or addr + count > len(self.memory):
+            self.naks += 1
+            self.Answer(bytes([NAK]))
+            return
+
+        if cmd == PINGCMD:
+            self.Answer(bytes([ACK]) + struct.pack(">BH", LoaderVersion, len(self.memory) & 0xFFFF))
+        elif cmd == RESETCMD:
+            self.resets += 1
+            self.Answer(bytes([ACK]))
+        elif cmd == WRCMD:
+            words = array('H', data)
+            if sys.byteorder == 'little':
+                words.byteswap()
+            self.memory[addr:addr+count] = words
+            self.Answer(bytes([ACK]))
+        elif cmd == ERCMD:
+            self.memory[addr:addr+count] = array('H', bytes(2*count))
+            self.Answer(bytes([ACK]))
+        else:
+            words = self.memory[addr:addr+count]
+            if sys.byteorder == 'little':
+                words.byteswap()
+            answer = words.tobytes()
+            self.Answer(bytes([ACK]) + answer + struct.pack(">H", crc16(answer)))
+
+    ##@return address -> word of the nonzero words
+    def Image(self):
+        return dict((addr, word) for addr, word in enumerate(self.memory) if word)
+
+    def Summary(self):
+        return "%s: %d frames, %d NAK, %d dropped, %d resets, %d nonzero words" % \
+            (self.path, self.frames, self.naks, self.dropped, self.resets, len(self.Image()))
+
+    def Close(self):
+
+        self.stop.set()
+        os.close(self.master)
+        os.close(self.slave)
+
+##Start boards in background threads
+#@param count number of boards
+#@return list of BoardSim, call Close on each when done
+def startBoards(count, size=0x10000, fault=0.0, latency=0.0, seed=None):
+
+    boards = []
+    for n in range(count):
+        board = BoardSim(size, fault, latency, None if seed == None else seed + n)
+        threading.Thread(target=board.Serve, daemon=True).start()
+        boards.append(board)
+
+    return boards
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="ANEM16 board stand-ins on pseudo-terminals")
+    parser.add_argument("-n", "--boards", type=int, default=1, help="number of boards (default 1)")
+    parser.add_argument("--size", type=int, default=0x10000, help="memory size in words (default 65536)")
+    parser.add_argument("--fault", type=float, default=0.0, help="fraction of frames that fail (default 0)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before every answer (default 0)")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for the faults")
+    args = parser.parse_args()
+
+    boards = startBoards(args.boards, args.size, args.fault, args.latency, args.seed)
+    for board in boards:
+        print(board.path)
+    sys.stdout.flush()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+
+    for board in boards:
+        print(board.Summary())
+        board.Close()
@@ -1,90 +1,601 @@
 #coding=utf-8
+##@package loader
+# @brief serial program loader for ANEM16 boards
+# @since 10/17/2026
+#
+# The image is sent in acknowledged chunks. Every frame is a command byte,
+# big-endian 16-bit fields and a CRC-16/CCITT (initial value 0xFFFF) over
+# the whole frame:
+#
+# - PINGCMD crc -> ACK version size, size in words (0 is 65536)
+# - WRCMD addr count words crc -> ACK
+# - RDCMD addr count crc -> ACK words crc
+# - ERCMD addr count crc -> ACK, clears count words to 0
+# - RESETCMD crc -> ACK
+#
+# The board answers NAK to a frame with a bad CRC and drops a frame that
+# stops for more than 100 ms. The loader resends a frame after a NAK or a
+# timeout. After writing, the image is read back and checked.
+#
+# The last image loaded through each port is kept in a state directory.
+# Only words that differ from it are written, and words it had that the new
+# image does not have are cleared. The full image is read back by default,
+# so a stale state (board reprogrammed elsewhere) is found and repaired.
+#
+# --legacy speaks the original protocol (PRGCMD size data TERM, one size
+# byte), for boards that do not answer PINGCMD.
+#
+# Several ports (or glob patterns) are programmed at the same time, one
+# thread per port since serial I/O blocks. A board that fails is loaded
+# again from the start up to --attempts times before it is reported.
 
-import serial, struct,array, time,sys
-
-serialpath = '/dev/ttyACM0'
-serialbaud = 115200
+import argparse
+import binascii
+import concurrent.futures
+import glob
+import json
+import threading
+import os
+import struct
+import sys
+import time
+from array import array
 
+##Original protocol
 RESETCMD = 0x01
 PRGCMD = 0x02
 TERM = 0xFF
 
-try:
-    serialpath = sys.argv[1]
-except:
-    print "usage loader.py /path/to/serialport binfile"
-    exit(1)
+##Chunked protocol
+WRCMD = 0x03
+RDCMD = 0x04
+ERCMD = 0x05
+PINGCMD = 0x06
+ACK = 0x79
+NAK = 0x1F
+
+##Chunked protocol version answered by PINGCMD
+LoaderVersion = 2
+
+##Words per frame
+LoaderChunk = 64
+
+##Resends of a frame before giving up
+LoaderRetries = 3
+
+##Wait before resending after a timeout, longer than the board frame timeout
+LoaderResync = 0.2
+
+##Unchanged runs this short between changed words are rewritten, a new frame costs as much
+LoaderMergeGap = 4
+
+##Words cleared when there is no previous image, the original loader cleared 255 bytes
+LoaderErase = 128
+
+##Largest image the original protocol can send, its size byte counts bytes
+LoaderLegacyMax = 127
+
+##Loads of a board before it is reported as failed
+LoaderAttempts = 2
+
+##Wait before loading a failed board again
+LoaderBackoff = 1.0
+
+##Default state directory
+LoaderStateDir = os.path.join(os.path.expanduser("~"), ".cache", "anem16-loader")
+
+##Loader failure
+class LoaderError(Exception):
+    pass
+
+##CRC-16/CCITT of a frame
+def crc16(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+##Frame with its CRC
+def makeFrame(body):
+    return body + struct.pack(">H", crc16(body))
+
+##Read a program image
+#@param fileName .contents.txt (address word), .bin (one word per line from
+#address 0), .mem (@addr and hex words) or raw big-endian image
+#@return dictionary address -> word
+def loadImage(fileName):
+
+    image = {}
+    try:
+        if fileName.endswith((".contents.txt", ".bin", ".mem")):
+            with open(fileName) as f:
+                addr = 0
+                for line in f:
+                    fields = line.split()
+                    if not fields:
+                        continue
+                    if fileName.endswith(".contents.txt"):
+                        image[int(fields[0], 2)] = int(fields[1], 2)
+                    elif fileName.endswith(".bin"):
+                        image[addr] = int(fields[0], 2)
+                        addr += 1
+                    elif fields[0].startswith('@'):
+                        addr = int(fields[0][1:], 16)
+                    else:
+                        for field in fields:
+                            image[addr] = int(field, 16)
+                            addr += 1
+        else:
+            with open(fileName, "rb") as f:
+                words = array('H', f.read())
+            if sys.byteorder == 'little':
+                words.byteswap()
+            image = dict(enumerate(words))
+    except (OSError, ValueError, IndexError) as e:
+        raise LoaderError("cannot read %s: %s" % (fileName, e))
+
+    if any(addr > 0xFFFF or word > 0xFFFF for addr, word in image.items()):
+        raise LoaderError("%s: address or word out of range" % fileName)
+
+    return image
+
+##Group addresses into runs
+#@param addrs addresses
+#@param gap runs at most this far apart are merged
+#@return list of (first address, address after the last)
+def makeRuns(addrs, gap=0):
+
+    runs = []
+    for addr in sorted(addrs):
+        if runs and addr - runs[-1][1] <= gap:
+            runs[-1][1] = addr + 1
+        else:
+            runs.append([addr, addr + 1])
+
+    return [tuple(run) for run in runs]
+
+##Words to write and clear
+#@param image new image, address -> word
+#@param previous image on the board, None if unknown
+#@param erase words cleared from address 0 when previous is unknown
+#@return (writes [(addr, array of words)], erases [(addr, count)])
+def planLoad(image, previous=None, erase=LoaderErase):
+
+    if previous == None:
+        changed = image.keys()
+        cleared = [addr for addr in range(erase) if addr not in image]
+    else:
+        changed = [addr for addr, word in image.items() if previous.get(addr, 0) != word]
+        cleared = [addr for addr, word in previous.items() if addr not in image and word != 0]
+
+    writes = []
+    for start, end in makeRuns(changed, LoaderMergeGap):
+        #only gaps inside the image are merged
+        for part in makeRuns([addr for addr in range(start, end) if addr in image]):
+            writes.append((part[0], array('H', [image[addr] for addr in range(*part)])))
+
+    return (writes, [(start, end - start) for start, end in makeRuns(cleared)])
+
+##Chunked protocol over an open port
+class Board:
+
+    ##@param port open port with read, write and reset_input_buffer (serial.Serial)
+    #@param chunk words per frame
+    #@param retries resends of a frame
+    def __init__(self, port, chunk=LoaderChunk, retries=LoaderRetries):
+
+        self.port = port
+        self.chunk = chunk
+        self.retries = retries
+        self.bytesOut = 0
+        self.bytesIn = 0
+        ##frames sent again
+        self.resent = 0
+
+    ##Send a frame and wait for its answer
+    #@param frame complete frame
+    #@param size answer bytes after ACK
+    #@param check function(answer) -> answer is good, None accepts any
+    #@return answer
+    def Transact(self, frame, size=0, check=None):
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.resent += 1
+                time.sleep(LoaderResync)
+                self.port.reset_input_buffer()
+            self.port.write(frame)
+            self.bytesOut += len(frame)
+            reply = self.port.read(1)
+            self.bytesIn += len(reply)
+            if reply != bytes([ACK]):
+                continue
+            answer = self.port.read(size) if size else b''
+            self.bytesIn += len(answer)
+            if len(answer) == size and (check == None or check(answer)):
+                return answer
+
+        raise LoaderError("no answer to command 0x%02x after %d attempt(s)" % (frame[0], self.retries + 1))
+
+    ##@return (protocol version, memory size in words)
+    def Ping(self):
+
+        try:
+            version, size = struct.unpack(">BH", self.Transact(makeFrame(bytes([PINGCMD])), 3))
+        except LoaderError:
+            raise LoaderError("board does not answer, try --legacy for the original protocol")
+
+        return (version, size if size else 0x10000)
+
+    def Write(self, addr, words):
+
+        data = array('H', words)
+        if sys.byteorder == 'little':
+            data.byteswap()
+        self.Transact(makeFrame(struct.pack(">BHH", WRCMD, addr, len(words)) + data.tobytes()))
+
+    ##@return array of words
+    def Read(self, addr, count):
+
+        answer = self.Transact(makeFrame(struct.pack(">BHH", RDCMD, addr, count)), 2*count + 2,
+                               lambda answer: crc16(answer[:-2]) == struct.unpack(">H", answer[-2:])[0])
+        words = array('H', answer[:-2])
+        if sys.byteorder == 'little':
+            words.byteswap()
+
+        return words
+
+    def Erase(self, addr, count):
+        self.Transact(makeFrame(struct.pack(">BHH", ERCMD, addr, count)))
+
+    def Reset(self):
+        self.Transact(makeFrame(bytes([RESETCMD])))
+
+##Load results
+class LoadReport:
+
+    def __init__(self):
+
+        self.written = 0
+        self.erased = 0
+        self.verified = 0
+        ##words found wrong on read-back and written again
+        self.repaired = 0
+        self.resent = 0
+        self.bytesOut = 0
+        self.bytesIn = 0
+        self.seconds = 0.0
+
+    def Summary(self):
+
+        return ("%d words written, %d cleared, %d verified, %d repaired, %d frame(s) resent, "
+                "%d bytes out, %d in, %.2f s" % (self.written, self.erased, self.verified, self.repaired,
+                                               self.resent, self.bytesOut, self.bytesIn, self.seconds))
+
+##Program a board with the chunked protocol
+#@param board Board
+#@param image address -> word
+#@param previous image on the board, None writes everything
+#@param verify "all" reads the whole image back, "changed" the words written, "none" nothing
+#@param erase words cleared from address 0 when previous is None
+#@param progress function(words done, words total) or None
+#@return LoadReport
+def programBoard(board, image, previous=None, verify="all", erase=LoaderErase, progress=None):
+
+    report = LoadReport()
+    start = time.time()
+
+    version, size = board.Ping()
+    if version < LoaderVersion:
+        raise LoaderError("board speaks protocol version %d, %d needed" % (version, LoaderVersion))
+    if image and max(image.keys()) >= size:
+        raise LoaderError("image ends at 0x%04x, the board has %d words" % (max(image.keys()), size))
+
+    writes, erases = planLoad(image, previous, min(erase, size))
+    if verify == "all":
+        checks = makeRuns(image.keys())
+    elif verify == "changed":
+        checks = [(addr, addr + len(words)) for addr, words in writes]
+    else:
+        checks = []
+
+    total = sum(len(words) for addr, words in writes) + sum(count for addr, count in erases) + \
+        sum(end - start for start, end in checks)
+    done = 0
+    def step(count):
+        nonlocal done
+        done += count
+        if progress != None:
+            progress(done, total)
+
+    for addr, words in writes:
+        for n in range(0, len(words), board.chunk):
+            part = words[n:n+board.chunk]
+            board.Write(addr + n, part)
+            report.written += len(part)
+            step(len(part))
+
+    for addr, count in erases:
+        board.Erase(addr, count)
+        report.erased += count
+        step(count)
+
+    #read back, a stale previous image shows up here and is written once more
+    bad = []
+    for first, end in checks:
+        for addr in range(first, end, board.chunk):
+            count = min(board.chunk, end - addr)
+            words = board.Read(addr, count)
+            bad.extend(addr + n for n in range(count) if words[n] != image[addr + n])
+            report.verified += count
+            step(count)
+
+    for first, end in makeRuns(bad):
+        words = array('H', [image[addr] for addr in range(first, end)])
+        for n in range(0, len(words), board.chunk):
+            part = words[n:n+board.chunk]
+            board.Write(first + n, part)
+            if board.Read(first + n, len(part)) != part:
+                raise LoaderError("verify failed at 0x%04x" % (first + n))
+        report.repaired += len(words)
+
+    report.resent = board.resent
+    report.bytesOut = board.bytesOut
+    report.bytesIn = board.bytesIn
+    report.seconds = time.time() - start
+
+    return report
+
+##Program a board with the original protocol
+#
+#Clears 255 bytes, then sends the image in one frame after 0.1 s. The size
+#is one byte, so larger images are refused instead of being cut.
+#@param port open port
+#@param image address -> word, contiguous from address 0
+#@return LoadReport
+def programLegacy(port, image):
+
+    report = LoadReport()
+    start = time.time()
+
+    if sorted(image.keys()) != list(range(len(image))):
+        raise LoaderError("the original protocol loads from address 0 without gaps")
+    if len(image) > LoaderLegacyMax:
+        raise LoaderError("the original protocol loads at most %d words, the image has %d" %
+                          (LoaderLegacyMax, len(image)))
+
+    frame = bytes([PRGCMD, 0xFF]) + bytes(0xFF) + bytes([TERM])
+    port.write(frame)
+    report.bytesOut += len(frame)
+    report.erased = 0xFF // 2
+    time.sleep(0.1)
+
+    words = array('H', [image[addr] for addr in range(len(image))])
+    if sys.byteorder == 'little':
+        words.byteswap()
+    frame = bytes([PRGCMD, 2*len(image)]) + words.tobytes() + bytes([TERM])
+    port.write(frame)
+    report.bytesOut += len(frame)
+    report.written = len(image)
+    report.seconds = time.time() - start
+
+    return report
+
+##Last image loaded through each port
+class LoaderState:
+
+    ##@param directory state directory, created when saving
+    def __init__(self, directory=LoaderStateDir):
+        self.directory = directory
+
+    def Path(self, portName):
+        return os.path.join(self.directory, os.path.abspath(portName).strip(os.sep).replace(os.sep, "_") + ".json")
+
+    ##@return address -> word, None if unknown
+    def Load(self, portName):
+
+        try:
+            with open(self.Path(portName)) as f:
+                return dict((int(addr), word) for addr, word in json.load(f)["image"].items())
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def Save(self, portName, image):
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.Path(portName), "w") as f:
+            json.dump({ "port" : portName, "image" : image }, f)
+
+    ##Forget the image, the board contents are unknown while loading
+    def Drop(self, portName):
+
+        try:
+            os.remove(self.Path(portName))
+        except OSError:
+            pass
+
+##Open a serial port
+#@return serial.Serial
+def openPort(portName, baud=115200, timeout=1.0):
+
+    try:
+        import serial
+    except ImportError:
+        raise LoaderError("pyserial is needed to open %s" % portName)
+
+    try:
+        return serial.Serial(portName, baud, timeout=timeout)
+    except serial.SerialException as e:
+        raise LoaderError(str(e))
 
-try:
-    myfile = sys.argv[2]
-    f = open(myfile,'r')
-except:
-    print "Error opening file!"
-    exit(1)
+##Program one board
+#@param portName serial port
+#@param image address -> word
+#@param state LoaderState, None always loads the full image
+#@param legacy use the original protocol
+#@param reset reset the board when done
+#@param progress function(words done, words total) or None
+#@return LoadReport
+def loadPort(portName, image, baud=115200, chunk=LoaderChunk, retries=LoaderRetries, verify="all",
+             erase=LoaderErase, state=None, legacy=False, reset=False, progress=None):
 
+    port = openPort(portName, baud)
+    try:
+        previous = state.Load(portName) if state != None else None
+        if state != None:
+            state.Drop(portName)
+        if legacy:
+            return programLegacy(port, image)
 
-#open serial
-ser = serial.Serial(serialpath, serialbaud, timeout=1)
+        board = Board(port, chunk, retries)
+        report = programBoard(board, image, previous, verify, erase, progress)
+        if state != None:
+            state.Save(portName, image)
+        if reset:
+            board.Reset()
+        return report
+    finally:
+        port.close()
 
-size = 0xFF
+##Expand serial port names
+#@param names port names or glob patterns (/dev/ttyUSB*)
+#@return port names in order, without repeats
+def expandPorts(names):
 
-buf = array.array('c')
+    ports = []
+    for name in names:
+        found = sorted(glob.glob(name)) if any(c in name for c in "*?[") else [name]
+        ports.extend(port for port in found if port not in ports)
 
-#wipe programming
-buf.append(chr(PRGCMD))
-buf.append(chr(size))
-index = 2
+    return ports
 
-while (size > 0):
-    
-    buf.append(chr(0x00))
-    index = index + 1
-    size = size - 1
+##Load result of one port
+class PortResult:
 
-buf.append(chr(TERM))
+    ##@param port port name
+    def __init__(self, port):
 
-#print buf.tostring()
+        self.port = port
+        ##LoadReport of the load that succeeded, None if all failed
+        self.report = None
+        ##error of the last failed load
+        self.error = None
+        self.attempts = 0
+        ##including failed loads and backoff
+        self.seconds = 0.0
 
-print "erasing..."
+##Program several boards at the same time
+#@param ports port names
+#@param image address -> word
+#@param jobs ports loaded at the same time
+#@param attempts loads of a board before it is reported as failed
+#@param progress function(port, words done, words total) or None, called from the load threads
+#@param options loadPort keyword arguments
+#@return list of PortResult, in port order
+def loadPorts(ports, image, jobs=None, attempts=LoaderAttempts, progress=None, **options):
 
-if ser.isOpen():
-    ser.write(buf.tostring())
-else:
-    print "error"
+    def load(port):
 
-#clear buffer
-buf = array.array('c')
-buf.append(chr(PRGCMD))
+        result = PortResult(port)
+        start = time.time()
+        portProgress = (lambda done, total: progress(port, done, total)) if progress != None else None
+        while result.attempts < attempts:
+            if result.attempts:
+                time.sleep(LoaderBackoff)
+            result.attempts += 1
+            try:
+                result.report = loadPort(port, image, progress=portProgress, **options)
+                result.error = None
+                break
+            except LoaderError as e:
+                result.error = str(e)
+        result.seconds = time.time() - start
 
-time.sleep(0.1)
+        return result
 
-#write something
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs or len(ports), 1)) as pool:
+        return list(pool.map(load, ports))
 
-#read contents
-program = f.readlines()
+##Timing statistics of a multi-board load
+#@param results list of PortResult
+#@param seconds wall time of the whole load
+#@return printable summary
+def summarizeLoad(results, seconds):
 
-#size
-progsize = len(program)*2
-buf.append(chr(progsize))
+    loaded = [result for result in results if result.report != None]
+    failed = [result for result in results if result.report == None]
+    out = []
+    for result in results:
+        if result.report != None:
+            out.append("%s: %s%s" % (result.port, result.report.Summary(),
+                                     ", %d attempts" % result.attempts if result.attempts > 1 else ""))
+    if loaded:
+        times = sorted(result.seconds for result in loaded)
+        words = sum(result.report.written + result.report.erased for result in loaded)
+        bytesOut = sum(result.report.bytesOut for result in loaded)
+        out.append("per board: min %.2f s, median %.2f s, max %.2f s" %
+                   (times[0], times[len(times)//2], times[-1]))
+        out.append("%d words, %d bytes sent in %.2f s (%.0f bytes/s over all ports)" %
+                   (words, bytesOut, seconds, bytesOut/seconds if seconds else 0))
+    for result in failed:
+        out.append("FAILED %s after %d attempt(s): %s" % (result.port, result.attempts, result.error))
+    out.append("%d board(s) loaded, %d failed" % (len(loaded), len(failed)))
 
-print "program has %d instr / %d bytes" % (progsize/2,progsize)
+    return "\n".join(out)
 
-for line in program:
+if __name__ == "__main__":
 
-    byte1 = int(line,2) >> 8
-    byte2 = int(line,2) & 0x00FF
+    parser = argparse.ArgumentParser(description="ANEM16 serial program loader")
+    parser.add_argument("ports", nargs="+", help="serial ports or glob patterns (/dev/ttyUSB*)")
+    parser.add_argument("image", help=".contents.txt, .bin, .mem or raw image")
+    parser.add_argument("-b", "--baud", type=int, default=115200, help="baud rate (default 115200)")
+    parser.add_argument("--chunk", type=int, default=LoaderChunk, help="words per frame (default %d)" % LoaderChunk)
+    parser.add_argument("--retries", type=int, default=LoaderRetries,
+                        help="resends of a frame (default %d)" % LoaderRetries)
+    parser.add_argument("--verify", choices=("all", "changed", "none"), default="all",
+                        help="read back the whole image (default), only the words written, or nothing")
+    parser.add_argument("--full", action="store_true", help="ignore the last image loaded, write everything")
+    parser.add_argument("--erase", type=int, default=LoaderErase,
+                        help="words cleared from address 0 without a previous image (default %d)" % LoaderErase)
+    parser.add_argument("--state", default=LoaderStateDir, help="state directory (default %s)" % LoaderStateDir)
+    parser.add_argument("--reset", action="store_true", help="reset the board when done")
+    parser.add_argument("--legacy", action="store_true", help="original protocol, at most %d words" % LoaderLegacyMax)
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="boards loaded at the same time (default all)")
+    parser.add_argument("--attempts", type=int, default=LoaderAttempts,
+                        help="loads of a board before it is reported as failed (default %d)" % LoaderAttempts)
+    args = parser.parse_args()
 
-    buf.append(chr(byte1))
-    buf.append(chr(byte2))
+    ports = expandPorts(args.ports)
+    if not ports:
+        print("no serial port matches %s" % " ".join(args.ports), file=sys.stderr)
+        sys.exit(1)
 
-buf.append(chr(TERM))
+    #one port updates a status line, several print every quarter
+    lock = threading.Lock()
+    shown = {}
+    def progress(port, done, total):
+        with lock:
+            if len(ports) == 1:
+                print("\r%s: %d/%d words" % (port, done, total), end='', file=sys.stderr)
+                if done == total:
+                    print(file=sys.stderr)
+                return
+            quarter = 4*done//total
+            if quarter > shown.get(port, 0):
+                shown[port] = quarter
+                print("%s: %d%%" % (port, 25*quarter), file=sys.stderr)
 
-print "loading %d bytes" % (len(buf))
+    try:
+        image = loadImage(args.image)
+    except LoaderError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
 
-if ser.isOpen():
-    ser.write(buf.tostring())
-    ser.close()
-else:
-    print "error"
+    state = LoaderState(args.state)
+    if args.full:
+        for port in ports:
+            state.Drop(port)
 
-print "finished loading"
+    start = time.time()
+    results = loadPorts(ports, image, args.jobs, args.attempts, progress, baud=args.baud, chunk=args.chunk,
+                        retries=args.retries, verify=args.verify, erase=args.erase, state=state,
+                        legacy=args.legacy, reset=args.reset)
+    print(summarizeLoad(results, time.time() - start))
+    sys.exit(1 if any(result.report == None for result in results) else 0)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+#coding=utf-8
+##@file ghdl_stub.py
+# @brief GHDL stand-in for trying run_tests.py without the simulator
+# @since 10/17/2026
+#
+# Accepts the -a, -e and -r commands run_tests.py issues. -r checks that
+# contents.txt is in the current directory and prints a PASSED banner;
+# tb_trace writes its trace with the Python simulator instead, with PC
+# events for -gTRACE_PC=true. Failures and slow runs can be asked for
+# through the environment:
+#
+#     GHDL_STUB_FAIL=tb_branch,tb_uart   testbenches that report a failure
+#     GHDL_STUB_DELAY=0.5                seconds every run takes
+#
+#     python3 tests/run_tests.py --ghdl tests/ghdl_stub.py --trace
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "assembler"))
+
+from anem_sim import simulateFile
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    if not args or args[0] not in ("-a", "-e", "-r"):
+        print("ghdl_stub: unsupported command %s" % " ".join(args))
+        sys.exit(1)
+    if args[0] != "-r":
+        sys.exit(0)
+
+    bench = [arg for arg in args[1:] if not arg.startswith("-")][0]
+    generics = dict(arg[2:].split("=", 1) for arg in args if arg.startswith("-g"))
+    time.sleep(float(os.environ.get("GHDL_STUB_DELAY", "0")))
+
+    if not os.path.exists("contents.txt"):
+        print("%s.vhd:1:1:@0ms:(assertion failure): cannot open contents.txt" % bench)
+        sys.exit(1)
+
+    if bench in os.environ.get("GHDL_STUB_FAIL", "").split(","):
+        print("%s.vhd:1:1:@1us:(report failure): FAIL: stub failure" % bench)
+        sys.exit(1)
+
+    if "TRACE_FILE" in generics:
+        with open(generics["TRACE_FILE"], "w") as traceFile:
+            simulateFile("contents.txt", traceFile, fetches=generics.get("TRACE_PC", "").lower() == "true")
+        print("%s.vhd:1:1:@1us:(report note): trace written to %s" % (bench, generics["TRACE_FILE"]))
+    else:
+        print("%s.vhd:1:1:@1us:(report note): PASS: stub" % bench)
+        print("%s.vhd:1:1:@1us:(report note): === ALL STUB TESTS PASSED ===" % bench)
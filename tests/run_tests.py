@@ -0,0 +1,385 @@
+#coding=utf-8
+##@file run_tests.py
+# @brief parallel GHDL regression runner
+# @since 10/17/2026
+#
+# Analyzes the VHDL sources once, elaborates each testbench once and runs
+# the tests in parallel. program memory opens contents.txt in the current
+# directory, so every run gets its own directory under <work>/runs with a
+# copy of its program. Source lists, test programs and GHDL flags are read
+# from the Makefile; outputs are also copied to where the Makefile puts
+# them (<work>/sim_<test>_output.txt, <work>/test_<test>.trace).
+#
+# A run passes when GHDL exits with 0, no report/assertion of severity
+# error or failure was printed and the testbench printed its "PASSED"
+# banner. Without the banner (stop time reached before the checks) the run
+# is reported as incomplete.
+#
+# Results are kept in a cache (sim_cache.py) keyed by the RTL, testbench,
+# program and stop time. When every test hits, GHDL is not run at all.
+#
+# GHDL=tests/ghdl_stub.py (or --ghdl) runs the flow without the simulator.
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sim_cache import SimCacheMaxAge, SimCacheMaxSize, makeSimCache
+
+##Repository root
+RunRoot = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+##Stop times of the Makefile test rules
+RunStopTimes = { "uart" : "200us" }
+RunStopTime = "50us"
+RunTraceStopTime = "100us"
+
+##Testbench writing traces
+RunTraceBench = "tb_trace"
+
+##Testbench banner of a run that finished its checks
+RunPassed = re.compile(r"=== .*PASSED")
+
+##GHDL report or assertion that fails a run
+RunFailure = re.compile(r"\((report|assertion) (error|failure)\)")
+
+##Read variables of a Makefile
+#
+#Continuation lines are joined and $(NAME) references to earlier variables
+#are expanded; other make syntax is ignored.
+#@return dictionary name -> value
+def readMakefile(fileName):
+
+    with open(fileName) as f:
+        text = f.read().replace("\\\n", " ")
+
+    values = {}
+    for line in text.splitlines():
+        m = re.match(r"^([A-Za-z_][A-Za-z_0-9]*)\s*[?:]?=\s*(.*)$", line)
+        if m != None:
+            values[m.group(1)] = re.sub(r"\$\((\w+)\)", lambda x: values.get(x.group(1), ""), m.group(2)).strip()
+
+    return values
+
+##One simulation
+class RunJob:
+
+    ##@param name test name (basic, uart, ...)
+    #@param bench testbench entity
+    #@param program .contents.txt path
+    #@param stopTime --stop-time value
+    #@param kind "test" or "trace"
+    def __init__(self, name, bench, program, stopTime, kind="test"):
+
+        self.name = name
+        self.bench = bench
+        self.program = program
+        self.stopTime = stopTime
+        self.kind = kind
+        self.status = None
+        self.returncode = None
+        self.seconds = 0.0
+        self.passes = 0
+        self.failures = []
+        self.output = None
+        self.trace = None
+        ##cache key and manifest of a hit
+        self.key = None
+        self.hit = None
+
+    ##Job name, unique in a run
+    def Id(self):
+        return "%s_%s" % (self.kind, self.name)
+
+    def Report(self):
+
+        return { "name" : self.name, "kind" : self.kind, "testbench" : self.bench,
+                 "program" : os.path.relpath(self.program, RunRoot), "stop_time" : self.stopTime,
+                 "status" : self.status, "cached" : self.hit != None, "returncode" : self.returncode, "seconds" : round(self.seconds, 3),
+                 "passes" : self.passes, "failures" : self.failures, "output" : self.output, "trace" : self.trace }
+
+##Regression run
+class Runner:
+
+    ##@param ghdl GHDL command
+    #@param work work directory
+    #@param makefile Makefile the source lists are read from
+    def __init__(self, ghdl="ghdl", work=None, makefile=os.path.join(RunRoot, "Makefile")):
+
+        self.make = readMakefile(makefile)
+        #commands run from other directories
+        self.ghdl = os.path.abspath(ghdl) if os.sep in ghdl else ghdl
+        self.flags = self.make.get("GHDL_FLAGS", "").split()
+        self.work = os.path.abspath(work or os.path.join(RunRoot, self.make.get("WORK_DIR", "work")))
+        ##stage -> seconds
+        self.stages = {}
+
+    ##Run a GHDL command
+    #@return CompletedProcess, output is captured
+    def Ghdl(self, args, cwd, timeout=None):
+
+        return subprocess.run([self.ghdl] + args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              universal_newlines=True, timeout=timeout)
+
+    ##Assemble the test programs (make assemble)
+    #@return True when all programs assembled
+    def Assemble(self, programs):
+
+        start = time.time()
+        sources = [prog for prog in programs if os.path.exists(prog + ".asm")]
+        result = subprocess.run([sys.executable, os.path.join(RunRoot, "assembler", "assembler.py"),
+                                 "--cache", os.path.join(RunRoot, self.make.get("ASM_CACHE", ".asmcache")),
+                                 "-v", "0"] + sources, cwd=RunRoot)
+        self.stages["assemble"] = time.time() - start
+
+        return result.returncode == 0
+
+    ##Analyze all sources once, in Makefile order
+    #@return error output, None on success
+    def Analyze(self):
+
+        start = time.time()
+        os.makedirs(self.work, exist_ok=True)
+        for level in ("SRCS_L0", "SRCS_L1", "SRCS_L2", "TB_SRCS"):
+            for source in self.make.get(level, "").split():
+                result = self.Ghdl(["-a"] + self.flags + ["--workdir=."] + [os.path.join(RunRoot, source)],
+                                   self.work)
+                if result.returncode != 0:
+                    return "%s: %s" % (source, result.stdout.strip())
+        self.stages["analyze"] = time.time() - start
+
+        return None
+
+    ##Elaborate each testbench once
+    #@return dictionary testbench -> error output, for the ones that failed
+    def Elaborate(self, benches):
+
+        start = time.time()
+        errors = {}
+        for bench in benches:
+            result = self.Ghdl(["-e"] + self.flags + ["--workdir=.", bench], self.work)
+            if result.returncode != 0:
+                errors[bench] = result.stdout.strip()
+        self.stages["elaborate"] = time.time() - start
+
+        return errors
+
+    ##Command running an elaborated testbench from another directory
+    def RunCommand(self, bench):
+
+        #gcc/llvm backends leave an executable, mcode elaborates again on -r
+        executable = os.path.join(self.work, bench)
+        if os.path.isfile(executable) and os.access(executable, os.X_OK):
+            return [executable]
+        return [self.ghdl, "-r"] + self.flags + ["--workdir=" + self.work, bench]
+
+    ##Run one job in its own directory
+    #@param job RunJob
+    #@param timeout seconds, None for no limit
+    #@param cache SimCache results are restored from and stored to, or None
+    def Run(self, job, timeout=None, cache=None):
+
+        runDir = os.path.join(self.work, "runs", job.Id())
+        shutil.rmtree(runDir, ignore_errors=True)
+        os.makedirs(runDir)
+        shutil.copyfile(job.program, os.path.join(runDir, "contents.txt"))
+
+        args = ["--stop-time=" + job.stopTime]
+        traceName = "test_%s.trace" % job.name
+        if job.kind == "trace":
+            args.append("-gTRACE_FILE=" + traceName)
+
+        #same places as the Makefile rules
+        outName = "sim_%s_output.txt" % job.name if job.kind == "test" else "trace_%s_output.txt" % job.name
+        tracePath = os.path.join(runDir, traceName) if job.kind == "trace" else None
+
+        start = time.time()
+        if job.hit != None:
+            cache.Restore(job.hit, os.path.join(runDir, outName), tracePath)
+            job.returncode = job.hit["returncode"]
+            with open(os.path.join(runDir, outName)) as f:
+                output = f.read()
+        else:
+            try:
+                result = subprocess.run(self.RunCommand(job.bench) + args, cwd=runDir, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT, universal_newlines=True, timeout=timeout)
+                output = result.stdout
+                job.returncode = result.returncode
+            except subprocess.TimeoutExpired as e:
+                output = (e.stdout or b"").decode() if isinstance(e.stdout, bytes) else (e.stdout or "")
+                output += "\ntimeout after %s s\n" % timeout
+            with open(os.path.join(runDir, outName), "w") as f:
+                f.write(output)
+        job.seconds = time.time() - start
+
+        shutil.copyfile(os.path.join(runDir, outName), os.path.join(self.work, outName))
+        job.output = os.path.relpath(os.path.join(self.work, outName), RunRoot)
+
+        job.passes = sum(1 for line in output.splitlines() if "PASS" in line and "(report note)" in line)
+        job.failures = [line.strip() for line in output.splitlines() if RunFailure.search(line)]
+        if job.returncode == None:
+            job.status = "timeout"
+        elif job.returncode != 0 or job.failures:
+            job.status = "fail"
+        elif job.kind == "trace":
+            job.status = "pass" if os.path.exists(os.path.join(runDir, traceName)) else "fail"
+            if job.status == "pass":
+                shutil.copyfile(os.path.join(runDir, traceName), os.path.join(self.work, traceName))
+                job.trace = os.path.relpath(os.path.join(self.work, traceName), RunRoot)
+        else:
+            job.status = "pass" if RunPassed.search(output) else "incomplete"
+
+        #only clean exits are stored, a crash may not be the design's fault
+        if cache != None and job.hit == None and job.returncode == 0 and \
+           (tracePath == None or os.path.exists(tracePath)):
+            cache.Put(job.key, os.path.join(runDir, outName), job.returncode, tracePath,
+                      { "bench" : job.bench, "program" : os.path.relpath(job.program, RunRoot),
+                        "stop_time" : job.stopTime })
+
+        return job
+
+##Jobs of the test matrix
+#@param make Makefile variables
+#@param names tests to run, all of TEST_PROGS when empty
+#@param traces also write traces with tb_trace
+#@return list of RunJob
+def makeJobs(make, names=(), traces=False):
+
+    jobs = []
+    for prog in make.get("TEST_PROGS", "").split():
+        name = os.path.basename(prog)[len("test_"):]
+        if names and name not in names:
+            continue
+        program = os.path.join(RunRoot, prog + ".contents.txt")
+        jobs.append(RunJob(name, "tb_" + name, program, RunStopTimes.get(name, RunStopTime)))
+        if traces:
+            jobs.append(RunJob(name, RunTraceBench, program, RunTraceStopTime, "trace"))
+
+    return jobs
+
+##Run the regression
+#@param runner Runner
+#@param jobs list of RunJob
+#@param parallel simulations at the same time
+#@param timeout seconds per simulation, None for no limit
+#@param assemble assemble the programs first
+#@param progress function(RunJob) called when a job ends, or None
+#@param cache SimCache, or None to simulate everything
+#@return report dictionary
+def runRegression(runner, jobs, parallel=None, timeout=None, assemble=True, progress=None, cache=None):
+
+    start = time.time()
+    report = { "ghdl" : runner.ghdl, "work" : runner.work, "parallel" : parallel or os.cpu_count() or 1,
+               "stages" : runner.stages, "error" : None, "tests" : [] }
+
+    if assemble and not runner.Assemble(sorted(set(job.program[:-len(".contents.txt")] for job in jobs))):
+        report["error"] = "assembly failed"
+
+    #programs that are missing are not simulated
+    for job in jobs:
+        if not os.path.exists(job.program):
+            job.status = "missing"
+
+    if cache != None and report["error"] == None:
+        for job in jobs:
+            if job.status == None:
+                job.key = cache.Key(job.bench, job.program, job.stopTime, job.kind == "trace")
+                job.hit = cache.Get(job.key)
+    simulate = [job for job in jobs if job.status == None and job.hit == None]
+
+    #nothing to analyze when every result is cached
+    try:
+        error = runner.Analyze() if report["error"] == None and simulate else None
+    except OSError as e:
+        error = "cannot run %s: %s" % (runner.ghdl, e.strerror)
+    if error != None:
+        report["error"] = "analysis failed: " + error
+
+    if report["error"] == None:
+        failed = runner.Elaborate(sorted(set(job.bench for job in simulate)))
+        for job in jobs:
+            if job.bench in failed and job.status == None:
+                job.status = "error"
+                job.failures = failed[job.bench].splitlines()
+
+        def run(job):
+            runner.Run(job, timeout, cache)
+            if progress != None:
+                progress(job)
+            return job
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=report["parallel"]) as pool:
+            list(pool.map(run, [job for job in jobs if job.status == None]))
+        runner.stages["simulate"] = time.time() - start
+        if cache != None:
+            cache.Prune()
+            report["cache"] = { "hits" : cache.hits, "misses" : cache.misses, "stored" : cache.stores }
+
+    report["tests"] = [job.Report() for job in jobs]
+    counts = {}
+    for job in jobs:
+        counts[job.status or "not run"] = counts.get(job.status or "not run", 0) + 1
+    report["summary"] = counts
+    report["seconds"] = round(sum(runner.stages.values()), 3)
+    report["stages"] = dict((name, round(seconds, 3)) for name, seconds in runner.stages.items())
+
+    return report
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="ANEM16 parallel GHDL regression runner")
+    parser.add_argument("tests", nargs="*", help="tests to run (basic, uart, ...), default all of TEST_PROGS")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="simulations at the same time (default CPUs)")
+    parser.add_argument("--ghdl", default=os.environ.get("GHDL", "ghdl"), help="GHDL command (default $GHDL or ghdl)")
+    parser.add_argument("--work", default=None, help="work directory (default WORK_DIR of the Makefile)")
+    parser.add_argument("--trace", action="store_true", help="also write traces with tb_trace")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per simulation")
+    parser.add_argument("--no-assemble", action="store_true", help="use the programs as they are")
+    parser.add_argument("--report", default=None, help="write the JSON report to this file")
+    parser.add_argument("--cache", default=os.path.join(RunRoot, ".simcache"), help="result cache directory")
+    parser.add_argument("--no-cache", action="store_true", help="simulate everything, do not store results")
+    parser.add_argument("--cache-size", type=float, default=SimCacheMaxSize,
+                        help="cache size limit in MB (default %d)" % SimCacheMaxSize)
+    parser.add_argument("--cache-age", type=float, default=SimCacheMaxAge,
+                        help="days a cached result is kept unused (default %d)" % SimCacheMaxAge)
+    args = parser.parse_args()
+
+    runner = Runner(args.ghdl, args.work)
+    cache = None
+    if not args.no_cache:
+        cache = makeSimCache(args.cache, runner.make, RunRoot, runner.ghdl, args.cache_size, args.cache_age)
+    jobs = makeJobs(runner.make, args.tests, args.trace)
+    if not jobs:
+        print("no test matches %s" % " ".join(args.tests))
+        sys.exit(1)
+
+    def progress(job):
+        print("%-10s %-6s %-10s %6.2f s%s" % (job.name, job.kind, job.status, job.seconds,
+                                              " (cached)" if job.hit != None else ""))
+        sys.stdout.flush()
+
+    report = runRegression(runner, jobs, args.jobs, args.timeout, not args.no_assemble, progress, cache)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if report["error"] != None:
+        print(report["error"])
+    for test in report["tests"]:
+        if test["status"] not in ("pass", None):
+            print("%s %s: %s" % (test["kind"], test["name"], test["status"]))
+            for line in test["failures"][:5]:
+                print("    " + line)
+    if cache != None:
+        print(cache.Summary())
+    print("stages: " + ", ".join("%s %.2f s" % item for item in report["stages"].items()))
+    print(", ".join("%d %s" % (count, status) for status, count in sorted(report["summary"].items())))
+    #a program that is missing is reported, it does not fail the run
+    sys.exit(0 if report["error"] == None and set(report["summary"]) <= set(["pass", "missing"]) else 1)
@@ -0,0 +1,299 @@
+#coding=utf-8
+##@file sim_cache.py
+# @brief content-addressed cache of GHDL simulation results
+# @since 10/17/2026
+#
+# A simulation is keyed by the contents of the RTL sources, its testbench,
+# the program image, the stop time, the GHDL flags and version, and whether
+# a trace is written. Entries hold the simulator output, the exit status and
+# the trace, so a run whose key was seen before is restored instead of
+# simulated again. Entries not used for --max-age days are dropped, then the
+# least recently used ones until the cache fits in --max-size MB.
+#
+# run_tests.py uses the cache directly. The Makefile test and trace rules
+# wrap their simulation commands:
+#
+#     sim_cache.py run tb_basic tests/test_basic.contents.txt 50us work/sim_basic_output.txt -- cmd...
+#
+# which prints the cached output on a hit and runs cmd otherwise.
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+##Bump to drop entries written by older versions
+SimCacheVersion = 1
+
+##Default cache size limit in MB
+SimCacheMaxSize = 512
+
+##Default days an entry is kept without being used
+SimCacheMaxAge = 30
+
+##Entry file names
+SimCacheOutput = "output.txt"
+SimCacheTrace = "trace"
+SimCacheManifest = "manifest.json"
+
+##Hash file contents
+#@return hex digest or None if file does not exist
+def hashFile(fileName):
+
+    try:
+        with open(fileName, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+##First line of the GHDL version
+#@return version string, None when GHDL cannot be run
+def ghdlVersion(ghdl):
+
+    try:
+        result = subprocess.run([ghdl, "--version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True)
+    except OSError:
+        return None
+
+    return result.stdout.strip().split("\n")[0]
+
+class SimCache:
+
+    ##@param path cache directory
+    #@param rtl RTL source files, in analysis order
+    #@param benches testbench source files
+    #@param flags GHDL flags
+    #@param ghdl GHDL command, for its version
+    #@param maxSize size limit in MB
+    #@param maxAge days an entry is kept without being used
+    def __init__(self, path, rtl, benches, flags=(), ghdl="ghdl", maxSize=SimCacheMaxSize, maxAge=SimCacheMaxAge):
+
+        self.path = path
+        self.benches = dict((os.path.splitext(os.path.basename(fileName))[0], fileName) for fileName in benches)
+        self.maxSize = maxSize*1024*1024
+        self.maxAge = maxAge*24*3600
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+        #the RTL is hashed once per run
+        h = hashlib.sha256()
+        for fileName in rtl:
+            h.update(("%s %s\n" % (os.path.basename(fileName), hashFile(fileName))).encode())
+        self.base = { "version" : SimCacheVersion, "rtl" : h.hexdigest(), "flags" : list(flags),
+                      "ghdl" : ghdlVersion(ghdl) }
+
+    ##Key of a simulation
+    #@param bench testbench entity
+    #@param program program image (.contents.txt)
+    #@param stopTime --stop-time value
+    #@param trace True when the run writes a trace
+    #@return hex digest
+    def Key(self, bench, program, stopTime, trace=False):
+
+        inputs = dict(self.base)
+        inputs.update({ "bench" : bench, "testbench" : hashFile(self.benches.get(bench, "")),
+                        "program" : hashFile(program), "stop_time" : stopTime, "trace" : trace })
+
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+    def EntryDir(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    ##Look up a simulation
+    #@return manifest dictionary with the entry "dir", None on a miss
+    def Get(self, key):
+
+        entry = self.EntryDir(key)
+        try:
+            with open(os.path.join(entry, SimCacheManifest)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        #the manifest time is the last use
+        os.utime(os.path.join(entry, SimCacheManifest))
+        self.hits += 1
+        manifest["dir"] = entry
+
+        return manifest
+
+    ##Restore the outputs of a hit
+    #@param manifest what Get returned
+    #@param output file the simulator output is copied to
+    #@param trace file the trace is copied to, or None
+    def Restore(self, manifest, output, trace=None):
+
+        shutil.copyfile(os.path.join(manifest["dir"], SimCacheOutput), output)
+        if trace != None and manifest.get("trace"):
+            shutil.copyfile(os.path.join(manifest["dir"], SimCacheTrace), trace)
+
+    ##Store a simulation
+    #@param key what Key returned
+    #@param output file holding the simulator output
+    #@param returncode simulator exit status
+    #@param trace trace file, or None
+    #@param info extra manifest fields
+    def Put(self, key, output, returncode, trace=None, info={}):
+
+        os.makedirs(self.path, exist_ok=True)
+        temp = tempfile.mkdtemp(dir=self.path, prefix=".put-")
+        shutil.copyfile(output, os.path.join(temp, SimCacheOutput))
+        if trace != None:
+            shutil.copyfile(trace, os.path.join(temp, SimCacheTrace))
+
+        manifest = dict(info)
+        manifest.update({ "returncode" : returncode, "trace" : trace != None, "created" : time.time() })
+        with open(os.path.join(temp, SimCacheManifest), "w") as f:
+            json.dump(manifest, f)
+
+        #entries appear complete or not at all, concurrent runs may store the same key
+        entry = self.EntryDir(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        try:
+            os.rename(temp, entry)
+            self.stores += 1
+        except OSError:
+            shutil.rmtree(temp, ignore_errors=True)
+
+    ##@return list of (last use, size in bytes, entry directory)
+    def Entries(self):
+
+        entries = []
+        for prefix in os.listdir(self.path) if os.path.isdir(self.path) else []:
+            prefixDir = os.path.join(self.path, prefix)
+            if prefix.startswith(".") or not os.path.isdir(prefixDir):
+                continue
+            for key in os.listdir(prefixDir):
+                entry = os.path.join(prefixDir, key)
+                try:
+                    used = os.path.getmtime(os.path.join(entry, SimCacheManifest))
+                    size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+                except OSError:
+                    continue
+                entries.append((used, size, entry))
+
+        return entries
+
+    ##Drop old entries, then the least recently used ones over the size limit
+    #@return number of entries dropped
+    def Prune(self):
+
+        entries = sorted(self.Entries())
+        now = time.time()
+        total = sum(size for used, size, entry in entries)
+        dropped = 0
+        for used, size, entry in entries:
+            if now - used <= self.maxAge and total <= self.maxSize:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            dropped += 1
+
+        return dropped
+
+    def Summary(self):
+        return "cache: %d hits, %d misses, %d stored" % (self.hits, self.misses, self.stores)
+
+##Cache for the sources of a Makefile
+#@param path cache directory
+#@param make Makefile variables
+#@param root directory the Makefile paths are relative to
+#@param ghdl GHDL command
+#@return SimCache
+def makeSimCache(path, make, root, ghdl="ghdl", maxSize=SimCacheMaxSize, maxAge=SimCacheMaxAge):
+
+    rtl = [os.path.join(root, fileName) for level in ("SRCS_L0", "SRCS_L1", "SRCS_L2")
+           for fileName in make.get(level, "").split()]
+    benches = [os.path.join(root, fileName) for fileName in make.get("TB_SRCS", "").split()]
+
+    return SimCache(path, rtl, benches, make.get("GHDL_FLAGS", "").split(), ghdl, maxSize, maxAge)
+
+##Run a simulation command unless its result is cached
+#
+#The command output is shown as it is produced and written to the output
+#file, like tee. Runs that exit with 0 are stored.
+#@param cache SimCache
+#@param key what Key returned
+#@param command command line (list)
+#@param output simulator output file
+#@param trace trace file the command writes, or None
+#@param info extra manifest fields
+#@return command exit status, the stored one on a hit
+def runCached(cache, key, command, output, trace=None, info={}):
+
+    manifest = cache.Get(key)
+    if manifest != None:
+        cache.Restore(manifest, output, trace)
+        with open(output) as f:
+            sys.stdout.write(f.read())
+        return manifest["returncode"]
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    with open(output, "w") as f:
+        for line in process.stdout:
+            sys.stdout.write(line)
+            f.write(line)
+    returncode = process.wait()
+
+    if returncode == 0 and (trace == None or os.path.exists(trace)):
+        cache.Put(key, output, returncode, trace, info)
+        cache.Prune()
+
+    return returncode
+
+if __name__ == "__main__":
+
+    from run_tests import RunRoot, readMakefile
+
+    #the simulation command follows --
+    argv = sys.argv[1:]
+    command = []
+    if "--" in argv:
+        command = argv[argv.index("--")+1:]
+        argv = argv[:argv.index("--")]
+
+    parser = argparse.ArgumentParser(description="ANEM16 simulation result cache",
+                                     usage="%(prog)s [options] run bench program stop_time output -- command...\n"
+                                           "       %(prog)s [options] {stats,prune,clear}")
+    parser.add_argument("command", choices=["run", "stats", "prune", "clear"])
+    parser.add_argument("args", nargs="*", help="testbench entity, program image, stop time and output file")
+    parser.add_argument("--trace", default=None, help="trace file the simulation writes")
+    parser.add_argument("--cache", default=os.path.join(RunRoot, ".simcache"), help="cache directory")
+    parser.add_argument("--ghdl", default=os.environ.get("GHDL", "ghdl"), help="GHDL command (default $GHDL or ghdl)")
+    parser.add_argument("--max-size", type=float, default=SimCacheMaxSize,
+                        help="size limit in MB (default %d)" % SimCacheMaxSize)
+    parser.add_argument("--max-age", type=float, default=SimCacheMaxAge,
+                        help="days an entry is kept unused (default %d)" % SimCacheMaxAge)
+    args = parser.parse_args(argv)
+
+    if args.command == "run" and (len(args.args) != 4 or not command):
+        parser.error("run needs bench, program, stop time, output and a command after --")
+
+    if args.command == "clear":
+        shutil.rmtree(args.cache, ignore_errors=True)
+        sys.exit(0)
+
+    cache = makeSimCache(args.cache, readMakefile(os.path.join(RunRoot, "Makefile")), RunRoot, args.ghdl,
+                         args.max_size, args.max_age)
+
+    if args.command == "stats":
+        entries = cache.Entries()
+        print("%s: %d entries, %.1f MB" % (args.cache, len(entries), sum(e[1] for e in entries)/1024.0/1024.0))
+    elif args.command == "prune":
+        print("%d entries dropped" % cache.Prune())
+    else:
+        bench, program, stopTime, output = args.args
+        key = cache.Key(bench, program, stopTime, args.trace != None)
+        returncode = runCached(cache, key, command, output, args.trace,
+                               { "bench" : bench, "program" : program, "stop_time" : stopTime })
+        if cache.hits:
+            print("=== %s: cached result (%s) ===" % (bench, key[:12]))
+        sys.exit(returncode)
@@ -7,6 +7,7 @@
 --!
 --! Trace file is written to "trace_output.txt" in the working directory.
 --! Use GHDL generic override to change: -gTRACE_FILE=mytest.trace
+--! -gTRACE_PC=true also writes the fetch address of every cycle (PC events).
 --!
 --! Note: RF/SR lines require test programs to SW register values to memory
 --! before HALT. The MW trace captures these as regular memory writes.
@@ -19,6 +20,7 @@ use std.textio.all;
 entity tb_trace is
   generic (
     TRACE_FILE : string := "trace_output.txt";
+    TRACE_PC   : boolean := false;
     NUM_CYCLES : integer := 4096;
     HALT_INST  : std_logic_vector(15 downto 0) := x"FFFF"
   );
@@ -187,6 +189,13 @@ begin
       wait until rising_edge(ck);
       exit when sim_done;
 
+      -- Optional fetch address, stalls repeat it
+      if TRACE_PC then
+        write(l, string'("PC "));
+        write(l, to_hex4(inst_addr));
+        writeline(trace_fd, l);
+      end if;
+
       if mem_en = '1' and mem_w = '1' then
         -- Only trace data memory writes, not MAC peripheral
         if unsigned(mem_addr) < MAC_ADDR_START then
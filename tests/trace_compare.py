@@ -0,0 +1,379 @@
+#coding=utf-8
+##@file trace_compare.py
+# @brief streaming comparator for ANEM16 traces
+# @since 10/17/2026
+#
+# Compares traces written in the format of TRACE_FORMAT.md, as text or in the
+# binary encoding of assembler/anem_trace.py, one event at a time, so memory
+# use does not depend on trace length. MW events must match in order,
+# RF/SR values must match in any order, END counts must match and MR events
+# are compared in order only with --mr. The first divergence is reported with
+# the events around it and, when the program is given, the address of the
+# instruction that makes the write according to the Python simulator.
+
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "assembler"))
+from anem_trace import BinKinds, TraceReader, commonPrefix, formatEvent, isBinaryTrace, makeEvent
+
+##Ordered event kinds and their field count
+TraceOrdered = { "MW" : 3, "MR" : 3 }
+
+##Default events of context before and after a divergence
+TraceContext = 3
+
+##Register dump and END events closing a trace
+TraceTail = 19
+
+class TraceFormatError(Exception):
+    pass
+
+##One side of a comparison
+class TraceSide:
+
+    ##@param fileName trace file
+    #@param context events to keep before a divergence
+    def __init__(self, fileName, context=TraceContext):
+
+        self.fileName = fileName
+        self.context = context
+        ##("RF", "0") -> "0000" for RF and SR events
+        self.regs = {}
+        self.end = None
+        self.binary = isBinaryTrace(fileName)
+        self.reader = TraceReader(fileName) if self.binary else None
+        ##first event read from a binary trace, the ones before are known to match
+        self.first = 0
+        ##position unit in messages
+        self.unit = "line"
+        self.counts = dict((kind, 0) for kind in TraceOrdered)
+
+    ##Stream the ordered events of one kind
+    #
+    #RF, SR and END are collected on the MW pass. Unknown event kinds are
+    #skipped so newer traces can still be compared.
+    #@param kind "MW" or "MR"
+    #@param raw yield binary records as (code, sub, a, b) instead of text fields
+    #@return generator of (line number, fields)
+    def Events(self, kind, raw=False):
+
+        if self.binary:
+            yield from self.BinaryEvents(kind, raw)
+            return
+
+        collect = kind == "MW"
+        with open(self.fileName) as f:
+            for lineno, line in enumerate(f, 1):
+                fields = line.split()
+                if not fields or fields[0][0] == '#':
+                    continue
+
+                name = fields[0]
+                if name == kind:
+                    if len(fields) != TraceOrdered[kind]:
+                        raise TraceFormatError("%s:%d: malformed %s event" % (self.fileName, lineno, kind))
+                    self.counts[kind] += 1
+                    yield (lineno, fields)
+                elif not collect:
+                    continue
+                elif name == "RF" or name == "SR":
+                    if len(fields) != 3:
+                        raise TraceFormatError("%s:%d: malformed %s event" % (self.fileName, lineno, name))
+                    self.regs[(name, fields[1].upper() if name == "SR" else str(int(fields[1])))] = fields[2].lower()
+                elif name == "END":
+                    if len(fields) != 2 or not fields[1].isdigit():
+                        raise TraceFormatError("%s:%d: malformed END event" % (self.fileName, lineno))
+                    self.end = int(fields[1])
+
+    ##Stream the ordered events of one kind from a binary trace
+    #
+    #Positions are event numbers instead of line numbers.
+    def BinaryEvents(self, kind, raw):
+
+        self.unit = "event"
+        collect = kind == "MW"
+        code = BinKinds[kind]
+        self.counts[kind] = self.Before(kind)
+        for n, record in enumerate(self.reader.Records(self.first), self.first):
+            if record[0] == code:
+                self.counts[kind] += 1
+                yield (n, record if raw else [kind, "%04x" % record[2], "%04x" % record[3]])
+            elif collect:
+                name, a, b = makeEvent(*record)
+                if name == "RF" or name == "SR":
+                    self.regs[(name, str(a))] = "%04x" % b
+                elif name == "END":
+                    self.end = a
+
+    ##Events of one kind skipped by starting at self.first
+    def Before(self, kind):
+
+        if not self.first:
+            return 0
+        return self.reader.index[self.first // self.reader.indexEvery][1 if kind == "MW" else 2]
+
+    def Close(self):
+        if self.reader != None:
+            self.reader.Close()
+
+##Result of comparing one pair
+class TraceResult:
+
+    def __init__(self, left, right):
+
+        self.left = left
+        self.right = right
+        self.ok = True
+        ##events compared per kind
+        self.events = {}
+        ##explanation lines, divergence first
+        self.messages = []
+        ##notes that do not make the comparison fail
+        self.notes = []
+
+    def Fail(self, message):
+        self.ok = False
+        self.messages.append(message)
+
+    ##Printable report
+    def Report(self):
+
+        name = os.path.basename(self.left)
+        counts = ", ".join("%d %s" % (n, kind) for kind, n in self.events.items())
+        out = ["  %s %s: %s" % ("PASS" if self.ok else "FAIL", name,
+                               "traces match (%s)" % counts if self.ok else "traces differ")]
+        for line in self.messages + self.notes:
+            out.append("    " + line)
+
+        return "\n".join(out)
+
+def eventText(event):
+
+    if event == None:
+        return "<end of trace>"
+    if isinstance(event[1], tuple):
+        return formatEvent(makeEvent(*event[1]))
+    return " ".join(event[1])
+
+def sameEvent(a, b):
+
+    if a == None or b == None:
+        return False
+    if a[1] == b[1]:
+        return True
+    #binary records only match exactly
+    return isinstance(a[1], list) and [x.lower() for x in a[1]] == [x.lower() for x in b[1]]
+
+##Compare the ordered events of one kind
+#@param result TraceResult to fill in
+#@param left TraceSide
+#@param right TraceSide
+#@param kind "MW" or "MR"
+#@param program program file used to locate the instruction, or None
+#@return False at a divergence
+def compareOrdered(result, left, right, kind, program=None):
+
+    context = left.context
+    before = deque(maxlen=context)
+    raw = left.binary and right.binary
+    a = left.Events(kind, raw)
+    b = right.Events(kind, raw)
+    index = left.Before(kind)
+    while True:
+        ea = next(a, None)
+        eb = next(b, None)
+        if ea == None and eb == None:
+            result.events[kind] = index
+            return True
+        if not sameEvent(ea, eb):
+            break
+        before.append((ea, eb))
+        index += 1
+
+    result.events[kind] = index
+    result.Fail("first difference at %s event %d (%s %s %s, %s %s %s)" %
+                (kind, index, os.path.basename(left.fileName), left.unit, ea[0] if ea != None else "-",
+                 os.path.basename(right.fileName), right.unit, eb[0] if eb != None else "-"))
+
+    after = []
+    for n in range(context):
+        xa = next(a, None)
+        xb = next(b, None)
+        if xa == None and xb == None:
+            break
+        after.append((xa, xb))
+
+    width = max([len(eventText(x)) for x, y in list(before) + [(ea, eb)] + after] + [14])
+    result.messages.append("%-*s   %s" % (width + 2, os.path.basename(left.fileName),
+                                         os.path.basename(right.fileName)))
+    for x, y in before:
+        result.messages.append("  %-*s   %s" % (width, eventText(x), eventText(y)))
+    result.messages.append("> %-*s   %s" % (width, eventText(ea), eventText(eb)))
+    for x, y in after:
+        result.messages.append("  %-*s   %s" % (width, eventText(x), eventText(y)))
+
+    if program != None:
+        addr = locateAccess(program, kind, index)
+        if addr != None:
+            result.messages.append("%s %d is made by the instruction at 0x%04x (anem_sim, %s)" %
+                                   (kind, index, addr, os.path.basename(program)))
+
+    return False
+
+##Skip the index blocks two binary traces have in common
+#
+#Reading restarts one block before the first differing one, for context, and
+#no later than the block holding the register dump.
+#@param left TraceSide
+#@param right TraceSide
+def skipPrefix(left, right):
+
+    if not (left.binary and right.binary):
+        return
+
+    a = left.reader
+    b = right.reader
+    every = a.indexEvery
+    block = commonPrefix(a, b) // every
+    tail = max(min(a.count, b.count) - TraceTail, 0) // every
+    left.first = right.first = min(max(block - 1, 0), tail)*every
+
+##Compare a pair of traces
+#@param left reference trace
+#@param right trace under test
+#@param memReads also compare MR events
+#@param context events of context around a divergence
+#@param program program file, used to report instruction addresses
+#@return TraceResult
+def compareTraces(left, right, memReads=False, context=TraceContext, program=None):
+
+    result = TraceResult(left, right)
+    sides = []
+
+    try:
+        sides = [TraceSide(left, context), TraceSide(right, context)]
+        skipPrefix(*sides)
+        if not compareOrdered(result, sides[0], sides[1], "MW", program):
+            return result
+        if memReads and not compareOrdered(result, sides[0], sides[1], "MR", program):
+            return result
+    except (TraceFormatError, IOError, ValueError) as e:
+        result.Fail(str(e))
+        return result
+    finally:
+        for side in sides:
+            side.Close()
+
+    a, b = sides
+    for side in sides:
+        if side.end == None:
+            result.Fail("%s: no END event, trace is incomplete" % side.fileName)
+        elif side.end != side.counts["MW"]:
+            result.Fail("%s: END %d but %d MW events" % (side.fileName, side.end, side.counts["MW"]))
+    if a.end != None and b.end != None and a.end != b.end:
+        result.Fail("END count differs: %d, %d" % (a.end, b.end))
+
+    #GHDL traces do not dump registers yet
+    if a.regs and b.regs:
+        for key in sorted(set(a.regs) | set(b.regs), key=lambda k: (k[0], k[1].zfill(2))):
+            if a.regs.get(key) != b.regs.get(key):
+                result.Fail("%s %s differs: %s, %s" % (key[0], key[1], a.regs.get(key, "missing"),
+                                                      b.regs.get(key, "missing")))
+        result.events["RF/SR"] = len(a.regs)
+    elif a.regs or b.regs:
+        result.notes.append("RF/SR not compared, %s has no register dump" %
+                            os.path.basename(left if not a.regs else right))
+
+    return result
+
+##Address of the instruction making the n-th memory access of a program
+#@param program .contents.txt or .img file
+#@param kind "MW" or "MR"
+#@param index access number, from 0
+#@return address or None
+def locateAccess(program, kind, index):
+
+    from anem_sim import Simulator, SimStop
+
+    class Locator:
+        def __init__(self):
+            self.memReads = kind == "MR"
+            self.addr = None
+            self.count = 0
+            self.found = None
+
+        def Access(self, isKind):
+            if isKind:
+                if self.count == index:
+                    self.found = self.addr
+                    raise SimStop("found")
+                self.count += 1
+
+        def MemWrite(self, addr, data):
+            self.Access(kind == "MW")
+
+        def MemRead(self, addr, data):
+            self.Access(kind == "MR")
+
+    locator = Locator()
+    sim = Simulator(locator)
+    try:
+        sim.Load(program)
+    except IOError:
+        return None
+
+    def wrap(op, addr):
+        def located():
+            locator.addr = addr
+            return op()
+        return located
+
+    for addr in sim.rom:
+        sim.code[addr] = wrap(sim.code[addr], addr)
+        sim.slotCode[addr] = wrap(sim.slotCode[addr], addr)
+    sim.Run()
+
+    return locator.found
+
+def comparePair(job):
+    return compareTraces(*job)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compare ANEM16 traces (tests/TRACE_FORMAT.md)")
+    parser.add_argument("traces", nargs="+", help="reference and tested trace, repeat for more pairs")
+    parser.add_argument("-P", "--program", action="append", default=[],
+                        help="program of each pair (.contents.txt), to locate diverging instructions")
+    parser.add_argument("--mr", action="store_true", help="also compare MR events")
+    parser.add_argument("-C", "--context", type=int, default=TraceContext, help="events of context")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="pairs compared in parallel")
+    args = parser.parse_args()
+
+    if len(args.traces) % 2:
+        parser.error("traces must be given in pairs")
+    pairs = list(zip(args.traces[0::2], args.traces[1::2]))
+    if args.program and len(args.program) != len(pairs):
+        parser.error("give one program per trace pair")
+    programs = args.program or [None]*len(pairs)
+
+    jobs = [(left, right, args.mr, args.context, program)
+            for (left, right), program in zip(pairs, programs)]
+    if args.jobs > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(args.jobs) as pool:
+            results = list(pool.map(comparePair, jobs))
+    else:
+        results = [comparePair(job) for job in jobs]
+
+    failed = 0
+    for result in results:
+        print(result.Report())
+        if not result.ok:
+            failed += 1
+    if len(results) > 1:
+        print("%d of %d trace pair(s) differ" % (failed, len(results)))
+
+    sys.exit(1 if failed else 0)